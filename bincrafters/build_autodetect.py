@@ -1,10 +1,20 @@
 import sys
 import subprocess
-import tempfile
 import os
 
 from bincrafters.build_shared import printer, get_os
 from bincrafters import build_shared
+from bincrafters import build_report
+from bincrafters import build_scheduler
+from bincrafters import compiler_cache
+from bincrafters import conan_home
+from bincrafters import docker_container
+from bincrafters import download_cache
+from bincrafters import lockfiles
+from bincrafters import prefetch
+from bincrafters import remote_ranking
+from bincrafters import tracing
+from bincrafters import upload
 from bincrafters.autodetect import *
 
 
@@ -35,6 +45,7 @@ def _get_default_builder(shared_option_name=None,
     return builder
 
 
+@tracing.traced
 def _get_builder():
     ###
     # Output collected recipe information in the builds logs
@@ -90,35 +101,60 @@ def _get_builder():
     return builder
 
 
+@tracing.traced
 def run_autodetect():
+    ###
+    # Execute a single build on behalf of the build scheduler
+    # The environment was already prepared by the parent process
+    ###
+    if build_scheduler.is_worker():
+        builder = _get_builder()
+        if lockfiles.get_lockfile() and lockfiles.get_build_lockfile():
+            with tracing.span("create lockfile"):
+                lockfiles.set_builder_lockfile(builder, conan_home.get_conan_home(), get_recipe_path())
+        with tracing.span("builder.run"):
+            builder.run()
+        if remote_ranking.is_enabled():
+            remote_ranking.record_builder_downloads(builder)
+        return
+
     ###
     # Enabling Conan download cache
     ###
     printer.print_message("Enabling Conan download cache ...")
 
-    tmpdir = os.path.join(tempfile.gettempdir(), "conan")
-
-    os.makedirs(tmpdir, mode=0o777)
-    # In some cases Python may ignore the mode of makedirs, do it again explicitly with chmod
-    os.chmod(tmpdir, mode=0o777)
+    tmpdir = download_cache.get_download_cache()
+    download_cache.create_download_cache(tmpdir)
+    with tracing.span("clean download cache"):
+        download_cache.clean_download_cache(tmpdir)
 
+    # The download cache is mounted as /tmp/conan into the docker containers
     setup_sh = os.path.join(tmpdir, "setup.sh")
-    with open(setup_sh, "w") as f:
-        f.write("""
+    # Concurrent jobs may execute the script while it gets written
+    download_cache.write_file(setup_sh, """
 #!/bin/sh
-conan config set storage.download_cache='{0}'
+conan config set storage.download_cache='/tmp/conan'
 conan config set general.revisions_enabled=1
-""".format(tmpdir))
-    os.chmod(setup_sh, mode=0o777)
+""", mode=0o777)
 
-    os.system('conan config set storage.download_cache="{}"'.format(tmpdir))
-    os.system('conan config set general.revisions_enabled=1')
-    os.environ["CONAN_DOCKER_ENTRY_SCRIPT"] = "cat '{0}' && '{0}'".format(setup_sh)
+    with tracing.span("conan config set"):
+        conan_home.set_config_values(conan_home.get_default_config_values())
+    os.environ["CONAN_DOCKER_ENTRY_SCRIPT"] = "cat '/tmp/conan/setup.sh' && '/tmp/conan/setup.sh'"
     conan_docker_run_options = os.environ.get('CONAN_DOCKER_RUN_OPTIONS','')
     conan_docker_run_options += " -v '{}':'/tmp/conan'".format(tmpdir)
     os.environ['CONAN_DOCKER_RUN_OPTIONS'] = conan_docker_run_options
     os.environ['CONAN_PIP_USE_SUDO'] = "False"
 
+    ###
+    # Enabling ccache
+    ###
+    ccache_dir = None
+    if compiler_cache.is_enabled():
+        docker_image = compiler_cache.get_docker_image()
+        ccache_dir = compiler_cache.setup_ccache(docker_image)
+        if ccache_dir:
+            ccache_statistics = compiler_cache.get_statistics(ccache_dir, docker_image)
+
     ###
     # Enabling installing system_requirements
     ###
@@ -144,12 +180,40 @@ conan config set general.revisions_enabled=1
         if "BPT_CWD" in os.environ:
             del os.environ["BPT_CWD"]
 
-        subprocess.run("python build.py", cwd=new_wd, shell=True, check=True)
+        with tracing.command_span("python build.py"):
+            subprocess.run("python build.py", cwd=new_wd, shell=True, check=True)
         return
 
     ###
     # Start the build
     ###
     builder = _get_builder()
-    builder.run()
+    if prefetch.is_enabled():
+        with tracing.span("prefetch"):
+            prefetch.prefetch_builder_dependencies(builder, conan_home.get_conan_home(), get_recipe_path())
+    try:
+        if build_scheduler.is_scheduler_enabled():
+            build_scheduler.run_builds(builder)
+        else:
+            # Native builds upload after all builds are done, in parallel; CPT uploads from inside of
+            # the docker containers, their packages are gone afterwards
+            deferred_uploader = upload.DeferredUploader()
+            if not builder.use_docker:
+                builder.uploader = deferred_uploader
+            # The report wraps the runner of the reused containers, so it's entered last
+            with docker_container.reuse_containers(builder), build_report.collect_builder_report(builder) as report:
+                with tracing.span("builder.run"):
+                    builder.run()
+                if remote_ranking.is_enabled():
+                    remote_ranking.record_builder_downloads(builder)
+                with tracing.span("upload"):
+                    statistics = upload.upload_builder_artifacts(builder, conan_home.get_conan_home(),
+                                                                 deferred_uploader.artifacts)
+                if report is not None and statistics:
+                    statistics["builds"] = list(range(1, len(builder.builds_in_current_page) + 1))
+                    report["uploads"].append(statistics)
+    finally:
+        if ccache_dir:
+            printer.print_message(compiler_cache.format_statistics(
+                ccache_statistics, compiler_cache.get_statistics(ccache_dir, docker_image)))
 
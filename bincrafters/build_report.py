@@ -0,0 +1,211 @@
+import json
+import os
+import re
+import sys
+import time
+from contextlib import contextmanager
+
+import cpt.packager
+
+from bincrafters.build_shared import printer
+
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+
+
+# Package lines of the "Packages" section Conan prints for every dependency graph
+# e.g. "    zlib/1.2.11:6af9cc7cb931c5ad942174fd7838eb655717c709 - Cache"
+_PACKAGE_STATUS_PATTERN = re.compile(r"^\s+(\S+/\S+):([0-9a-f]{40}) - (Cache|Download|Build|Missing|Skip)\s*$")
+
+
+def get_report_path():
+    return os.getenv("BPT_BUILD_REPORT", None) or None
+
+
+def get_dependency_statistics(log: str, reference: str = None) -> dict:
+    """ Count how the dependencies of a build were provided, based on the Conan output
+
+    :param log: Output of the build
+    :param reference: Reference of the package itself, which is not counted as a dependency
+    :return: Dict with the number of dependencies which were taken from the cache, downloaded or built
+    """
+    statuses = {}
+    for line in log.splitlines():
+        match = _PACKAGE_STATUS_PATTERN.match(line)
+        if match is None:
+            continue
+        package_reference = match.group(1)
+        if reference and package_reference.split("#")[0].rstrip("@") == reference.rstrip("@"):
+            continue
+        # The graph is printed again for the test_package, only the first status counts
+        statuses.setdefault((package_reference, match.group(2)), match.group(3))
+
+    result = {"cache": 0, "download": 0, "build": 0}
+    for status in statuses.values():
+        if status == "Cache":
+            result["cache"] += 1
+        elif status == "Download":
+            result["download"] += 1
+        elif status == "Build":
+            result["build"] += 1
+    return result
+
+
+def get_installed_statistics(results: dict) -> dict:
+    """ Count how the dependencies of a build were provided, based on the result of the Conan create command
+
+    :param results: Result of ConanAPIV1.create, e.g. the results of a CPT runner
+    :return: Dict with the number of dependencies which were taken from the cache, downloaded or built
+    """
+    result = {"cache": 0, "download": 0, "build": 0}
+    for installed in results.get("installed", []):
+        if not installed["recipe"].get("dependency"):
+            continue
+        for package in installed.get("packages", []):
+            if package.get("built"):
+                result["build"] += 1
+            elif package.get("downloaded"):
+                result["download"] += 1
+            else:
+                result["cache"] += 1
+    return result
+
+
+def get_build_description(settings: dict, options: dict) -> str:
+    values = [settings.get(name) for name in ["compiler", "compiler.version", "arch", "build_type",
+                                              "compiler.cppstd", "compiler.libcxx", "compiler.runtime"]]
+    values += ["{}={}".format(name.split(":")[-1], value) for name, value in sorted(options.items())]
+    return " ".join(str(value) for value in values if value)
+
+
+def _format_value(value, unit: str = "", precision: int = 1) -> str:
+    if value is None:
+        return "-"
+    return "{:.{}f}{}".format(value, precision, unit)
+
+
+def get_result(build: dict) -> str:
+    if build.get("skipped"):
+        return "SKIPPED"
+    if build.get("cancelled"):
+        return "CANCELLED"
+    return "OK" if build["returncode"] == 0 else "FAILED"
+
+
+def format_summary_table(builds: list) -> str:
+    # The build folder location is only of interest if builds ran in memory
+    with_storage = any("storage" in build for build in builds)
+    header = ["#", "Result", "Wall", "CPU", "Peak RSS", "Deps C/D/B"] + (["Storage"] if with_storage else []) \
+        + ["Configuration"]
+    rows = []
+    for build in builds:
+        dependencies = build.get("dependencies", {})
+        rows.append([
+            str(build["number"]),
+            get_result(build),
+            _format_value(build.get("wall_time"), "s"),
+            _format_value(build.get("cpu_time"), "s"),
+            _format_value(build.get("max_rss"), "MiB", 0),
+            "{}/{}/{}".format(dependencies.get("cache", 0), dependencies.get("download", 0),
+                              dependencies.get("build", 0)) if "dependencies" in build else "-",
+        ] + ([build.get("storage", "-" if build.get("skipped") else "disk")] if with_storage else []) + [
+            build.get("description", ""),
+        ])
+
+    widths = [max(len(row[column]) for row in [header] + rows) for column in range(len(header))]
+    lines = []
+    for row in [header] + rows:
+        lines.append("  ".join(value.ljust(width) for value, width in zip(row, widths)).rstrip())
+    return "\n".join(lines)
+
+
+def write_report(path: str, report: dict):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+def _get_cpu_time():
+    """ CPU time of this process and its waited-for children """
+    if resource is None:
+        return None
+    return sum(usage.ru_utime + usage.ru_stime
+               for usage in [resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)])
+
+
+def _get_children_max_rss():
+    """ Peak RSS in MiB of the largest waited-for child process so far, e.g. a compiler """
+    if resource is None:
+        return None
+    # ru_maxrss is reported in KiB on Linux, but in bytes on macOS
+    rss_divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / rss_divisor
+
+
+def _get_measured_runner_class(runner_class, results: list, measure_process: bool):
+    class MeasuredRunner(runner_class):
+        """ Records the wall and CPU time, the peak RSS and the dependency statistics of each build CPT runs """
+
+        def run(self, *args, **kwargs):
+            start = time.perf_counter()
+            cpu_start = _get_cpu_time() if measure_process else None
+            rss_start = _get_children_max_rss() if measure_process else None
+            result = {"returncode": 1, "dependencies": {}}
+            try:
+                value = super().run(*args, **kwargs)
+                result["returncode"] = 0
+                return value
+            finally:
+                result["wall_time"] = time.perf_counter() - start
+                result["cpu_time"] = _get_cpu_time() - cpu_start if cpu_start is not None else None
+                # The peak only belongs to this build if it exceeds the one of the earlier builds
+                rss_end = _get_children_max_rss() if rss_start is not None else None
+                result["max_rss"] = rss_end if rss_end is not None and rss_end > rss_start else None
+                if getattr(self, "results", None):
+                    result["dependencies"] = get_installed_statistics(self.results)
+                results.append(result)
+
+    return MeasuredRunner
+
+
+@contextmanager
+def collect_builder_report(builder):
+    """ Report the builds of builder.run(), which executes them one after another in this process
+
+    Yields the report, or None if BPT_BUILD_REPORT is not set. The report gets printed and written on exit,
+    also if a build failed. The dependency statistics of docker builds are only available from the build scheduler.
+    """
+    report_path = get_report_path()
+    if report_path is None:
+        yield None
+        return
+
+    results = []
+    runner_classes = cpt.packager.CreateRunner, cpt.packager.DockerCreateRunner
+    # Docker builds run in the container, not in a child process, and their Conan results stay in there
+    cpt.packager.CreateRunner = _get_measured_runner_class(runner_classes[0], results, measure_process=True)
+    cpt.packager.DockerCreateRunner = _get_measured_runner_class(runner_classes[1], results, measure_process=False)
+    report = {"jobs": 1, "cpus_per_build": None, "failures": 0, "builds": [], "uploads": []}
+    start = time.perf_counter()
+    try:
+        yield report
+    finally:
+        cpt.packager.CreateRunner, cpt.packager.DockerCreateRunner = runner_classes
+        # CPT stops at the first failed build, the remaining ones never ran
+        for number, build in enumerate(getattr(builder, "builds_in_current_page", []), start=1):
+            result = results[number - 1] if number <= len(results) else {"returncode": None, "skipped": True}
+            result.update({"number": number, "settings": build.settings, "options": build.options,
+                           "description": get_build_description(build.settings, build.options)})
+            report["builds"].append(result)
+        report["failures"] = len([build for build in report["builds"] if get_result(build) == "FAILED"])
+        report["wall_time"] = time.perf_counter() - start
+
+        printer.print_message("Build summary")
+        print(format_summary_table(report["builds"]))
+        sys.stdout.flush()
+        write_report(report_path, report)
+        printer.print_message("Build report written to {}".format(report_path))
@@ -0,0 +1,505 @@
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from conans.paths import get_conan_user_home
+
+from bincrafters.build_shared import printer
+from bincrafters import build_report
+from bincrafters import build_tmpfs
+from bincrafters import lockfiles
+from bincrafters import package_artifacts
+from bincrafters import tracing
+from bincrafters import upload
+
+
+# Set for the child processes which execute a single build of the builder
+BPT_BUILD_WORKER = "BPT_BUILD_WORKER"
+
+# Files and folders of a Conan home which are copied into the home of each build slot
+_CONAN_HOME_SEED = ["conan.conf", "settings.yml", "remotes.json", "global.conf", "profiles", "hooks"]
+
+
+def _flush_output():
+    sys.stderr.flush()
+    sys.stdout.flush()
+
+
+def is_worker() -> bool:
+    return os.getenv(BPT_BUILD_WORKER) is not None
+
+
+def get_parallel_builds() -> int:
+    value = os.getenv("BPT_PARALLEL_BUILDS", "1").strip().lower()
+    if value == "auto":
+        return os.cpu_count() or 1
+    return max(1, int(value))
+
+
+def get_max_failures():
+    """ Number of failed builds after which the remaining builds are cancelled, None to run all builds """
+    value = os.getenv("BPT_FAIL_FAST", "off").strip().lower()
+    if value in ("", "off", "false", "no", "n", "0"):
+        return None
+    if value in ("first", "true", "yes", "y"):
+        return 1
+    return max(1, int(value))
+
+
+def is_scheduler_enabled() -> bool:
+    # Lockfiles are specific to a configuration, so each build has to run on its own;
+    # package artifacts need the Conan storage of docker builds on the host;
+    # without the scheduler CPT always stops at the first failed build, only a later stop needs the scheduler
+    fail_fast_policy = get_max_failures() not in (None, 1)
+    return get_parallel_builds() > 1 or build_tmpfs.is_enabled() or fail_fast_policy \
+        or lockfiles.get_lockfile() is not None or package_artifacts.get_artifact_dir() is not None
+
+
+def get_available_memory():
+    """ Available physical memory in MiB
+
+    :return: Memory in MiB or None if it can't be determined on this platform
+    """
+    try:
+        with open("/proc/meminfo", "r") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") // (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def get_job_layout(build_count: int, requested_jobs: int, cpu_count: int, memory: int = None,
+                   memory_per_build: int = 2048, min_cpus_per_build: int = 1) -> (int, int):
+    """ Calculate how many builds can run concurrently and how many cores each of them gets
+
+    :param build_count: Number of builds which have to be executed
+    :param requested_jobs: Upper limit of concurrent builds
+    :param cpu_count: Number of cores which can be divided between the builds
+    :param memory: Available memory in MiB, None if unknown
+    :param memory_per_build: Memory in MiB reserved for each concurrent build
+    :param min_cpus_per_build: Minimal number of cores each concurrent build should get
+    :return: Tuple of (concurrent builds, cores per build)
+    """
+    jobs = min(requested_jobs, build_count, cpu_count // max(1, min_cpus_per_build))
+    if memory is not None:
+        jobs = min(jobs, memory // max(1, memory_per_build))
+    jobs = max(1, jobs)
+    return jobs, max(1, cpu_count // jobs)
+
+
+def get_page_indices(builder) -> list:
+    # Respect CPT's own paging (CONAN_TOTAL_PAGES / CONAN_CURRENT_PAGE) of the parent process
+    curpage = int(builder.curpage)
+    total_pages = int(builder.total_pages)
+    return [index for index in range(len(builder.items)) if (index % total_pages) + 1 == curpage]
+
+
+def _seed_conan_home(conan_home: str):
+    source = os.path.join(get_conan_user_home(), ".conan")
+    target = os.path.join(conan_home, ".conan")
+    os.makedirs(target, exist_ok=True)
+    for name in _CONAN_HOME_SEED:
+        path = os.path.join(source, name)
+        if os.path.isdir(path):
+            shutil.copytree(path, os.path.join(target, name), dirs_exist_ok=True)
+        elif os.path.isfile(path):
+            shutil.copy2(path, os.path.join(target, name))
+
+
+def _prepare_slot(slot_dir: str, use_docker: bool) -> dict:
+    slot = {"dir": slot_dir, "home": os.path.join(slot_dir, "home"), "builds": []}
+    _seed_conan_home(slot["home"])
+    slot["storage"] = os.path.join(slot["home"], ".conan", "data")
+    os.makedirs(slot["storage"], exist_ok=True)
+    subprocess.run('conan config set storage.path="{}"'.format(slot["storage"]), shell=True, check=True,
+                   env=dict(os.environ, CONAN_USER_HOME=slot["home"]))
+
+    if use_docker:
+        # Docker containers are removed after each build; keep their Conan storage on the host,
+        # at the same path, so the packages can be uploaded after all builds are done
+        os.chmod(slot["storage"], mode=0o777)
+        entry_script = "umask 0000 && conan config set storage.path='{}'".format(slot["storage"])
+        if os.getenv("CONAN_DOCKER_ENTRY_SCRIPT"):
+            entry_script += " && {}".format(os.getenv("CONAN_DOCKER_ENTRY_SCRIPT"))
+        run_options = "{} -v '{}':'{}'".format(os.getenv("CONAN_DOCKER_RUN_OPTIONS", ""),
+                                               slot["storage"], slot["storage"])
+        if lockfiles.get_lockfile():
+            os.makedirs(os.path.join(slot_dir, "lockfiles"), exist_ok=True)
+            run_options += " -v '{0}':'{0}'".format(os.path.join(slot_dir, "lockfiles"))
+        slot["env"] = {
+            "CONAN_DOCKER_ENTRY_SCRIPT": entry_script,
+            "CONAN_DOCKER_RUN_OPTIONS": run_options,
+        }
+    else:
+        slot["env"] = {}
+
+    return slot
+
+
+def _get_build_env(slot: dict, index: int, build_count: int, cpu_count: int, skip_docker_update: bool) -> dict:
+    # Without credentials CPT skips the upload, the packages get uploaded by the scheduler afterwards
+    env = {key: value for key, value in os.environ.items()
+           if not key.startswith("CONAN_PASSWORD") and not key.startswith("CONAN_LOGIN_USERNAME_")}
+    env.update(slot["env"])
+    env[BPT_BUILD_WORKER] = str(index)
+    env["CONAN_USER_HOME"] = slot["home"]
+    env["CONAN_TOTAL_PAGES"] = str(build_count)
+    env["CONAN_CURRENT_PAGE"] = str(index + 1)
+    env["CONAN_CPU_COUNT"] = str(cpu_count)
+    env["CPT_SUMMARY_FILE"] = os.path.join(slot["dir"], "summary_{}.json".format(index))
+    if lockfiles.get_lockfile():
+        env["BPT_BUILD_LOCKFILE"] = os.path.join(slot["dir"], "lockfiles", "build_{}.lock".format(index))
+    if skip_docker_update:
+        # The first build already updated and committed the docker image
+        env["CONAN_DOCKER_IMAGE_SKIP_UPDATE"] = "1"
+    return env
+
+
+def _terminate(process):
+    # Each build runs in its own process group, which also holds the compilers and docker clients it started
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(process.pid, signal.SIGTERM)
+        else:
+            process.terminate()
+    except OSError:
+        pass
+
+
+class _Cancellation(object):
+    """ Cancels the running and the remaining builds once the fail-fast limit of failed builds is reached """
+
+    def __init__(self, max_failures):
+        self.max_failures = max_failures
+        self.failures = 0
+        self._processes = set()
+        self._lock = threading.RLock()
+        self._cancelled = threading.Event()
+
+    def is_cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def register(self, process):
+        with self._lock:
+            self._processes.add(process)
+            if self.is_cancelled():
+                _terminate(process)
+
+    def unregister(self, process):
+        with self._lock:
+            self._processes.discard(process)
+
+    def add_failure(self) -> bool:
+        """ Count a failed build, returns True if it cancelled the builds """
+        with self._lock:
+            self.failures += 1
+            if self.max_failures is None or self.failures < self.max_failures or self.is_cancelled():
+                return False
+            self.cancel()
+            return True
+
+    def cancel(self):
+        with self._lock:
+            self._cancelled.set()
+            for process in self._processes:
+                _terminate(process)
+
+
+def _wait(process) -> (int, dict):
+    """ Wait for the process and collect the resource usage of it and all its waited-for children """
+    if not hasattr(os, "wait4"):
+        return process.wait(), {}
+
+    _, status, usage = os.wait4(process.pid, 0)
+    if os.WIFSIGNALED(status):
+        returncode = -os.WTERMSIG(status)
+    else:
+        returncode = os.WEXITSTATUS(status)
+    # Let Popen know that the process is gone
+    process.returncode = returncode
+
+    # ru_maxrss is reported in KiB on Linux, but in bytes on macOS
+    rss_divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return returncode, {"cpu_time": usage.ru_utime + usage.ru_stime,
+                        "max_rss": usage.ru_maxrss / rss_divisor}
+
+
+def _run_build(env: dict, log_path: str, stream: bool, cancellation: _Cancellation) -> dict:
+    command = [sys.executable, "-m", "bincrafters.cli", "--auto"]
+    _flush_output()
+    start = time.perf_counter()
+    with open(log_path, "w") as log:
+        process = subprocess.Popen(command, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                   universal_newlines=True, errors="replace",
+                                   start_new_session=hasattr(os, "killpg"))
+        cancellation.register(process)
+        try:
+            for line in process.stdout:
+                log.write(line)
+                if stream:
+                    sys.stdout.write(line)
+            process.stdout.close()
+            returncode, usage = _wait(process)
+        finally:
+            cancellation.unregister(process)
+
+    result = {"returncode": returncode, "wall_time": time.perf_counter() - start,
+              "cpu_time": None, "max_rss": None}
+    result.update(usage)
+    return result
+
+
+def _merge_summaries(slots: list, summary_file: str):
+    summary = []
+    for slot in slots:
+        for index in slot["builds"]:
+            path = os.path.join(slot["dir"], "summary_{}.json".format(index))
+            if os.path.isfile(path):
+                with open(path, "r") as f:
+                    summary.extend(json.load(f))
+    with open(summary_file, "w") as f:
+        json.dump(summary, f)
+
+
+def _import_packages(slots: list, use_docker: bool):
+    # Each slot has its own Conan storage
+    artifact_dir = package_artifacts.get_artifact_dir()
+    # The slots share the remotes, the revisions are selected once
+    selected = package_artifacts.get_selected_revisions(artifact_dir, os.path.join(slots[0]["home"], ".conan"),
+                                                        lockfile=lockfiles.get_lockfile())
+    for n, slot in enumerate(slots):
+        statistics = package_artifacts.import_packages(artifact_dir, os.path.join(slot["home"], ".conan"),
+                                                       writable=use_docker, selected=selected)
+        if n == 0:
+            printer.print_message("Imported {} recipes and {} packages from {}".format(
+                statistics["recipes"], statistics["packages"], artifact_dir))
+
+
+def _export_packages(slots: list, reference: str):
+    artifact_dir = package_artifacts.get_artifact_dir()
+    exported = 0
+    for slot in slots:
+        exported += package_artifacts.export_built_packages(artifact_dir, os.path.join(slot["home"], ".conan"),
+                                                            exclude=reference)
+    printer.print_message("Exported {} dependency packages built by this job to {}".format(exported, artifact_dir))
+
+
+def _upload(builder, slots: list, uploads: list):
+    if not builder._upload_enabled():
+        return
+
+    # Upload in a deterministic order: slot by slot, every slot holds a fixed set of builds
+    for slot in slots:
+        if not slot["builds"]:
+            continue
+        printer.print_message("Uploading packages of builds {}".format(
+            ", ".join(str(index + 1) for index in slot["builds"])))
+        _flush_output()
+        cache_folder = os.path.join(slot["home"], ".conan")
+        artifacts = upload.get_local_artifacts(cache_folder, str(builder.reference),
+                                               only_recipe=builder.upload_only_recipe)
+        statistics = upload.upload_builder_artifacts(builder, cache_folder, artifacts)
+        statistics["builds"] = [index + 1 for index in slot["builds"]]
+        uploads.append(statistics)
+
+
+def _report(report: dict):
+    printer.print_message("Build summary (dependencies: C = cache, D = download, B = build)")
+    print(build_report.format_summary_table(report["builds"]))
+    in_memory = [str(build["number"]) for build in report["builds"] if build.get("storage") == "memory"]
+    if in_memory:
+        print("Builds in memory: {}".format(", ".join(in_memory)))
+    skipped = [str(build["number"]) for build in report["builds"] if build.get("skipped")]
+    if skipped:
+        print("Builds skipped after {} failed build(s): {}".format(report["failures"], ", ".join(skipped)))
+    for statistics in report["uploads"]:
+        print("Upload of builds {}: {}".format(", ".join(str(number) for number in statistics["builds"]),
+                                              upload.format_statistics(statistics)))
+    _flush_output()
+
+    report_path = build_report.get_report_path()
+    if report_path:
+        build_report.write_report(report_path, report)
+        printer.print_message("Build report written to {}".format(report_path))
+
+
+def _remove_workdir(workdir: str, keep_logs: bool):
+    """ Remove the Conan homes of the slots, the logs of unsuccessful runs are moved out first """
+    if keep_logs:
+        logs_dir = tempfile.mkdtemp(prefix="bpt_build_logs_")
+        for root, _, files in os.walk(workdir):
+            for name in files:
+                if name.endswith(".log"):
+                    slot = os.path.relpath(root, workdir)
+                    shutil.move(os.path.join(root, name), os.path.join(logs_dir, "{}_{}".format(slot, name)))
+        printer.print_message("Build logs kept in {}".format(logs_dir))
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+@tracing.traced
+def run_builds(builder):
+    indices = get_page_indices(builder)
+    if not indices:
+        printer.print_message("No builds to run")
+        return
+
+    cpu_count = int(os.getenv("CONAN_CPU_COUNT", os.cpu_count() or 1))
+    memory = get_available_memory()
+    memory_per_build = int(os.getenv("BPT_PARALLEL_BUILDS_MEMORY", 2048))
+    jobs, cpus_per_build = get_job_layout(
+        build_count=len(indices),
+        requested_jobs=get_parallel_builds(),
+        cpu_count=cpu_count,
+        memory=memory,
+        memory_per_build=memory_per_build,
+        min_cpus_per_build=int(os.getenv("BPT_PARALLEL_BUILDS_MIN_CPUS", 1)))
+    printer.print_message("Running {} builds with {} parallel job(s) and {} CPU(s) per build"
+                          .format(len(indices), jobs, cpus_per_build))
+
+    tmpfs_size = None
+    if build_tmpfs.is_enabled():
+        tmpfs_size = build_tmpfs.get_tmpfs_size(jobs, memory=memory, memory_per_build=memory_per_build)
+        if tmpfs_size is None:
+            printer.print_message("Not enough memory for the build folders, building on disk")
+        else:
+            printer.print_message("Building in memory, up to {} MiB per build".format(tmpfs_size))
+
+    workdir = tempfile.mkdtemp(prefix="bpt_builds_")
+    succeeded = False
+    try:
+        slots = [_prepare_slot(os.path.join(workdir, str(n)), builder.use_docker) for n in range(jobs)]
+        # Builds are assigned round-robin so that every slot holds a fixed, reproducible set of builds
+        for position, index in enumerate(indices):
+            slots[position % jobs]["builds"].append(index)
+        if package_artifacts.get_artifact_dir():
+            with tracing.span("import packages"):
+                _import_packages(slots, builder.use_docker)
+
+        start = time.perf_counter()
+        results = {}
+        output_lock = threading.Lock()
+        cancellation = _Cancellation(get_max_failures())
+
+        def _execute(slot: dict, index: int):
+            position = indices.index(index)
+            env = _get_build_env(slot, index, len(builder.items), cpus_per_build, skip_docker_update=position > 0)
+            log_path = os.path.join(slot["dir"], "build_{}.log".format(index))
+            build = builder.items[index]
+            tmpfs_env = None
+            if tmpfs_size is not None:
+                tmpfs_env = build_tmpfs.get_build_env(env, slot["storage"], build.reference, tmpfs_size,
+                                                      builder.use_docker, name=str(index))
+            with tracing.span("build {}".format(position + 1), slot=slots.index(slot), in_memory=tmpfs_env is not None):
+                result = _run_build(tmpfs_env or env, log_path, stream=jobs == 1, cancellation=cancellation)
+            if tmpfs_env is not None:
+                build_tmpfs.release_build_folder(build_tmpfs.get_build_folder(slot["storage"], build.reference))
+
+            with open(log_path, "r") as log:
+                output = log.read()
+            result["storage"] = "memory" if tmpfs_env is not None else "disk"
+            if tmpfs_env is not None and result["returncode"] != 0 and not cancellation.is_cancelled() \
+                    and build_tmpfs.is_out_of_space(output):
+                with output_lock:
+                    printer.print_message("Build {} exceeded the memory for build folders, building it again on disk"
+                                          .format(position + 1))
+                with tracing.span("build {} on disk".format(position + 1), slot=slots.index(slot)):
+                    result = _run_build(env, log_path, stream=jobs == 1, cancellation=cancellation)
+                with open(log_path, "r") as log:
+                    output = log.read()
+                result["storage"] = "spilled to disk"
+            result["number"] = position + 1
+            result["settings"] = build.settings
+            result["options"] = build.options
+            result["description"] = build_report.get_build_description(build.settings, build.options)
+            result["dependencies"] = build_report.get_dependency_statistics(output, str(build.reference))
+
+            cancelled = False
+            if result["returncode"] != 0:
+                if cancellation.is_cancelled():
+                    result["cancelled"] = True
+                else:
+                    cancelled = cancellation.add_failure()
+
+            with output_lock:
+                if jobs > 1:
+                    sys.stdout.write(output)
+                printer.print_message("Build {}/{} finished: {}".format(
+                    position + 1, len(indices), build_report.get_result(result)))
+                if cancelled:
+                    printer.print_message("{} build(s) failed, cancelling the remaining builds".format(
+                        cancellation.failures))
+                _flush_output()
+                results[index] = result
+
+        def _execute_slot(slot: dict, builds: list):
+            for index in builds:
+                if cancellation.is_cancelled():
+                    break
+                _execute(slot, index)
+
+        # The first build runs alone; it updates the docker image and fills the download cache
+        _execute(slots[0], slots[0]["builds"][0])
+        threads = []
+        for n, slot in enumerate(slots):
+            builds = slot["builds"][1:] if n == 0 else slot["builds"]
+            thread = threading.Thread(target=_execute_slot, args=(slot, builds))
+            thread.start()
+            threads.append(thread)
+        try:
+            for thread in threads:
+                thread.join()
+        except KeyboardInterrupt:
+            # The builds run in their own process groups, which don't receive the interrupt
+            cancellation.cancel()
+            for thread in threads:
+                thread.join()
+            raise
+
+        summary_file = os.getenv("CPT_SUMMARY_FILE", None)
+        if summary_file:
+            _merge_summaries(slots, summary_file)
+        if package_artifacts.get_artifact_dir():
+            # Also the dependencies of failed builds are of use for the sibling jobs and the next run
+            with tracing.span("export packages"):
+                _export_packages(slots, str(builder.reference))
+
+        for position, index in enumerate(indices):
+            if index not in results:
+                build = builder.items[index]
+                results[index] = {"number": position + 1, "returncode": None, "skipped": True,
+                                  "settings": build.settings, "options": build.options,
+                                  "description": build_report.get_build_description(build.settings, build.options)}
+        report = {"jobs": jobs, "cpus_per_build": cpus_per_build, "failures": cancellation.failures,
+                  "builds": [results[index] for index in indices], "uploads": []}
+        failed = [build["number"] for build in report["builds"] if build_report.get_result(build) == "FAILED"]
+        try:
+            if not failed:
+                _upload(builder, slots, report["uploads"])
+        finally:
+            report["wall_time"] = time.perf_counter() - start
+            _report(report)
+
+        if failed:
+            message = "{} of {} builds failed: {}".format(len(failed), len(indices),
+                                                          ", ".join(str(number) for number in failed))
+            not_finished = [build["number"] for build in report["builds"]
+                            if build.get("skipped") or build.get("cancelled")]
+            if not_finished:
+                message += ", {} cancelled or skipped: {}".format(len(not_finished),
+                                                                  ", ".join(str(number) for number in not_finished))
+            raise Exception(message)
+        succeeded = True
+    finally:
+        _remove_workdir(workdir, keep_logs=not succeeded)
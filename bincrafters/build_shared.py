@@ -7,6 +7,10 @@ from cpt.tools import split_colon_env
 from cpt.remotes import RemotesManager
 # from cpt.ci_manager import *
 from cpt.printer import Printer
+from bincrafters import file_cache
+from bincrafters import remote_ranking
+from bincrafters import timings
+from bincrafters import tracing
 from bincrafters.build_paths import BINCRAFTERS_REPO_URL, BINCRAFTERS_LOGIN_USERNAME, BINCRAFTERS_USERNAME, BINCRAFTERS_REPO_NAME
 
 printer = Printer()
@@ -36,6 +40,13 @@ def get_value_from_recipe(search_string, recipe=None):
     return result
 
 
+def _get_recipe_files(attribute, recipe_path):
+    if not recipe_path:
+        return []
+    return [recipe_path, os.path.join(os.path.dirname(recipe_path), "conandata.yml")]
+
+
+@file_cache.cached(_get_recipe_files)
 def inspect_value_from_recipe(attribute, recipe_path):
     cwd = os.getcwd()
     result = None
@@ -46,8 +57,9 @@ def inspect_value_from_recipe(attribute, recipe_path):
         if dir_name == "":
             dir_name = "./"
         os.chdir(dir_name)
-        conan_instance, _, _ = conan_api.Conan.factory()
-        inspect_result = conan_instance.inspect(path=conanfile_name, attributes=[attribute])
+        with tracing.span("inspect", attribute=attribute, recipe=recipe_path), timings.measure("inspect"):
+            conan_instance, _, _ = conan_api.Conan.factory()
+            inspect_result = conan_instance.inspect(path=conanfile_name, attributes=[attribute])
         result = inspect_result.get(attribute)
     except:
         pass
@@ -222,6 +234,9 @@ def get_conan_remotes(username, kwargs):
             if BINCRAFTERS_REPO_URL not in remotes:
                 remotes.append(BINCRAFTERS_REPO_URL)
 
+        if remotes and remote_ranking.is_enabled():
+            remotes = remote_ranking.order_remotes(remotes, printer=printer)
+
     kwargs["remotes"] = remotes
     return kwargs
 
@@ -260,6 +275,7 @@ def get_reference(name, version, kwargs):
     return kwargs
 
 
+@tracing.traced
 def get_builder(build_policy=None, cwd=None, **kwargs):
     recipe = get_recipe_path(cwd)
     cwd = os.path.dirname(recipe)
@@ -274,9 +290,12 @@ def get_builder(build_policy=None, cwd=None, **kwargs):
     kwargs = get_archs(kwargs)
     build_policy = os.getenv("CONAN_BUILD_POLICY", build_policy)
 
-    builder = ConanMultiPackager(
-        build_policy=build_policy,
-        cwd=cwd,
-        **kwargs)
+    with tracing.span("ConanMultiPackager"):
+        builder = ConanMultiPackager(
+            build_policy=build_policy,
+            cwd=cwd,
+            **kwargs)
+    if kwargs.get("remotes") and remote_ranking.is_enabled():
+        remote_ranking.apply_remote_order(builder.conan_api, kwargs["remotes"])
 
     return builder
@@ -0,0 +1,99 @@
+import os
+import shutil
+
+from bincrafters import disk_budget
+
+
+# Mount point of the tmpfs inside of the docker containers
+_DOCKER_TMPFS = "/tmp/bpt_build"
+# RAM-backed file system of the host for native builds
+_HOST_TMPFS = "/dev/shm"
+# Smaller build folders aren't worth it, most builds would spill over anyway
+_MIN_SIZE = 512
+
+
+def is_enabled() -> bool:
+    return os.getenv("BPT_TMPFS_BUILDS", "false").lower() in ("1", "true", "yes", "y")
+
+
+def get_tmpfs_size(jobs: int, memory: int = None, memory_per_build: int = 2048):
+    """ Size of the build folder of each concurrent build in MiB
+
+    Per default this is the available memory which isn't needed by the compilers, divided between the builds.
+
+    :param jobs: Number of concurrent builds
+    :param memory: Available memory in MiB, None if unknown
+    :param memory_per_build: Memory in MiB reserved for the compilers of each build
+    :return: Size in MiB or None if the builds should run on disk
+    """
+    if os.getenv("BPT_TMPFS_SIZE"):
+        size = disk_budget.parse_size(os.getenv("BPT_TMPFS_SIZE")) // (1024 * 1024)
+    elif memory is None:
+        return None
+    else:
+        size = (memory - jobs * memory_per_build) // max(1, jobs)
+    return size if size >= _MIN_SIZE else None
+
+
+def get_build_folder(storage: str, reference) -> str:
+    """ Folder of the Conan storage which holds the build folders of all package IDs of a reference """
+    return os.path.join(storage, reference.name, reference.version, reference.user or "_",
+                        reference.channel or "_", "build")
+
+
+def _link_build_folder(build_folder: str, target: str):
+    release_build_folder(build_folder)
+    os.makedirs(os.path.dirname(build_folder), exist_ok=True)
+    os.symlink(target, build_folder)
+
+
+def release_build_folder(build_folder: str):
+    """ Remove the link to the tmpfs, or the build folders of a previous build on disk """
+    if os.path.islink(build_folder):
+        target = os.readlink(build_folder)
+        os.remove(build_folder)
+        if target.startswith(_HOST_TMPFS + os.sep):
+            shutil.rmtree(target, ignore_errors=True)
+    elif os.path.isdir(build_folder):
+        shutil.rmtree(build_folder, ignore_errors=True)
+
+
+def get_build_env(env: dict, storage: str, reference, size: int, use_docker: bool, name: str):
+    """ Let Conan build in memory: the build folder of the reference becomes a link into a tmpfs
+
+    Docker builds get their own tmpfs of the given size. Native builds use the tmpfs of the host, if it has
+    enough free space left.
+
+    :param env: Environment of the build, which gets extended
+    :param storage: Conan storage of the build
+    :param reference: Reference of the package
+    :param size: Size of the tmpfs in MiB
+    :param use_docker: Whether the build runs in a docker container
+    :param name: Unique name of the build
+    :return: The extended environment, None if the build has to run on disk
+    """
+    build_folder = get_build_folder(storage, reference)
+    env = dict(env)
+    if use_docker:
+        # The storage is mounted at the same path, the link is created inside of the container
+        release_build_folder(build_folder)
+        entry_script = "mkdir -p '{0}' && ln -s '{1}' '{2}'".format(os.path.dirname(build_folder),
+                                                                    _DOCKER_TMPFS, build_folder)
+        # After the umask of the build scheduler, the host has to be able to remove the link again
+        if env.get("CONAN_DOCKER_ENTRY_SCRIPT"):
+            entry_script = "{} && {}".format(env["CONAN_DOCKER_ENTRY_SCRIPT"], entry_script)
+        env["CONAN_DOCKER_ENTRY_SCRIPT"] = entry_script
+        env["CONAN_DOCKER_RUN_OPTIONS"] = "{} --tmpfs {}:rw,exec,size={}m,mode=1777".format(
+            env.get("CONAN_DOCKER_RUN_OPTIONS", ""), _DOCKER_TMPFS, size)
+        return env
+
+    if not os.path.isdir(_HOST_TMPFS) or shutil.disk_usage(_HOST_TMPFS).free < size * 1024 * 1024:
+        return None
+    target = os.path.join(_HOST_TMPFS, "bpt_build_{}_{}".format(os.getpid(), name))
+    os.makedirs(target, exist_ok=True)
+    _link_build_folder(build_folder, target)
+    return env
+
+
+def is_out_of_space(output: str) -> bool:
+    return "No space left on device" in output
@@ -0,0 +1,80 @@
+class Job(object):
+    """ A job of the CI matrix
+
+    Jobs are read like the JSON configs of the matrix, e.g. job["dockerImage"] or job.get("buildType"), so they
+    can be passed to prepare_env directly. Keys which the model doesn't know are kept in extra.
+    """
+
+    # Attributes in the order of the JSON config, with their JSON key
+    _FIELDS = (("name", "name"), ("compiler", "compiler"), ("version", "version"), ("os", "os"),
+               ("docker_image", "dockerImage"), ("build_type", "buildType"), ("cwd", "cwd"),
+               ("recipe_version", "recipe_version"), ("lockfile", "lockfile"))
+    _ATTRIBUTES = {key: attribute for attribute, key in _FIELDS}
+
+    __slots__ = tuple(attribute for attribute, _ in _FIELDS) + ("extra",)
+
+    def __init__(self, name: str, compiler: str, version: str, os: str, docker_image: str = None,
+                 build_type: str = None, cwd: str = None, recipe_version: str = None, lockfile: str = None,
+                 extra: dict = None):
+        self.name = name
+        self.compiler = compiler
+        self.version = version
+        self.os = os
+        self.docker_image = docker_image
+        self.build_type = build_type
+        self.cwd = cwd
+        self.recipe_version = recipe_version
+        self.lockfile = lockfile
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, config: dict) -> "Job":
+        job = cls(config["name"], config["compiler"], config["version"], config["os"])
+        for key, value in config.items():
+            job[key] = value
+        return job
+
+    def to_dict(self) -> dict:
+        """ The JSON config of the job, without unset keys """
+        config = {key: getattr(self, attribute) for attribute, key in self._FIELDS
+                  if getattr(self, attribute) is not None}
+        config.update(self.extra or {})
+        return config
+
+    def copy(self) -> "Job":
+        job = Job(self.name, self.compiler, self.version, self.os)
+        for attribute in self.__slots__:
+            setattr(job, attribute, getattr(self, attribute))
+        job.extra = dict(self.extra) if self.extra else None
+        return job
+
+    def __getitem__(self, key: str):
+        attribute = self._ATTRIBUTES.get(key)
+        value = getattr(self, attribute) if attribute else (self.extra or {}).get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value):
+        attribute = self._ATTRIBUTES.get(key)
+        if attribute:
+            setattr(self, attribute, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Job) and self.to_dict() == other.to_dict()
+
+    def __repr__(self) -> str:
+        return "Job({!r})".format(self.to_dict())
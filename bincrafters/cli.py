@@ -6,6 +6,10 @@ from bincrafters.build_autodetect import run_autodetect
 from bincrafters.autodetect import autodetect
 from bincrafters.generate_ci_jobs import generate_ci_jobs
 from bincrafters.prepare_env import prepare_env
+from bincrafters.serve import serve
+from bincrafters.validate import validate
+from bincrafters import timings
+from bincrafters import tracing
 
 
 def _parse_arguments(*args):
@@ -18,6 +22,10 @@ def _parse_arguments(*args):
                         help="Specfies the CI platform")
     genmatrix.add_argument('--split-by-build-types', type=str, choices=["true", "false"],
                         help="Split build jobs by build types")
+    genmatrix.add_argument('--lockfiles', type=str,
+                        help="Directory for Conan lockfiles of the jobs, which get referenced in the matrix")
+    genmatrix.add_argument('--timings', type=str, nargs="?", const="-",
+                        help="Write a JSON breakdown of the time spent per phase and recipe to stderr or to a file")
     prepareenv = subparsers.add_parser("prepare-env", help="Prepares the environment by setting env vars and similar")
     prepareenv.add_argument('--platform', type=str, required=True, choices=["gha", "azp"],
                         help="Specfies the CI platform")
@@ -25,22 +33,45 @@ def _parse_arguments(*args):
                         help="JSON config string in the bincrafters-package-tools format")
     prepareenv.add_argument('--select-config', type=str, required=False,
                         help="AZP only; name which config pair gets applied")
+    prepareenv.add_argument('--dry-run', action='store_true',
+                        help="Only print the planned steps and their dependencies")
+    validate_parser = subparsers.add_parser("validate", help="Checks the recipes statically before any build job")
+    validate_parser.add_argument('--workers', type=int,
+                        help="Number of recipes validated in parallel, default: number of cores")
+    serve_parser = subparsers.add_parser("serve", help="Runs a daemon which answers matrix and autodetect "
+                                                       "requests of bincrafters-package-tools-client")
+    serve_parser.add_argument('--socket', type=str,
+                        help="Unix socket of the daemon, default: BPT_SERVE_SOCKET")
     args = parser.parse_args(*args)
     return args
 
 
 def run(*args):
     arguments = _parse_arguments(*args)
-    if arguments.auto:
-        run_autodetect()
-    elif arguments.commands == "prepare-env":
-        config = json.loads(arguments.config)
-        prepare_env(platform=arguments.platform, config=config, select_config=arguments.select_config)
-    elif arguments.commands == "generate-ci-jobs":
-        split_by_build_types = arguments.split_by_build_types
-
-        # Note: it is important that we only print the matrix and absolutely nothing else
-        print(generate_ci_jobs(platform=arguments.platform, split_by_build_types=split_by_build_types))
+    with tracing.span("run", command="--auto" if arguments.auto else arguments.commands):
+        if arguments.auto:
+            run_autodetect()
+        elif arguments.commands == "prepare-env":
+            config = json.loads(arguments.config)
+            prepare_env(platform=arguments.platform, config=config, select_config=arguments.select_config,
+                        dry_run=arguments.dry_run)
+        elif arguments.commands == "generate-ci-jobs":
+            split_by_build_types = arguments.split_by_build_types
+            if arguments.timings:
+                timings.enable()
+
+            # Note: it is important that we only print the matrix and absolutely nothing else
+            print(generate_ci_jobs(platform=arguments.platform, split_by_build_types=split_by_build_types,
+                                   lockfile_dir=arguments.lockfiles))
+
+            if arguments.timings:
+                timings.write_report(arguments.timings)
+        elif arguments.commands == "serve":
+            serve(socket_path=arguments.socket)
+        elif arguments.commands == "validate":
+            problems = validate(workers=arguments.workers)
+            if problems:
+                raise Exception("Validation of the recipes failed with {} problem(s)".format(len(problems)))
 
 
 def cli():
@@ -0,0 +1,120 @@
+import os
+import re
+import shutil
+import subprocess
+
+from bincrafters.build_shared import printer
+from bincrafters import tracing
+
+
+# Path of the ccache directory inside of the docker containers
+_DOCKER_CCACHE_DIR = "/tmp/ccache"
+_STATISTICS = ["direct_cache_hit", "preprocessed_cache_hit", "cache_miss"]
+# "ccache -s" of ccache 3.x, which has no --print-stats
+_STATISTICS_TEXT = {"direct_cache_hit": r"cache hit \(direct\)\s+(\d+)",
+                    "preprocessed_cache_hit": r"cache hit \(preprocessed\)\s+(\d+)",
+                    "cache_miss": r"cache miss\s+(\d+)"}
+
+
+def is_enabled() -> bool:
+    return os.getenv("BPT_CCACHE", "false").lower() in ("1", "true", "yes", "y")
+
+
+def get_max_size() -> str:
+    return os.getenv("BPT_CCACHE_MAXSIZE", "5G")
+
+
+def get_ccache_dir(docker_image: str = None) -> str:
+    """ Objects of different compilers can't be reused anyway, so every docker image gets its own cache """
+    base = os.path.expanduser(os.getenv("BPT_CCACHE_DIR", os.path.join("~", ".bpt", "ccache")))
+    return os.path.join(base, re.sub(r"[^\w.-]", "_", docker_image) if docker_image else "native")
+
+
+def get_docker_image():
+    return os.getenv("CONAN_DOCKER_IMAGE", None) or None
+
+
+def _get_ccache_env(ccache_dir: str) -> dict:
+    return {
+        "CCACHE_DIR": ccache_dir,
+        "CCACHE_MAXSIZE": get_max_size(),
+        # Conan builds every package ID in its own folder
+        "CCACHE_NOHASHDIR": "true",
+        "CMAKE_C_COMPILER_LAUNCHER": "ccache",
+        "CMAKE_CXX_COMPILER_LAUNCHER": "ccache",
+    }
+
+
+def setup_ccache(docker_image: str = None):
+    """ Mount the ccache directory into the docker containers or use it for native builds
+
+    :param docker_image: Docker image of the builds, None for native builds
+    :return: The ccache directory on the host, None if ccache can't be used
+    """
+    if docker_image is None and shutil.which("ccache") is None:
+        printer.print_message("ccache is not installed, building without it")
+        return None
+
+    ccache_dir = get_ccache_dir(docker_image)
+    os.makedirs(ccache_dir, mode=0o777, exist_ok=True)
+    # In some cases Python may ignore the mode of makedirs, do it again explicitly with chmod
+    os.chmod(ccache_dir, mode=0o777)
+
+    if docker_image is None:
+        os.environ.update(_get_ccache_env(ccache_dir))
+    else:
+        conan_docker_run_options = os.environ.get("CONAN_DOCKER_RUN_OPTIONS", "")
+        conan_docker_run_options += " -v '{}':'{}'".format(ccache_dir, _DOCKER_CCACHE_DIR)
+        for name, value in _get_ccache_env(_DOCKER_CCACHE_DIR).items():
+            conan_docker_run_options += " -e {}={}".format(name, value)
+        os.environ["CONAN_DOCKER_RUN_OPTIONS"] = conan_docker_run_options
+    printer.print_message("Using ccache in {} (max. size {})".format(ccache_dir, get_max_size()))
+    return ccache_dir
+
+
+def parse_statistics(output: str) -> dict:
+    """ Parse the output of "ccache --print-stats" (ccache 4) or "ccache -s" (ccache 3) """
+    statistics = {}
+    for line in output.splitlines():
+        fields = line.split("\t")
+        if len(fields) == 2 and fields[0] in _STATISTICS:
+            statistics[fields[0]] = int(fields[1])
+    if not statistics:
+        for name, pattern in _STATISTICS_TEXT.items():
+            match = re.search(pattern, output)
+            if match:
+                statistics[name] = int(match.group(1))
+    return statistics
+
+
+def get_statistics(ccache_dir: str, docker_image: str = None) -> dict:
+    """ Current statistics of a ccache directory, using ccache of the docker image if needed """
+    if shutil.which("ccache"):
+        prefix = ["ccache"]
+        env = dict(os.environ, CCACHE_DIR=ccache_dir)
+    elif docker_image:
+        prefix = ["docker", "run", "--rm", "-v", "{}:{}".format(ccache_dir, _DOCKER_CCACHE_DIR),
+                  "-e", "CCACHE_DIR={}".format(_DOCKER_CCACHE_DIR), docker_image, "ccache"]
+        env = None
+    else:
+        return {}
+
+    for argument in ["--print-stats", "-s"]:
+        with tracing.command_span(prefix + [argument]):
+            output = subprocess.run(prefix + [argument], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                    universal_newlines=True, env=env)
+        if output.returncode == 0:
+            return parse_statistics(output.stdout)
+    return {}
+
+
+def format_statistics(before: dict, after: dict) -> str:
+    if not after:
+        return "ccache statistics are not available"
+    delta = {name: after.get(name, 0) - before.get(name, 0) for name in _STATISTICS}
+    hits = delta["direct_cache_hit"] + delta["preprocessed_cache_hit"]
+    total = hits + delta["cache_miss"]
+    if total == 0:
+        return "ccache: no compilations"
+    return "ccache: {} hits ({} direct, {} preprocessed), {} misses, hit rate {:.1f} %".format(
+        hits, delta["direct_cache_hit"], delta["preprocessed_cache_hit"], delta["cache_miss"], 100.0 * hits / total)
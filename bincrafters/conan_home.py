@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import platform
+import subprocess
+import tarfile
+from io import StringIO
+
+from conans import __version__ as conan_version
+from conans.client.conf import ConanClientConfigParser
+from conans.client.conf.detect import detect_defaults_settings
+from conans.client.output import ConanOutput
+from conans.paths import get_conan_user_home
+
+from bincrafters import download_cache
+
+
+# Increase when the content of the bootstrap archives changes
+_BOOTSTRAP_FORMAT = 1
+# Packages and sources are not part of the bootstrap, only the configuration
+_EXCLUDED_FOLDERS = ["data"]
+
+
+def get_conan_home() -> str:
+    return os.path.join(get_conan_user_home(), ".conan")
+
+
+def get_bootstrap_cache():
+    return os.getenv("BPT_CONAN_HOME_CACHE", None) or None
+
+
+def get_default_config_values() -> dict:
+    return {
+        "storage.download_cache": download_cache.get_download_cache(),
+        "general.revisions_enabled": "1",
+    }
+
+
+def set_config_values(values: dict, conan_home: str = None):
+    """ Same as "conan config set" for every value, without starting Conan each time
+
+    :param values: Dict of "section.key" to value
+    :param conan_home: The .conan folder, the one of the current user per default
+    """
+    conan_home = conan_home or get_conan_home()
+    path = os.path.join(conan_home, "conan.conf")
+    if not os.path.isfile(path):
+        # A conan.conf with only these values would lack all defaults
+        subprocess.run(["conan", "config", "init"], check=True,
+                       env=dict(os.environ, CONAN_USER_HOME=os.path.dirname(conan_home)))
+    config = ConanClientConfigParser(path)
+    for key, value in values.items():
+        config.set_item(key, str(value))
+
+
+def get_default_profile_settings() -> list:
+    """ Settings which "conan config init" detects for the default profile, e.g. the compiler and its version """
+    profile_path = os.path.join(get_conan_home(), "profiles", "default")
+    return [list(setting) for setting in detect_defaults_settings(ConanOutput(StringIO()), profile_path)]
+
+
+def get_bootstrap_archive(bootstrap_cache: str, config_values: dict, profile_settings: list = None) -> str:
+    """ Path of the archive of a Conan home with this configuration
+
+    :param bootstrap_cache: Directory of the archives
+    :param config_values: conan.conf values which are part of the bootstrap
+    :param profile_settings: Settings of the default profile, detected on this machine per default
+    """
+    # The default profile gets auto detected, don't share archives between different systems or compilers
+    profile_settings = get_default_profile_settings() if profile_settings is None else profile_settings
+    key = hashlib.sha256(json.dumps({"format": _BOOTSTRAP_FORMAT, "conan": conan_version, "config": config_values,
+                                     "system": [platform.system(), platform.machine()],
+                                     "profile": profile_settings},
+                                    sort_keys=True).encode("utf-8")).hexdigest()
+    return os.path.join(bootstrap_cache, "conan-home-{}-{}.tar.gz".format(conan_version, key[:16]))
+
+
+def _add_to_archive(archive: tarfile.TarFile, conan_home: str):
+    for name in sorted(os.listdir(conan_home)):
+        if name in _EXCLUDED_FOLDERS or name.endswith(".lock"):
+            continue
+        archive.add(os.path.join(conan_home, name), arcname=name)
+
+
+def _restore_archive(archive_path: str, conan_home: str):
+    with tarfile.open(archive_path, "r:gz") as archive:
+        # Like "conan config init", existing files are kept
+        members = [member for member in archive.getmembers()
+                   if not os.path.lexists(os.path.join(conan_home, member.name))
+                   and not os.path.isabs(member.name) and ".." not in member.name.split("/")]
+        archive.extractall(conan_home, members=members)
+
+
+def bootstrap_conan_home(run, bootstrap_cache: str, config_values: dict = None):
+    """ Initialize the Conan home from a cached archive, or initialize it and add it to the cache
+
+    :param run: Function to execute shell commands
+    :param bootstrap_cache: Directory of the archives
+    :param config_values: conan.conf values which are part of the bootstrap, see set_config_values
+    """
+    config_values = get_default_config_values() if config_values is None else config_values
+    conan_home = get_conan_home()
+    archive = get_bootstrap_archive(bootstrap_cache, config_values)
+    if os.path.isfile(archive):
+        print("Restoring the Conan home from {}".format(archive))
+        os.makedirs(conan_home, exist_ok=True)
+        _restore_archive(archive, conan_home)
+        set_config_values(config_values, conan_home)
+        return
+
+    run("conan config init")
+    set_config_values(config_values, conan_home)
+    run("conan user")
+
+    os.makedirs(bootstrap_cache, exist_ok=True)
+    # Write to a temporary file first, so concurrent jobs never restore a partial archive
+    temporary_archive = "{}.{}.tmp".format(archive, os.getpid())
+    with tarfile.open(temporary_archive, "w:gz") as f:
+        _add_to_archive(f, conan_home)
+    os.replace(temporary_archive, archive)
+    print("Added the Conan home to {}".format(archive))
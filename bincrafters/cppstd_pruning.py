@@ -0,0 +1,92 @@
+import os
+import re
+
+
+# First compiler version with complete language support of a standard, older versions only have partial
+# or experimental support (e.g. -std=c++2a) which isn't worth a build
+COMPILER_CPPSTD_SUPPORT = {
+    "gcc": {"11": "4.8", "14": "5", "17": "7", "20": "10", "23": "14"},
+    "clang": {"11": "3.3", "14": "3.4", "17": "5", "20": "12", "23": "18"},
+    "apple-clang": {"11": "5.0", "14": "6.1", "17": "10.0", "20": "13.0", "23": "16.0"},
+    "Visual Studio": {"14": "14", "17": "15", "20": "17", "23": "18"},
+    "msvc": {"14": "190", "17": "191", "20": "193", "23": "194"},
+}
+
+_CHECK_CPPSTD = r'''check_(min|max)_cppstd\(\s*self\s*,\s*(?:["']?(\d+)["']?|self\.(\w+))\s*[,)]'''
+
+
+def is_pruning_enabled() -> bool:
+    # Opt-in, it changes the build matrix of the recipes
+    return os.getenv("BPT_CPPSTD_PRUNING", "false").lower() in ("1", "true", "yes", "y")
+
+
+def _get_year(cppstd) -> int:
+    """ 98 -> 1998, 11 -> 2011, gnu17 -> 2017 """
+    number = int(re.sub(r"\D", "", str(cppstd)))
+    return 1900 + number if number >= 90 else 2000 + number
+
+
+def _get_version_tuple(version) -> tuple:
+    return tuple(int(part) for part in re.findall(r"\d+", str(version)))
+
+
+def get_recipe_cppstd_range(recipe_path: str) -> (str, str):
+    """ Statically derive the C++ standards a recipe accepts from its check_min_cppstd/check_max_cppstd calls
+
+    Values returned by a property like self._min_cppstd are resolved if the property returns a plain number.
+    Recipes might only check a standard for some options, so the loosest bound wins.
+
+    :return: Minimum and maximum cppstd, None if the recipe doesn't restrict it
+    """
+    if not os.path.isfile(recipe_path):
+        return None, None
+    with open(recipe_path, "r") as f:
+        content = f.read()
+
+    bounds = {"min": [], "max": []}
+    for kind, value, attribute in re.findall(_CHECK_CPPSTD, content):
+        if attribute:
+            match = re.search(r'''def {}\(self\):\s*return\s+["']?(\d+)["']?\s*$'''.format(re.escape(attribute)),
+                              content, re.MULTILINE)
+            if not match:
+                # Not statically known, e.g. depends on the compiler
+                return None, None
+            value = match.group(1)
+        bounds[kind].append(value)
+
+    minimum = min(bounds["min"], key=_get_year) if bounds["min"] else None
+    maximum = max(bounds["max"], key=_get_year) if bounds["max"] else None
+    return minimum, maximum
+
+
+def prune_cppstds(cppstds: list, compiler: str, compiler_version: str, min_cppstd=None, max_cppstd=None) -> list:
+    """ Remove the standards which the recipe doesn't accept or which the compiler doesn't fully support
+
+    :param cppstds: Values of compiler.cppstd, e.g. ["98", "gnu98", "11", ...]
+    :param compiler: Conan compiler name
+    :param compiler_version: Version of the compiler
+    :param min_cppstd: Minimal standard the recipe requires
+    :param max_cppstd: Maximal standard the recipe accepts
+    """
+    support = COMPILER_CPPSTD_SUPPORT.get(compiler, {})
+    result = []
+    for cppstd in cppstds:
+        if not re.search(r"\d", str(cppstd)):
+            # Can't judge values like "latest"
+            result.append(cppstd)
+            continue
+        year = _get_year(cppstd)
+        if min_cppstd is not None and year < _get_year(min_cppstd):
+            continue
+        if max_cppstd is not None and year > _get_year(max_cppstd):
+            continue
+        if support:
+            required_version = support.get(str(year)[2:])
+            if required_version is None and year > max(_get_year(std) for std in support):
+                # Newer than anything known to be supported
+                continue
+            if required_version is not None \
+                    and _get_version_tuple(compiler_version) < _get_version_tuple(required_version):
+                continue
+        result.append(cppstd)
+    return result
@@ -0,0 +1,185 @@
+import configparser
+import json
+import os
+import shutil
+import subprocess
+import time
+
+from bincrafters import download_cache as download_cache_module
+
+
+_SIZE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+
+
+def is_warm_runner() -> bool:
+    return os.getenv("BPT_WARM_RUNNER", "false").lower() in ("1", "true", "yes", "y")
+
+
+def parse_size(value: str) -> int:
+    """ Parse a size like "512M", "50G" or "1048576" into bytes """
+    value = str(value).strip().upper().rstrip("B").rstrip("I")
+    unit = value[-1] if value and value[-1] in _SIZE_UNITS else ""
+    number = value[:-1] if unit else value
+    return int(float(number) * _SIZE_UNITS[unit])
+
+
+def get_disk_budget() -> int:
+    return parse_size(os.getenv("BPT_WARM_RUNNER_DISK_BUDGET", "50G"))
+
+
+def _get_usage_file() -> str:
+    return os.path.join(os.path.expanduser("~"), ".bpt", "docker_image_usage.json")
+
+
+def _load_docker_usage() -> dict:
+    try:
+        with open(_get_usage_file(), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def record_docker_image_use(docker_image: str):
+    """ Docker doesn't track when an image was used last, so remember it for the LRU eviction """
+    usage = _load_docker_usage()
+    usage[docker_image] = time.time()
+    os.makedirs(os.path.dirname(_get_usage_file()), exist_ok=True)
+    temporary_file = "{}.{}.tmp".format(_get_usage_file(), os.getpid())
+    with open(temporary_file, "w") as f:
+        json.dump(usage, f)
+    os.replace(temporary_file, _get_usage_file())
+
+
+def select_evictions(entries: list, budget: int) -> list:
+    """ Pick the least recently used entries which have to be removed to get below the budget
+
+    :param entries: Dicts with at least "size", "last_used" and "protected"
+    :param budget: Allowed total size in bytes
+    :return: Entries to remove, least recently used first
+    """
+    total = sum(entry["size"] for entry in entries)
+    evictions = []
+    for entry in sorted(entries, key=lambda e: e["last_used"]):
+        if total <= budget:
+            break
+        if entry.get("protected"):
+            continue
+        evictions.append(entry)
+        total -= entry["size"]
+    return evictions
+
+
+def _get_directory_entry(kind: str, path: str) -> dict:
+    size = 0
+    last_used = os.path.getmtime(path)
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                stat = os.lstat(os.path.join(root, name))
+            except OSError:
+                continue
+            size += stat.st_size
+            last_used = max(last_used, stat.st_atime, stat.st_mtime)
+    return {"kind": kind, "name": path, "path": path, "size": size, "last_used": last_used}
+
+
+def _get_conan_storage() -> (str, str):
+    """ Return the Conan data folder and the download cache folder of the current Conan home """
+    conan_home = os.path.join(os.path.expanduser(os.getenv("CONAN_USER_HOME", "~")), ".conan")
+    parser = configparser.ConfigParser(interpolation=None)
+    parser.read(os.path.join(conan_home, "conan.conf"))
+    data = parser.get("storage", "path", fallback="./data")
+    download_cache = parser.get("storage", "download_cache", fallback=None)
+    data = os.path.normpath(os.path.join(conan_home, os.path.expanduser(data)))
+    return data, download_cache
+
+
+def get_conan_data_entries(data: str) -> list:
+    # One entry per reference: <data>/<name>/<version>/<user>/<channel>
+    entries = []
+    if not os.path.isdir(data):
+        return entries
+    for root, dirs, _ in os.walk(data):
+        depth = os.path.relpath(root, data).count(os.sep) + 1 if root != data else 0
+        if depth == 4:
+            entries.append(_get_directory_entry("conan-data", root))
+            dirs[:] = []
+    return entries
+
+
+def get_image_archive_entries(image_cache: str) -> list:
+    if not image_cache or not os.path.isdir(image_cache):
+        return []
+    entries = []
+    for name in os.listdir(image_cache):
+        path = os.path.join(image_cache, name)
+        if name.endswith(".tar") and os.path.isfile(path):
+            entries.append({"kind": "image-archive", "name": path, "path": path,
+                            "size": os.path.getsize(path), "last_used": os.path.getmtime(path)})
+    return entries
+
+
+def get_docker_image_entries(protected_images: list) -> list:
+    try:
+        output = subprocess.run(["docker", "image", "ls", "--format", "{{.ID}}\t{{.Repository}}:{{.Tag}}"],
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+    except OSError:
+        return []
+    if output.returncode != 0:
+        return []
+
+    usage = _load_docker_usage()
+    entries = {}
+    for line in output.stdout.splitlines():
+        image_id, name = line.split("\t", 1)
+        if image_id in entries:
+            entries[image_id]["names"].append(name)
+            continue
+        inspect = subprocess.run(["docker", "image", "inspect", "--format", "{{.Size}}\t{{.Created}}", image_id],
+                                 stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+        size, created = inspect.stdout.strip().split("\t", 1) if inspect.returncode == 0 else ("0", "")
+        entries[image_id] = {"kind": "docker-image", "name": image_id, "names": [name], "size": int(size),
+                             "created": created}
+
+    for entry in entries.values():
+        # Images that were never used by BPT count as used before anything else
+        entry["last_used"] = max([usage.get(name, 0) for name in entry["names"]])
+        entry["protected"] = any(name in protected_images or name.split(":")[0] in protected_images
+                                 for name in entry["names"])
+        entry["name"] = "{} ({})".format(entry["name"], ", ".join(entry["names"]))
+    return list(entries.values())
+
+
+def _remove(entry: dict, run):
+    if entry["kind"] == "docker-image":
+        run("docker rmi --force {}".format(entry["name"].split(" ")[0]))
+    elif entry["kind"] == "download-cache":
+        download_cache_module.remove_entry(os.path.dirname(entry["path"]), entry)
+    elif os.path.isdir(entry["path"]):
+        # Removing the reference folder is what "conan remove -f" does, without another Conan startup
+        shutil.rmtree(entry["path"], ignore_errors=True)
+    elif os.path.isfile(entry["path"]):
+        os.remove(entry["path"])
+
+
+def enforce_disk_budget(run, budget: int = None, protected_images: list = None, image_cache: str = None):
+    """ Remove the least recently used docker images, Conan packages and download cache files
+    until their total size is within the budget
+
+    :param run: Function to execute shell commands
+    :param budget: Allowed size in bytes, BPT_WARM_RUNNER_DISK_BUDGET per default
+    :param protected_images: Docker images needed by the current job which must not be removed
+    :param image_cache: Directory of the provisioned docker image archives
+    """
+    budget = get_disk_budget() if budget is None else budget
+    data, download_cache = _get_conan_storage()
+    entries = get_docker_image_entries(protected_images or []) \
+        + get_conan_data_entries(data) \
+        + download_cache_module.get_entries(download_cache) \
+        + get_image_archive_entries(image_cache)
+
+    total = sum(entry["size"] for entry in entries)
+    print("Disk usage of caches: {:.1f} GiB, budget: {:.1f} GiB".format(total / 1024 ** 3, budget / 1024 ** 3))
+    for entry in select_evictions(entries, budget):
+        print("Evicting {} {} ({:.1f} MiB)".format(entry["kind"], entry["name"], entry["size"] / 1024 ** 2))
+        _remove(entry, run)
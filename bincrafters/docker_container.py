@@ -0,0 +1,107 @@
+import os
+from contextlib import contextmanager
+
+import cpt.packager
+
+from bincrafters.build_shared import printer
+
+
+# Keeps the container running until it gets removed after the last build
+_IDLE_COMMAND = "tail -f /dev/null"
+
+
+def is_enabled() -> bool:
+    return os.getenv("BPT_DOCKER_REUSE_CONTAINER", "false").lower() in ("1", "true", "yes", "y")
+
+
+def _get_runner_class(runner_class, containers: dict):
+    class ReusedContainerRunner(runner_class):
+        """ Executes the builds in one long-lived container per docker image instead of a new one per build
+
+        The container gets the tools installed and runs the entry script once, every build runs via docker exec.
+        """
+
+        @staticmethod
+        def _format_env_vars(env_vars: dict) -> str:
+            # Unset values are passed empty, CPT reads them like missing ones
+            return " ".join(['-e %s="%s"' % (key, value if value else "") for key, value in env_vars.items()])
+
+        def _get_static_env_vars_text(self) -> str:
+            """ Variables which are the same for all builds, the container is started with them """
+            return self._format_env_vars({key: value for key, value in os.environ.items()
+                                          if (key.startswith("CONAN_") and key != "CONAN_USER_HOME")
+                                          or key.startswith("PIP_")})
+
+        def _get_env_vars_text(self) -> str:
+            # Every variable is passed, otherwise a build would see a value of the container environment
+            return self._format_env_vars(self.get_env_vars())
+
+        def _run_command(self, command: str, error: str):
+            if self._runner(command) != 0:
+                raise Exception("{}: {}".format(error, command))
+
+        def _start_container(self, pull_image: bool, docker_entry_script: str) -> str:
+            if pull_image and not self._docker_image_skip_pull:
+                self.pull_image()
+
+            name = "bpt_builds_{}_{}".format(os.getpid(), len(containers))
+            volume_options = ":z" if (runner_class.is_selinux_running() or self._force_selinux) else ""
+            self._run_command('%s docker run -d --name %s -v "%s:%s/project%s" %s %s %s %s %s "%s"' % (
+                self._sudo_docker_command, name, self._cwd, self._docker_conan_home, volume_options,
+                self._get_static_env_vars_text(), self._docker_run_options, self._docker_platform_param,
+                self._docker_image, self._docker_shell, _IDLE_COMMAND), "Error starting the container")
+            containers[self._docker_image] = {"name": name, "runner": self._runner,
+                                              "sudo_docker_command": self._sudo_docker_command}
+
+            setup_commands = []
+            if not self._docker_image_skip_update or self._always_update_conan_in_docker:
+                setup_commands.append(self._pip_update_conan_command())
+            if docker_entry_script:
+                setup_commands.append(docker_entry_script)
+            if setup_commands:
+                with self.printer.foldable_output("setup container"):
+                    self._run_command('%s docker exec %s %s %s "cd project && %s"' % (
+                        self._sudo_docker_command, self._get_static_env_vars_text(), name, self._docker_shell,
+                        " && ".join(setup_commands)), "Error setting up the container")
+            return name
+
+        def run(self, pull_image=True, docker_entry_script=None):
+            if self._docker_shell.lower().startswith("cmd"):
+                # Windows containers lack an idle command, they keep a container per build
+                return super().run(pull_image=pull_image, docker_entry_script=docker_entry_script)
+
+            if self._docker_image in containers:
+                name = containers[self._docker_image]["name"]
+            else:
+                name = self._start_container(pull_image, docker_entry_script)
+            self.printer.print_in_docker(self._docker_image)
+            self._run_command('%s docker exec %s %s %s "cd project && %s run_create_in_docker"' % (
+                self._sudo_docker_command, self._get_env_vars_text(), name, self._docker_shell,
+                self._lcow_user_workaround), "Error building")
+            self.printer.print_message("Exiting docker...")
+
+    return ReusedContainerRunner
+
+
+@contextmanager
+def reuse_containers(builder):
+    """ Let the docker builds of a builder share one container per docker image, if enabled
+
+    The runner is derived from the DockerCreateRunner in place when entering. Patches which wrap run(), like
+    the one of build_report.collect_builder_report, have to be entered afterwards to see the builds.
+    """
+    if not builder.use_docker or not is_enabled():
+        yield
+        return
+
+    containers = {}
+    runner_class = cpt.packager.DockerCreateRunner
+    cpt.packager.DockerCreateRunner = _get_runner_class(runner_class, containers)
+    try:
+        yield
+    finally:
+        cpt.packager.DockerCreateRunner = runner_class
+        for container in containers.values():
+            if container["runner"]("{} docker rm -f {}".format(container["sudo_docker_command"],
+                                                               container["name"])) != 0:
+                printer.print_message("Could not remove the container {}".format(container["name"]))
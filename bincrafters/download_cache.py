@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+import fasteners
+
+from bincrafters import disk_budget
+
+
+# Conan stores every download as <cache>/<sha256>, marks it with <sha256>.dirty while downloading
+# and locks it with <cache>/locks/<sha256>
+_ENTRY = re.compile(r"^[0-9a-f]{64}$")
+_DIRTY_SUFFIX = ".dirty"
+_INDEX_FILE = "bpt_index.json"
+
+
+def get_download_cache() -> str:
+    return os.getenv("BPT_DOWNLOAD_CACHE", None) or os.path.join(tempfile.gettempdir(), "conan")
+
+
+def get_max_size() -> int:
+    return disk_budget.parse_size(os.getenv("BPT_DOWNLOAD_CACHE_SIZE", "10G"))
+
+
+def is_verification_enabled() -> bool:
+    return os.getenv("BPT_DOWNLOAD_CACHE_VERIFY", "false").lower() in ("1", "true", "yes", "y")
+
+
+def create_download_cache(download_cache: str):
+    """ Create the download cache shared by all users, it may exist already """
+    os.makedirs(os.path.join(download_cache, "locks"), mode=0o777, exist_ok=True)
+    for path in [download_cache, os.path.join(download_cache, "locks")]:
+        try:
+            # In some cases Python may ignore the mode of makedirs, do it again explicitly with chmod
+            os.chmod(path, mode=0o777)
+        except PermissionError:
+            # Created by another user, who already made it writable
+            pass
+
+
+def write_file(path: str, content: str, mode: int = 0o666):
+    """ Replace a file atomically, concurrent readers either see the old or the new content """
+    temporary_file = "{}.{}.tmp".format(path, os.getpid())
+    with open(temporary_file, "w") as f:
+        f.write(content)
+    os.chmod(temporary_file, mode)
+    os.replace(temporary_file, path)
+
+
+def _get_lock(download_cache: str, name: str):
+    return fasteners.InterProcessLock(os.path.join(download_cache, "locks", name))
+
+
+def _get_sha256(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def get_entries(download_cache: str) -> list:
+    if not download_cache or not os.path.isdir(download_cache):
+        return []
+    entries = []
+    for item in os.scandir(download_cache):
+        if not _ENTRY.match(item.name) or not item.is_file():
+            continue
+        try:
+            stat = item.stat()
+        except OSError:
+            continue
+        entries.append({"kind": "download-cache", "name": item.name, "path": item.path, "size": stat.st_size,
+                        "mtime": stat.st_mtime, "last_used": max(stat.st_atime, stat.st_mtime),
+                        "dirty": os.path.exists(item.path + _DIRTY_SUFFIX)})
+    return entries
+
+
+def remove_entry(download_cache: str, entry: dict) -> bool:
+    """ Remove an entry unless Conan is using it right now
+
+    :return: False if the entry is locked
+    """
+    lock = _get_lock(download_cache, entry["name"])
+    if not lock.acquire(blocking=False):
+        return False
+    try:
+        for path in [entry["path"], entry["path"] + _DIRTY_SUFFIX]:
+            if os.path.exists(path):
+                os.remove(path)
+    finally:
+        lock.release()
+    return True
+
+
+def _load_index(download_cache: str) -> dict:
+    try:
+        with open(os.path.join(download_cache, _INDEX_FILE), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def check_integrity(download_cache: str, entries: list, verify: bool = False) -> list:
+    """ Find entries which are broken: interrupted downloads, empty files and, with verify, files whose
+    content changed since they were first seen. Conan never changes a finished entry.
+
+    :return: The broken entries
+    """
+    index = _load_index(download_cache)
+    broken = []
+    for entry in entries:
+        record = index.get(entry["name"])
+        if record is not None and record["mtime"] != entry["mtime"]:
+            # Downloaded again
+            record = None
+        if entry["dirty"] or entry["size"] == 0:
+            broken.append(entry)
+        elif record is None:
+            index[entry["name"]] = {"mtime": entry["mtime"], "size": entry["size"],
+                                    "sha256": _get_sha256(entry["path"])}
+        elif record["size"] != entry["size"] or (verify and record["sha256"] != _get_sha256(entry["path"])):
+            broken.append(entry)
+
+    names = set(entry["name"] for entry in entries) - set(entry["name"] for entry in broken)
+    write_file(os.path.join(download_cache, _INDEX_FILE),
+               json.dumps({name: record for name, record in index.items() if name in names}))
+    return broken
+
+
+def clean_download_cache(download_cache: str, max_size: int = None, verify: bool = None):
+    """ Remove broken entries and the least recently used ones above the maximal size
+
+    Only one process cleans at a time, the others skip it. Entries which Conan uses are kept.
+
+    :param download_cache: The Conan download cache
+    :param max_size: Size in bytes, BPT_DOWNLOAD_CACHE_SIZE per default
+    :param verify: Compare the content of the entries with their checksum, BPT_DOWNLOAD_CACHE_VERIFY per default
+    """
+    max_size = get_max_size() if max_size is None else max_size
+    verify = is_verification_enabled() if verify is None else verify
+    lock = _get_lock(download_cache, "bpt_clean")
+    if not lock.acquire(blocking=False):
+        return
+    try:
+        entries = get_entries(download_cache)
+        for entry in check_integrity(download_cache, entries, verify=verify):
+            if remove_entry(download_cache, entry):
+                print("Removed broken download cache entry {}".format(entry["name"]))
+                entries.remove(entry)
+
+        for entry in disk_budget.select_evictions(entries, max_size):
+            remove_entry(download_cache, entry)
+    finally:
+        lock.release()
@@ -0,0 +1,124 @@
+import functools
+import os
+import re
+import threading
+
+
+# Disabled per default, a single CLI invocation gains nothing from it; the serve daemon enables it
+_enabled = False
+_entries = {}
+_statistics = {"hits": 0, "misses": 0}
+_lock = threading.Lock()
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+    clear()
+
+
+def clear():
+    with _lock:
+        _entries.clear()
+        _statistics.update(hits=0, misses=0)
+
+
+def get_statistics() -> dict:
+    with _lock:
+        return dict(_statistics, entries=len(_entries))
+
+
+def _get_stamp(paths: list) -> tuple:
+    stamp = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            stamp.append((path, stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            stamp.append((path, None, None))
+    return tuple(stamp)
+
+
+def cached(get_paths):
+    """ Cache the results of a function while enabled, until one of its input files changes
+
+    The entries are keyed by the arguments and the working directory and get invalidated when the
+    modification time or the size of any of the files returned by get_paths changes.
+
+    :param get_paths: Function which gets the same arguments and returns the paths of the input files
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            key = (function.__module__, function.__qualname__, os.getcwd(), args, tuple(sorted(kwargs.items())))
+            stamp = _get_stamp(get_paths(*args, **kwargs))
+            with _lock:
+                entry = _entries.get(key)
+                if entry is not None and entry[0] == stamp:
+                    _statistics["hits"] += 1
+                    return entry[1]
+                _statistics["misses"] += 1
+            result = function(*args, **kwargs)
+            with _lock:
+                _entries[key] = (stamp, result)
+            return result
+        return wrapper
+    return decorator
+
+
+def _find_git_dir(path: str):
+    path = os.path.abspath(path)
+    while True:
+        git_dir = os.path.join(path, ".git")
+        if os.path.isdir(git_dir):
+            return git_dir
+        if os.path.isfile(git_dir):
+            # Worktrees and submodules reference their git directory
+            with open(git_dir, "r") as f:
+                content = f.read().strip()
+            if content.startswith("gitdir:"):
+                return os.path.join(path, content[len("gitdir:"):].strip())
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+
+def _get_ref_paths(git_dir: str, revision: str) -> list:
+    """ Loose ref files git would resolve a revision like "origin/main^1" or a remote name like "origin" from """
+    name = re.split(r"\.\.|[\^~@:]", revision, maxsplit=1)[0]
+    if not name:
+        return []
+    return [os.path.join(git_dir, *ref.split("/")) for ref in [
+        name, "refs/" + name, "refs/tags/" + name, "refs/heads/" + name, "refs/remotes/" + name,
+        "refs/remotes/{}/HEAD".format(name)]]
+
+
+def get_git_state_paths(*args, **kwargs) -> list:
+    """ Files of the git repository of the working directory which change with commits, checkouts and fetches
+
+    The refs named by string arguments, e.g. the base "origin/main" of a diff, are included as well, a push or
+    "git remote update" changes them without touching any of the other files.
+    """
+    git_dir = _find_git_dir(os.getcwd())
+    if git_dir is None:
+        return []
+    paths = [os.path.join(git_dir, name) for name in ["HEAD", "index", "packed-refs", "FETCH_HEAD"]]
+    try:
+        with open(os.path.join(git_dir, "HEAD"), "r") as f:
+            head = f.read().strip()
+        if head.startswith("ref:"):
+            paths.append(os.path.join(git_dir, head[len("ref:"):].strip()))
+    except OSError:
+        pass
+    for value in list(args) + list(kwargs.values()):
+        if isinstance(value, str):
+            paths.extend(path for path in _get_ref_paths(git_dir, value) if path not in paths)
+    return paths
@@ -2,39 +2,45 @@ import json
 import os
 import yaml
 import copy
+import collections
 
 from bincrafters.build_shared import get_bool_from_env, get_conan_vars, get_recipe_path, get_version_from_ci
 from bincrafters.autodetect import *
 from bincrafters.utils import *
 from bincrafters.check_compatibility import *
 import bincrafters
+from bincrafters import lockfiles
+from bincrafters.ci_job import Job
+from bincrafters import timings
+from bincrafters import tracing
 
 
-def _is_gha_existing():
-    if utils_file_contains(os.path.join(".github", "workflows", "conan.yml"), "bincrafters-package-tools") \
-            and utils_file_contains(os.path.join(".github", "workflows", "conan.yml"), "bincrafters_package_tools"):
-        return True
+# Result of probe_workspace, immutable so that all recipes of a run see the same CI layout
+WorkspaceProbe = collections.namedtuple("WorkspaceProbe",
+                                        ["gha_existing", "run_macos_jobs_on_gha", "run_windows_jobs_on_gha"])
 
-    return False
-
-
-def _run_macos_jobs_on_gha():
-    if utils_file_contains("azure-pipelines.yml", "name: bincrafters/templates") \
-            and utils_file_contains("azure-pipelines.yml", "template: .ci/azure.yml@templates"):
-        return False
-
-    return True
 
+def _read_ci_file(path: str) -> str:
+    if not os.path.isfile(path):
+        return ""
+    with open(path) as f:
+        return f.read()
 
-def _run_windows_jobs_on_gha():
-    if utils_file_contains("azure-pipelines.yml", "name: bincrafters/templates") \
-            and utils_file_contains("azure-pipelines.yml", "template: .ci/azure.yml@templates"):
-        return False
 
-    if utils_file_contains("appveyor.yml", "pip install bincrafters_package_tools"):
-        return False
+@tracing.traced
+def probe_workspace() -> WorkspaceProbe:
+    """ Detect which CI services of the working directory run the jobs, every CI file is read once """
+    with timings.measure("file_probe"):
+        gha = _read_ci_file(os.path.join(".github", "workflows", "conan.yml"))
+        azp = _read_ci_file("azure-pipelines.yml")
+        appveyor = _read_ci_file("appveyor.yml")
 
-    return True
+    azp_templates = "name: bincrafters/templates" in azp and "template: .ci/azure.yml@templates" in azp
+    return WorkspaceProbe(
+        gha_existing="bincrafters-package-tools" in gha and "bincrafters_package_tools" in gha,
+        run_macos_jobs_on_gha=not azp_templates,
+        run_windows_jobs_on_gha=not azp_templates and "pip install bincrafters_package_tools" not in appveyor,
+    )
 
 
 def _do_discard_duplicated_build_ids() -> bool:
@@ -70,15 +76,19 @@ _configs = {
 def _get_configs(*configs):
     result = []
     for config in configs:
-        result.append(_configs[config])
+        # Splitting by build types renames the configs, the templates must stay untouched
+        result.append(_configs[config].copy())
     return result
 
-def _get_base_config(recipe_directory: str, platform: str, split_by_build_types: bool, build_set: str = "full", recipe_type: str = ""):
+@tracing.traced
+def _get_base_config(recipe_directory: str, platform: str, split_by_build_types: bool, build_set: str = "full", recipe_type: str = "",
+                     probe: WorkspaceProbe = None):
     if recipe_type == "":
         if _do_discard_duplicated_build_ids():
             cwd = os.getcwd()
             os.chdir(recipe_directory)
-            recipe_type = autodetect()
+            with tracing.span("autodetect", recipe_directory=recipe_directory), timings.measure("autodetect"):
+                recipe_type = autodetect()
             os.chdir(cwd)
         else:
             # Useful for installer_only / header_only recipes that still want the full build matrix
@@ -88,9 +98,12 @@ def _get_base_config(recipe_directory: str, platform: str, split_by_build_types:
     matrix = {}
     matrix_minimal = {}
 
+    if platform in ["gha", "azp"] and probe is None:
+        probe = probe_workspace()
+
     if platform == "gha":
-        run_macos = _run_macos_jobs_on_gha()
-        run_windows = _run_windows_jobs_on_gha()
+        run_macos = probe.run_macos_jobs_on_gha
+        run_windows = probe.run_windows_jobs_on_gha
         if recipe_type == "installer":
             matrix["config"] = _get_configs("ubuntu-gcc-11", "win-xcode-13", "win-vs-2022")
             matrix_minimal["config"] = matrix["config"].copy()
@@ -115,7 +128,7 @@ def _get_base_config(recipe_directory: str, platform: str, split_by_build_types:
                 matrix["config"] += _get_configs("win-vs-2019", "win-vs-2022")
                 matrix_minimal["config"] += _get_configs("win-vs-2022")
     elif platform == "azp":
-        if _is_gha_existing() and recipe_type in ["installer", "unconditional_header_only", "recipe_manual_full_matrix"]:
+        if probe.gha_existing and recipe_type in ["installer", "unconditional_header_only", "recipe_manual_full_matrix"]:
             matrix["config"] = []
             matrix_minimal["config"] = []
         else:
@@ -163,9 +176,16 @@ def _get_base_config(recipe_directory: str, platform: str, split_by_build_types:
         return {"config": []}
 
 
-def generate_ci_jobs(platform: str, recipe_type: str = autodetect(), split_by_build_types: bool = False) -> str:
+def iter_ci_jobs(platform: str, split_by_build_types: bool = False, lockfile_dir: str = None):
+    """ Generate the jobs of the CI matrix lazily, for in-process callers which don't need the JSON string
+
+    :param platform: gha or azp
+    :param split_by_build_types: Split build jobs by build types, None to read it from the environment
+    :param lockfile_dir: Directory for Conan lockfiles of the jobs, BPT_MATRIX_LOCKFILES per default
+    :return: Generator of Job objects
+    """
     if platform != "gha" and platform != "azp":
-        return ""
+        return
 
     if not is_ci_config_compatible(platform=platform, feature="generate-ci-jobs"):
         raise Exception(
@@ -177,7 +197,8 @@ def generate_ci_jobs(platform: str, recipe_type: str = autodetect(), split_by_bu
             ))
 
     directory_structure = autodetect_directory_structure()
-    final_matrix = {"config": []}
+    # The CI files are the same for all recipes, they are only read once
+    probe = probe_workspace()
 
     def _detect_changed_directories(path_filter: str = None) -> set:
         changed_dirs = []
@@ -207,7 +228,8 @@ def generate_ci_jobs(platform: str, recipe_type: str = autodetect(), split_by_bu
     def _parse_recipe_directory(path: str, path_filter: str = None, recipe_displayname: str = None):
         changed_dirs = _detect_changed_directories(path_filter=path_filter)
         config_file = os.path.join(path, "config.yml")
-        config_yml = yaml.load(open(config_file, "r"), yaml.Loader)
+        with timings.measure("yaml"):
+            config_yml = yaml.load(open(config_file, "r"), yaml.Loader)
         for version, version_attr in config_yml["versions"].items():
             version_build_value = version_attr.get("build", "full")
             # If we are on a branch like testing/3.0.0 then only build 3.0.0
@@ -221,73 +243,102 @@ def generate_ci_jobs(platform: str, recipe_type: str = autodetect(), split_by_bu
                             recipe_directory=os.path.join(path, version_attr["folder"]),
                             platform=platform,
                             split_by_build_types=split_by_build_types,
-                            build_set=version_build_value
+                            build_set=version_build_value,
+                            probe=probe
                         )
                     else:
                         raise ValueError("Unknown build value for version {} detected!".format(version))
 
                     for build_config in working_matrix["config"]:
-                        new_config = build_config.copy()
+                        job = Job.from_dict(build_config)
                         if not path_filter:
-                            new_config["cwd"] = version_attr["folder"]
-                            new_config["name"] = "{} {}".format(version, new_config["name"])
+                            job.cwd = version_attr["folder"]
+                            job.name = "{} {}".format(version, job.name)
                         else:
-                            new_config["cwd"] = "{}{}".format(path_filter, version_attr["folder"])
-                            new_config["name"] = "{}/{} {}".format(recipe_displayname, version, new_config["name"])
-                        new_config["recipe_version"] = version
-                        final_matrix["config"].append(new_config)
+                            job.cwd = "{}{}".format(path_filter, version_attr["folder"])
+                            job.name = "{}/{} {}".format(recipe_displayname, version, job.name)
+                        job.recipe_version = version
+                        yield job
 
     def _parse_standalone_recipe(path: str, path_filter: str = None, recipe_displayname: str = None):
         data_file = os.path.join(path, "conandata.yml")
-        data_yml = yaml.load(open(data_file, "r"), yaml.Loader)
+        with timings.measure("yaml"):
+            data_yml = yaml.load(open(data_file, "r"), yaml.Loader)
         for version, _ in data_yml["sources"].items():
             working_matrix = _get_base_config(
                 recipe_directory=path,
                 platform=platform,
                 split_by_build_types=split_by_build_types,
-                build_set="full"
+                build_set="full",
+                probe=probe
             )
             for build_config in working_matrix["config"]:
-                new_config = build_config.copy()
-                new_config["cwd"] = path.replace(os.getcwd(), "")
-                new_config["name"] = "{} {}".format(version, new_config["name"])
-                new_config["recipe_version"] = version
-                final_matrix["config"].append(new_config)
-
-    if directory_structure == DIR_STRUCTURE_ONE_RECIPE_ONE_VERSION:
-        matrix = _get_base_config(recipe_directory=".", platform=platform, split_by_build_types=split_by_build_types)
-        for build_config in matrix["config"]:
-            new_config = build_config.copy()
-            new_config["cwd"] = "./"
-            _, fixed_version, _ = get_conan_vars(recipe=get_recipe_path())
-            new_config["recipe_version"] = fixed_version
-            final_matrix["config"].append(new_config)
-
-    elif directory_structure == DIR_STRUCTURE_ONE_RECIPE_MANY_VERSIONS:
-        _parse_recipe_directory(path=os.getcwd())
-
-    elif directory_structure == DIR_STRUCTURE_CCI:
-        recipes = [f.path for f in os.scandir("recipes") if f.is_dir()]
-        for recipe_folder in recipes:
-            # the path_filter should end with a / so that the results don't start with one
-            recipe_displayname = recipe_folder.replace("recipes/", "")
-            _parse_recipe_directory(path=recipe_folder,
-                                    path_filter="{}/".format(recipe_folder),
-                                    recipe_displayname=recipe_displayname)
-
-    elif directory_structure == DIR_STRUCTURE_STANDALONE_RECIPE_MANY_VERSIONS:
-        _parse_standalone_recipe(os.getcwd())
+                job = Job.from_dict(build_config)
+                job.cwd = path.replace(os.getcwd(), "")
+                job.name = "{} {}".format(version, job.name)
+                job.recipe_version = version
+                yield job
+
+    def _parse_directories():
+        if directory_structure == DIR_STRUCTURE_ONE_RECIPE_ONE_VERSION:
+            with timings.recipe(os.path.basename(os.getcwd())):
+                matrix = _get_base_config(recipe_directory=".", platform=platform,
+                                          split_by_build_types=split_by_build_types, probe=probe)
+                for build_config in matrix["config"]:
+                    job = Job.from_dict(build_config)
+                    job.cwd = "./"
+                    _, fixed_version, _ = get_conan_vars(recipe=get_recipe_path())
+                    job.recipe_version = fixed_version
+                    yield job
+
+        elif directory_structure == DIR_STRUCTURE_ONE_RECIPE_MANY_VERSIONS:
+            with timings.recipe(os.path.basename(os.getcwd())):
+                yield from _parse_recipe_directory(path=os.getcwd())
+
+        elif directory_structure == DIR_STRUCTURE_CCI:
+            recipes = [f.path for f in os.scandir("recipes") if f.is_dir()]
+            for recipe_folder in recipes:
+                # the path_filter should end with a / so that the results don't start with one
+                recipe_displayname = recipe_folder.replace("recipes/", "")
+                with timings.recipe(recipe_displayname):
+                    yield from _parse_recipe_directory(path=recipe_folder,
+                                                       path_filter="{}/".format(recipe_folder),
+                                                       recipe_displayname=recipe_displayname)
+
+        elif directory_structure == DIR_STRUCTURE_STANDALONE_RECIPE_MANY_VERSIONS:
+            with timings.recipe(os.path.basename(os.getcwd())):
+                yield from _parse_standalone_recipe(os.getcwd())
+
+    jobs = _parse_directories()
+
+    # Resolve the dependency graphs once, all jobs of this run use the same dependency revisions
+    lockfile_dir = lockfile_dir or lockfiles.get_matrix_lockfile_dir()
+    if lockfile_dir:
+        jobs = lockfiles.iter_matrix_lockfiles(jobs, lockfile_dir, get_recipe_path)
+
+    yield from jobs
+
+
+@tracing.traced
+def generate_ci_jobs(platform: str, recipe_type: str = autodetect(), split_by_build_types: bool = False,
+                     lockfile_dir: str = None) -> str:
+    if platform != "gha" and platform != "azp":
+        return ""
+
+    jobs = list(iter_ci_jobs(platform=platform, split_by_build_types=split_by_build_types,
+                             lockfile_dir=lockfile_dir))
 
     # Now where we have the complete matrix, we have to parse it in a final string
     # which can be understood by the target platform
     matrix_string = "{}"
 
-    if platform == "gha":
-        matrix_string = json.dumps(final_matrix)
-    elif platform == "azp":
-        platform_matrix = {}
-        for build_config in final_matrix["config"]:
-            platform_matrix[build_config["name"]] = build_config
-        matrix_string = json.dumps(platform_matrix)
+    with timings.measure("serialization"):
+        if platform == "gha":
+            matrix_string = json.dumps({"config": [job.to_dict() for job in jobs]})
+        elif platform == "azp":
+            platform_matrix = {}
+            for job in jobs:
+                platform_matrix[job.name] = job.to_dict()
+            matrix_string = json.dumps(platform_matrix)
 
     return matrix_string
@@ -0,0 +1,124 @@
+import hashlib
+import os
+from io import StringIO
+
+from conans.client.conan_api import ConanAPIV1, ProfileData
+from conans.client.output import ConanOutput
+from conans.model.ref import ConanFileReference
+from cpt.profiles import get_profiles, save_profile_to_tmp
+
+from bincrafters import timings
+
+
+_CONAN_OS = {"ubuntu": "Linux", "macos": "Macos", "windows": "Windows", "vs": "Windows"}
+_CONAN_COMPILER = {"GCC": "gcc", "CLANG": "clang", "APPLE_CLANG": "apple-clang", "VISUAL": "Visual Studio"}
+
+
+def get_matrix_lockfile_dir():
+    return os.getenv("BPT_MATRIX_LOCKFILES", None) or None
+
+
+def get_lockfile():
+    """ Base lockfile of the current job, set by prepare-env """
+    return os.getenv("BPT_LOCKFILE", None) or None
+
+
+def get_build_lockfile():
+    """ Path of the full lockfile of a single build, set by the build scheduler """
+    return os.getenv("BPT_BUILD_LOCKFILE", None) or None
+
+
+def _get_api(cache_folder: str = None) -> ConanAPIV1:
+    # The matrix is printed to stdout, Conan must not write anything there
+    return ConanAPIV1(cache_folder=cache_folder, output=ConanOutput(StringIO()))
+
+
+def get_config_settings(config: dict) -> list:
+    """ Conan settings of a job of the CI matrix, which decide about its dependency graph """
+    settings = []
+    for prefix, conan_os in _CONAN_OS.items():
+        if config.get("os", "").lower().startswith(prefix):
+            settings.append("os={}".format(conan_os))
+            break
+    compiler = _CONAN_COMPILER.get(config["compiler"], str(config["compiler"]).lower().replace("_", "-"))
+    version = str(config["version"])
+    if config["compiler"] == "APPLE_CLANG":
+        # Conan only knows major.minor
+        version = ".".join((version.split(".") + ["0"])[:2])
+    settings.extend(["compiler={}".format(compiler), "compiler.version={}".format(version)])
+    if config.get("buildType"):
+        settings.append("build_type={}".format(config["buildType"]))
+    return settings
+
+
+def create_base_lockfile(recipe_path: str, version: str, settings: list, lockfile_out: str, lockfile: str = None,
+                         update: bool = False):
+    """ Lock the revisions of all dependencies of a recipe version, without the configuration
+
+    :param recipe_path: Path of the recipe
+    :param version: Version of the recipe
+    :param settings: Settings which decide about the dependency graph
+    :param lockfile_out: Path of the new lockfile
+    :param lockfile: Existing lockfile, its dependencies are kept and only missing ones get resolved
+    :param update: Resolve against the remotes even if the local cache has matching versions
+    """
+    _get_api().lock_create(recipe_path, lockfile_out, version=version, base=True, lockfile=lockfile, update=update,
+                           profile_host=ProfileData(profiles=None, settings=settings, options=None, env=None,
+                                                    conf=None))
+
+
+def iter_matrix_lockfiles(configs, lockfile_dir: str, get_recipe_path):
+    """ Create a base lockfile for every recipe version and configuration of the matrix and add its path
+
+    All configurations of a recipe version are resolved against the lockfile of the first one, so every job
+    uses the same revisions. Configurations with the same settings share their lockfile. Lockfiles of earlier
+    runs in the directory are replaced and the dependencies are resolved against the remotes, a local cache or
+    an old lockfile would pin outdated revisions.
+
+    :param configs: Jobs of the CI matrix, any iterable of dicts or Job objects
+    :param lockfile_dir: Directory for the lockfiles
+    :param get_recipe_path: Function which returns the recipe path of a working directory
+    :return: Generator of the jobs, each one gets yielded once its lockfile exists
+    """
+    os.makedirs(lockfile_dir, exist_ok=True)
+    first_lockfiles = {}
+    created = set()
+    for config in configs:
+        settings = get_config_settings(config)
+        recipe = (config["cwd"], config["recipe_version"])
+        key = hashlib.sha256(repr((recipe, settings)).encode()).hexdigest()[:16]
+        lockfile = os.path.join(lockfile_dir, "{}.lock".format(key))
+        if lockfile not in created:
+            if os.path.isfile(lockfile):
+                os.remove(lockfile)
+            created.add(lockfile)
+            with timings.measure("lockfiles"):
+                create_base_lockfile(get_recipe_path(config["cwd"]), config["recipe_version"], settings, lockfile,
+                                     lockfile=first_lockfiles.get(recipe), update=True)
+        first_lockfiles.setdefault(recipe, lockfile)
+        config["lockfile"] = lockfile
+        yield config
+
+
+def create_build_lockfile(cache_folder: str, base_lockfile: str, recipe_path: str, reference, profile_text: str,
+                          lockfile_out: str):
+    """ Complete a base lockfile with the profile of a build, Conan only accepts such full lockfiles
+
+    The dependencies come from the base lockfile, version ranges are not resolved against the remotes.
+    """
+    ref = ConanFileReference.loads(str(reference)) if not isinstance(reference, ConanFileReference) else reference
+    os.makedirs(os.path.dirname(lockfile_out), exist_ok=True)
+    profile_path = save_profile_to_tmp(profile_text)
+    _get_api(cache_folder).lock_create(recipe_path, lockfile_out, name=ref.name, version=ref.version,
+                                       user=ref.user, channel=ref.channel, lockfile=base_lockfile,
+                                       profile_host=ProfileData(profiles=[profile_path], settings=None,
+                                                                options=None, env=None, conf=None))
+
+
+def set_builder_lockfile(builder, cache_folder: str, recipe_path: str):
+    """ Let the single build of a build scheduler worker use a full lockfile derived from the base lockfile """
+    build = builder.items[int(builder.curpage) - 1]
+    profile_text, _ = get_profiles(builder.client_cache, build, os.getenv("CONAN_BASE_PROFILE"))
+    create_build_lockfile(cache_folder, get_lockfile(), recipe_path, build.reference, profile_text,
+                          get_build_lockfile())
+    builder.lockfile = get_build_lockfile()
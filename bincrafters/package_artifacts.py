@@ -0,0 +1,295 @@
+import json
+import os
+import shutil
+import tarfile
+from io import StringIO
+
+from conans.client.cache.cache import ClientCache
+from conans.client.conan_api import ConanAPIV1
+from conans.client.output import ConanOutput
+from conans.errors import ConanException, NotFoundException, RecipeNotFoundException
+from conans.model.ref import ConanFileReference, PackageReference
+
+
+# Every recipe revision has a folder <name>/<version>/<user>/<channel>/<revision> in the artifact directory,
+# with the recipe in recipe.tgz and each package in <package ID>.tgz
+_RECIPE_ARTIFACT = "recipe.tgz"
+_ARTIFACT_SUFFIX = ".tgz"
+_METADATA = "metadata.json"
+
+
+def get_artifact_dir():
+    return os.getenv("BPT_PACKAGE_ARTIFACTS", None) or None
+
+
+def _get_cache(cache_folder: str) -> ClientCache:
+    return ClientCache(cache_folder, ConanOutput(StringIO()))
+
+
+def get_built_packages(cache_folder: str, exclude: str = None) -> list:
+    """ Packages in a Conan cache which were built locally, Conan records the remote of all downloaded ones
+
+    :param cache_folder: The .conan folder of a Conan home
+    :param exclude: Reference whose packages are skipped, e.g. the one of the recipe which is built
+    :return: Sorted list of (reference, package ID) tuples
+    """
+    cache = _get_cache(cache_folder)
+    packages = []
+    for ref in cache.all_refs():
+        if exclude and ref == ConanFileReference.loads(exclude).copy_clear_rev():
+            continue
+        layout = cache.package_layout(ref)
+        try:
+            metadata = layout.load_metadata()
+        except RecipeNotFoundException:
+            continue
+        for package_id in layout.package_ids():
+            if package_id in metadata.packages and metadata.packages[package_id].remote is None:
+                packages.append((str(ref), package_id))
+    return sorted(packages)
+
+
+def _write_artifact(path: str, folders: dict, metadata: dict):
+    """ Pack folders of the Conan cache; the artifact is replaced atomically as sibling jobs may share it """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_file = "{}.{}.tmp".format(path, os.getpid())
+    metadata_file = "{}.{}.json".format(path, os.getpid())
+    with open(metadata_file, "w") as f:
+        json.dump(metadata, f)
+    try:
+        with tarfile.open(temporary_file, "w:gz") as tar:
+            tar.add(metadata_file, arcname=_METADATA)
+            for name, folder in folders.items():
+                if os.path.isdir(folder):
+                    tar.add(folder, arcname=name)
+        os.replace(temporary_file, path)
+    finally:
+        os.remove(metadata_file)
+        if os.path.exists(temporary_file):
+            os.remove(temporary_file)
+
+
+def export_package(artifact_dir: str, cache_folder: str, reference: str, package_id: str) -> bool:
+    """ Export a package and its recipe from a Conan cache into the artifact directory
+
+    :return: True if the package was exported, False if the artifact directory already has it
+    """
+    ref = ConanFileReference.loads(reference)
+    layout = _get_cache(cache_folder).package_layout(ref)
+    metadata = layout.load_metadata()
+    recipe_revision = metadata.recipe.revision
+    folder = os.path.join(artifact_dir, ref.dir_repr(), recipe_revision)
+
+    recipe_artifact = os.path.join(folder, _RECIPE_ARTIFACT)
+    if not os.path.isfile(recipe_artifact):
+        _write_artifact(recipe_artifact, {"export": layout.export(), "export_source": layout.export_sources()},
+                        {"reference": reference, "recipe_revision": recipe_revision})
+
+    package_artifact = os.path.join(folder, package_id + _ARTIFACT_SUFFIX)
+    if os.path.isfile(package_artifact):
+        return False
+    _write_artifact(package_artifact, {"package": layout.package(PackageReference(ref, package_id))},
+                    {"reference": reference, "recipe_revision": recipe_revision, "package_id": package_id,
+                     "package_revision": metadata.packages[package_id].revision})
+    return True
+
+
+def export_built_packages(artifact_dir: str, cache_folder: str, exclude: str = None) -> int:
+    """ Export all locally built packages of a Conan cache, which the artifact directory doesn't have yet
+
+    :return: Number of newly exported packages
+    """
+    return sum(export_package(artifact_dir, cache_folder, reference, package_id)
+               for reference, package_id in get_built_packages(cache_folder, exclude=exclude))
+
+
+def _check_member(item: tarfile.TarInfo, folder: str):
+    """ Reject members which would end up outside of the folder, the artifact directory is shared between jobs """
+    root = os.path.realpath(folder)
+
+    def _is_inside(path: str) -> bool:
+        path = os.path.realpath(path)
+        return path == root or path.startswith(root + os.sep)
+
+    path = os.path.join(root, item.name)
+    if os.path.isabs(item.name) or not _is_inside(path) or not (item.isfile() or item.isdir() or item.issym()
+                                                                or item.islnk()):
+        raise ValueError("Unsafe member {} in the artifact".format(item.name))
+    if item.issym() and (os.path.isabs(item.linkname)
+                         or not _is_inside(os.path.join(os.path.dirname(path), item.linkname))):
+        raise ValueError("Link {} in the artifact points outside of it".format(item.name))
+    if item.islnk() and not _is_inside(os.path.join(root, item.linkname)):
+        raise ValueError("Link {} in the artifact points outside of it".format(item.name))
+
+
+def _extract(artifact: str, member: str, target: str):
+    """ Extract a folder of an artifact, the target appears only once it is complete """
+    temporary_folder = "{}.{}.tmp".format(target, os.getpid())
+    shutil.rmtree(temporary_folder, ignore_errors=True)
+    with tarfile.open(artifact, "r:gz") as tar:
+        members = [item for item in tar.getmembers() if item.name == member or item.name.startswith(member + "/")]
+        if not members:
+            return
+        os.makedirs(temporary_folder)
+        for item in members:
+            item.name = os.path.relpath(item.name, member)
+            if item.islnk():
+                item.linkname = os.path.relpath(item.linkname, member)
+        members = [item for item in members if item.name != "."]
+        try:
+            for item in members:
+                _check_member(item, temporary_folder)
+            if hasattr(tarfile, "data_filter"):
+                tar.extractall(temporary_folder, members=members, filter="data")
+            else:
+                tar.extractall(temporary_folder, members=members)
+        except Exception:
+            shutil.rmtree(temporary_folder, ignore_errors=True)
+            raise
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.replace(temporary_folder, target)
+
+
+def _read_metadata(artifact: str) -> dict:
+    with tarfile.open(artifact, "r:gz") as tar:
+        return json.load(tar.extractfile(_METADATA))
+
+
+def _get_artifact_revisions(artifact_dir: str) -> list:
+    """ (reference, recipe revision) of all recipe revision folders of the artifact directory """
+    revisions = []
+    for root, _, files in os.walk(artifact_dir):
+        if _RECIPE_ARTIFACT in files:
+            metadata = _read_metadata(os.path.join(root, _RECIPE_ARTIFACT))
+            revisions.append((metadata["reference"], metadata["recipe_revision"]))
+    return sorted(revisions)
+
+
+def _get_locked_revisions(lockfile: str) -> dict:
+    with open(lockfile, "r") as f:
+        nodes = json.load(f).get("graph_lock", {}).get("nodes", {})
+    revisions = {}
+    for node in nodes.values():
+        if node.get("ref"):
+            ref = ConanFileReference.loads(node["ref"])
+            revisions[str(ref.copy_clear_rev())] = ref.revision
+    return revisions
+
+
+def _get_latest_remote_revision(api: ConanAPIV1, reference: str):
+    """ Latest recipe revision on the first remote which has the recipe
+
+    :return: The revision, None if no remote has the recipe, "" if a remote couldn't be asked
+    """
+    for remote in api.remote_list():
+        if remote.disabled:
+            continue
+        try:
+            revisions = api.get_recipe_revisions(reference, remote_name=remote.name)
+        except NotFoundException:
+            continue
+        except ConanException:
+            return ""
+        if revisions:
+            return revisions[0]["revision"]
+    return None
+
+
+def get_selected_revisions(artifact_dir: str, cache_folder: str, lockfile: str = None) -> set:
+    """ Recipe revisions of the artifact directory which may be imported
+
+    Imported recipes have no remote, Conan would keep using them instead of newer revisions on the remotes.
+    With a lockfile only the locked revisions are selected, otherwise only the ones which are the latest on the
+    remotes or which no remote knows.
+
+    :param artifact_dir: The artifact directory
+    :param cache_folder: The .conan folder of a Conan home, with the remotes to ask
+    :param lockfile: Lockfile which decides about the revisions
+    :return: Set of (reference, recipe revision)
+    """
+    if not os.path.isdir(artifact_dir):
+        return set()
+    revisions = _get_artifact_revisions(artifact_dir)
+    if lockfile:
+        locked = _get_locked_revisions(lockfile)
+        return {(reference, revision) for reference, revision in revisions if locked.get(reference) == revision}
+
+    api = ConanAPIV1(cache_folder=cache_folder, output=ConanOutput(StringIO()))
+    latest = {}
+    for reference, _ in revisions:
+        if reference not in latest:
+            latest[reference] = _get_latest_remote_revision(api, reference)
+    return {(reference, revision) for reference, revision in revisions if latest[reference] in (None, revision)}
+
+
+def _import_recipe(cache: ClientCache, folder: str, selected: set) -> (bool, int):
+    """ Import the packages of a recipe revision folder of the artifact directory
+
+    :return: Tuple of (recipe imported, number of imported packages)
+    """
+    recipe_artifact = os.path.join(folder, _RECIPE_ARTIFACT)
+    recipe_metadata = _read_metadata(recipe_artifact)
+    if (recipe_metadata["reference"], recipe_metadata["recipe_revision"]) not in selected:
+        return False, 0
+    ref = ConanFileReference.loads(recipe_metadata["reference"])
+    layout = cache.package_layout(ref)
+
+    recipe_imported = False
+    if os.path.isdir(layout.export()):
+        if layout.recipe_revision() != recipe_metadata["recipe_revision"]:
+            # The cache has another revision of the recipe, its packages wouldn't match
+            return False, 0
+    else:
+        _extract(recipe_artifact, "export_source", layout.export_sources())
+        _extract(recipe_artifact, "export", layout.export())
+        with layout.update_metadata() as metadata:
+            metadata.recipe.revision = recipe_metadata["recipe_revision"]
+        recipe_imported = True
+
+    packages = 0
+    for name in sorted(os.listdir(folder)):
+        if name == _RECIPE_ARTIFACT or not name.endswith(_ARTIFACT_SUFFIX):
+            continue
+        package_id = name[:-len(_ARTIFACT_SUFFIX)]
+        if layout.package_id_exists(package_id):
+            continue
+        package_artifact = os.path.join(folder, name)
+        package_metadata = _read_metadata(package_artifact)
+        _extract(package_artifact, "package", layout.package(PackageReference(ref, package_id)))
+        with layout.update_metadata() as metadata:
+            metadata.packages[package_id].revision = package_metadata["package_revision"]
+            metadata.packages[package_id].recipe_revision = package_metadata["recipe_revision"]
+        packages += 1
+    return recipe_imported, packages
+
+
+def import_packages(artifact_dir: str, cache_folder: str, writable: bool = False, selected: set = None) -> dict:
+    """ Import the packages of the artifact directory into a Conan cache, which doesn't have them yet
+
+    :param artifact_dir: The artifact directory
+    :param cache_folder: The .conan folder of a Conan home
+    :param writable: Make the imported folders writable for everyone, e.g. for the user of docker containers
+    :param selected: Recipe revisions to import, see get_selected_revisions, which is asked per default
+    :return: Statistics of the import
+    """
+    cache = _get_cache(cache_folder)
+    statistics = {"recipes": 0, "packages": 0}
+    if not os.path.isdir(artifact_dir):
+        return statistics
+    if selected is None:
+        selected = get_selected_revisions(artifact_dir, cache_folder)
+    for root, _, files in os.walk(artifact_dir):
+        if _RECIPE_ARTIFACT not in files:
+            continue
+        recipe_imported, packages = _import_recipe(cache, root, selected)
+        statistics["recipes"] += int(recipe_imported)
+        statistics["packages"] += packages
+
+    if writable and (statistics["recipes"] or statistics["packages"]):
+        for root, folders, files in os.walk(cache.store):
+            for name in folders:
+                os.chmod(os.path.join(root, name), 0o777)
+            for name in files:
+                path = os.path.join(root, name)
+                os.chmod(path, os.stat(path).st_mode | 0o666)
+    return statistics
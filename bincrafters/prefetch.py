@@ -0,0 +1,123 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+
+from conans.client.conan_api import ConanAPIV1
+from conans.client.graph.graph import BINARY_BUILD, BINARY_DOWNLOAD, BINARY_MISSING, BINARY_UPDATE, \
+    RECIPE_CONSUMER, RECIPE_EDITABLE, RECIPE_VIRTUAL
+from conans.client.output import ConanOutput
+from conans.client import tools
+
+from bincrafters.build_shared import printer
+from bincrafters import build_scheduler
+from bincrafters import tracing
+
+
+# Nodes of a graph which aren't downloaded from a remote
+_LOCAL_RECIPES = [RECIPE_CONSUMER, RECIPE_EDITABLE, RECIPE_VIRTUAL]
+
+
+def is_enabled() -> bool:
+    return os.getenv("BPT_PREFETCH", "false").lower() in ("1", "true", "yes", "y")
+
+
+def get_prefetch_workers() -> int:
+    return max(1, int(os.getenv("BPT_PREFETCH_WORKERS", 8)))
+
+
+def _get_thread_api(apis: threading.local, cache_folder: str) -> ConanAPIV1:
+    # Every Conan API call creates a new app, so each thread needs its own API
+    if not hasattr(apis, "api"):
+        apis.api = ConanAPIV1(cache_folder=cache_folder, output=ConanOutput(StringIO()))
+    return apis.api
+
+
+def get_graph_arguments(build) -> dict:
+    """ Arguments of the Conan API for the dependency graph of a build of CPT """
+    return {"settings": ["{}={}".format(name, value) for name, value in build.settings.items()],
+            "options": ["{}={}".format(name, value) for name, value in build.options.items()],
+            "env": ["{}={}".format(name, value) for name, value in build.env_vars.items()]}
+
+
+def collect_downloads(graphs: list) -> dict:
+    """ Union of the recipes and binaries which the builds will download
+
+    Recipes of binaries which have to be built are downloaded with their sources.
+
+    :param graphs: Dependency graphs of all builds
+    :return: Dict of reference and a dict with the remote name and the package IDs to download
+    """
+    downloads = {}
+    for graph in graphs:
+        for node in graph.nodes:
+            if node.ref is None or node.recipe in _LOCAL_RECIPES:
+                continue
+            if node.binary in (BINARY_DOWNLOAD, BINARY_UPDATE) and node.binary_remote is not None:
+                download = downloads.setdefault(str(node.ref.copy_clear_rev()),
+                                                {"remote": node.binary_remote.name, "packages": []})
+                if node.package_id not in download["packages"]:
+                    download["packages"].append(node.package_id)
+            elif node.binary in (BINARY_BUILD, BINARY_MISSING) and node.remote is not None:
+                downloads.setdefault(str(node.ref.copy_clear_rev()), {"remote": node.remote.name, "packages": []})
+    return downloads
+
+
+def prefetch(cache_folder: str, recipe_path: str, builds: list, workers: int = None, env: dict = None) -> dict:
+    """ Resolve the dependency graphs of all builds and download the union of their dependencies in parallel
+
+    The first graph is resolved alone, it fetches most recipes; the others are resolved concurrently.
+    Each reference is downloaded by a single worker, concurrent downloads of a reference would conflict.
+
+    :param cache_folder: The .conan folder of the Conan home
+    :param recipe_path: Path of the recipe of the builds
+    :param builds: Builds of CPT
+    :param workers: Number of concurrent resolutions and downloads, BPT_PREFETCH_WORKERS per default
+    :param env: Additional environment variables, e.g. the credentials
+    :return: Statistics of the prefetch
+    """
+    workers = get_prefetch_workers() if workers is None else workers
+    apis = threading.local()
+
+    def _resolve(build):
+        graph, _ = _get_thread_api(apis, cache_folder).info(recipe_path, **get_graph_arguments(build))
+        return graph
+
+    def _download(item):
+        reference, download = item
+        api = _get_thread_api(apis, cache_folder)
+        with tracing.span("prefetch {}".format(reference), packages=len(download["packages"])):
+            if download["packages"]:
+                api.download(reference, remote_name=download["remote"], packages=download["packages"])
+            else:
+                api.download(reference, remote_name=download["remote"], recipe=True)
+
+    start = time.perf_counter()
+    with tools.environment_append(env or {}), ThreadPoolExecutor(max_workers=workers) as executor:
+        with tracing.span("resolve dependency graphs", builds=len(builds)):
+            graphs = [_resolve(builds[0])]
+            graphs.extend(executor.map(_resolve, builds[1:]))
+        downloads = collect_downloads(graphs)
+        with tracing.span("download dependencies", references=len(downloads)):
+            list(executor.map(_download, sorted(downloads.items())))
+    return {"builds": len(builds), "recipes": len(downloads),
+            "packages": sum(len(download["packages"]) for download in downloads.values()),
+            "duration": time.perf_counter() - start}
+
+
+def prefetch_builder_dependencies(builder, cache_folder: str, recipe_path: str):
+    """ Prefetch the dependencies of the builds of a builder; the builds download them lazily if this fails """
+    builds = [builder.items[index] for index in build_scheduler.get_page_indices(builder)]
+    if not builds:
+        return
+    # CPT adds its remotes only when the builds start
+    builder.remotes_manager.add_remotes_to_conan()
+    printer.print_message("Prefetching the dependencies of {} builds".format(len(builds)))
+    try:
+        statistics = prefetch(cache_folder, recipe_path, builds, env=builder.auth_manager.env_vars())
+    except Exception as exception:
+        printer.print_message("Prefetching the dependencies failed: {}".format(str(exception).strip()))
+        return
+    printer.print_message("Prefetched {} recipes and {} packages for {} builds in {:.1f}s".format(
+        statistics["recipes"], statistics["packages"], statistics["builds"], statistics["duration"]))
@@ -1,16 +1,188 @@
+import hashlib
 import json
 import os
+import re
 import subprocess
 import sys
+import uuid
 import yaml
 
+from bincrafters import build_shared
+from bincrafters import compiler_cache
+from bincrafters import conan_home
+from bincrafters import cppstd_pruning
+from bincrafters import disk_budget
+from bincrafters import tracing
+from bincrafters.step_executor import Step, StepError, run_steps
+
 
 def _flush_output():
     sys.stderr.flush()
     sys.stdout.flush()
 
 
-def prepare_env(platform: str, config: json, select_config: str = None):
+def _format_github_env(variables: dict) -> str:
+    """ Format variables for the $GITHUB_ENV file, values with line breaks use the heredoc syntax """
+    lines = []
+    for var_name, value in variables.items():
+        value = str(value)
+        if "\n" in value or "\r" in value:
+            delimiter = "BPT_EOF_{}".format(uuid.uuid4().hex)
+            lines.append("{}<<{}\n{}\n{}".format(var_name, delimiter, value, delimiter))
+        else:
+            lines.append("{}={}".format(var_name, value))
+    return "".join(line + "\n" for line in lines)
+
+
+def _format_azp_logging_commands(variables: dict) -> str:
+    """ Format variables as Azure Pipelines logging commands, escaped as the agent expects it """
+    lines = []
+    for var_name, value in variables.items():
+        value = str(value).replace("%", "%AZP25").replace("\r", "%0D").replace("\n", "%0A")
+        lines.append("##vso[task.setvariable variable={}]{}".format(var_name, value))
+    return "".join(line + "\n" for line in lines)
+
+
+def get_docker_image_cache():
+    return os.getenv("BPT_DOCKER_IMAGE_CACHE", None) or None
+
+
+def get_docker_image_digest(docker_image: str) -> str:
+    """ Digest of a local image, the image ID if it was never pushed to or pulled from a registry """
+    for template in ["{{index .RepoDigests 0}}", "{{.Id}}"]:
+        output = subprocess.run(["docker", "image", "inspect", "--format", template, docker_image],
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+        if output.returncode == 0 and output.stdout.strip():
+            return output.stdout.strip()
+    return None
+
+
+def get_provisioned_image_archive(image_cache: str, base_digest: str, provisioning: str) -> str:
+    key = hashlib.sha256("{}\n{}".format(base_digest, provisioning).encode("utf-8")).hexdigest()
+    return os.path.join(image_cache, "{}.tar".format(key[:32]))
+
+
+def _provision_docker_image(run, provisioning_commands: list, cleanup_commands: list):
+    """ Provision the image, the step fails if any of the provisioning commands fails """
+    failed_command = next((command for command in provisioning_commands if run(command) != 0), None)
+    for command in cleanup_commands:
+        run(command)
+    if failed_command is not None:
+        raise StepError("Provisioning the image failed: '{}'".format(failed_command))
+
+
+def _provision_cached_docker_image(run, image_cache: str, docker_image: str, provisioning: str,
+                                   provisioning_commands: list, cleanup_commands: list):
+    """ Restore the provisioned image from the cache, or provision it and add it to the cache """
+    base_digest = get_docker_image_digest(docker_image)
+    if base_digest is None:
+        print("Unable to determine the digest of {}, not using the image cache".format(docker_image))
+        _provision_docker_image(run, provisioning_commands, cleanup_commands)
+        return
+
+    archive = get_provisioned_image_archive(image_cache, base_digest, provisioning)
+    if os.path.isfile(archive):
+        print("Restoring provisioned image {} from {}".format(docker_image, archive))
+        if run('docker load -i "{}"'.format(archive)) == 0:
+            # Keep the modification time as last use, for the eviction of old archives
+            os.utime(archive)
+            return
+        print("Loading the cached image failed, provisioning it again")
+
+    # Every later job would load a broken image, only successfully provisioned images get cached
+    _provision_docker_image(run, provisioning_commands, cleanup_commands)
+
+    os.makedirs(image_cache, exist_ok=True)
+    # Save to a temporary file first, so concurrent jobs never load a partial archive
+    temporary_archive = "{}.{}.tmp".format(archive, os.getpid())
+    if run('docker save -o "{}" "{}"'.format(temporary_archive, docker_image)) == 0:
+        os.replace(temporary_archive, archive)
+    elif os.path.exists(temporary_archive):
+        os.remove(temporary_archive)
+
+
+def _find_settings_key(content: str, path: list):
+    """ Offset of the line of a nested key in a YAML document, without parsing it """
+    offset = 0
+    parent_indent = -1
+    child_indent = None
+    remaining = list(path)
+    for line in content.splitlines(True):
+        stripped = line.lstrip(" ")
+        indent = len(line) - len(stripped)
+        if stripped.strip() and not stripped.startswith("#"):
+            if indent <= parent_indent:
+                # Left the block of the parent key
+                return None
+            if child_indent is None:
+                child_indent = indent
+            if indent == child_indent and stripped.startswith("{}:".format(remaining[0])):
+                remaining.pop(0)
+                if not remaining:
+                    return offset + indent
+                parent_indent = indent
+                child_indent = None
+        offset += len(line)
+    return None
+
+
+def add_compiler_version(settings_path: str, compiler: str, version: str) -> bool:
+    """ Add a version to the version list of a compiler in a Conan settings.yml
+
+    The list gets edited as text, so comments, anchors and the formatting of the file stay as they are.
+
+    :param settings_path: Path of the settings.yml
+    :param compiler: Conan compiler name, e.g. "apple-clang"
+    :param version: Version to add
+    :return: False if the version was already listed
+    """
+    with open(settings_path, "r") as f:
+        content = f.read()
+
+    versions = ((yaml.safe_load(content) or {}).get("compiler") or {}).get(compiler, {}).get("version") or []
+    if version in [str(v) for v in versions]:
+        return False
+
+    position = _find_settings_key(content, ["compiler", compiler, "version"])
+    if position is None:
+        raise ValueError("No version list of '{}' found in {}".format(compiler, settings_path))
+    version_match = re.compile(r"version:[ \t]*\[([^\]]*)\]").match(content, position)
+    if not version_match:
+        raise ValueError("The versions of '{}' in {} are not a [...] list".format(compiler, settings_path))
+
+    separator = ", " if version_match.group(1).strip() else ""
+    content = "{}{}\"{}\"{}".format(content[:version_match.end(1)], separator, version,
+                                    content[version_match.end(1):])
+    # Other steps read the file concurrently, never let them see a partial file
+    temporary_file = "{}.{}.tmp".format(settings_path, os.getpid())
+    with open(temporary_file, "w") as f:
+        f.write(content)
+    os.replace(temporary_file, settings_path)
+    return True
+
+
+def _export_env_variables(platform: str, variables: dict):
+    """ Make the variables available to the following CI steps, all at once """
+    if not variables:
+        return
+
+    if platform == "gha":
+        github_env = os.getenv("GITHUB_ENV")
+        if not github_env:
+            print("GITHUB_ENV is not set, skipping the export of the environment variables")
+            return
+        # A single append, so the file never contains a partial set of variables
+        with open(github_env, "a", encoding="utf-8") as f:
+            f.write(_format_github_env(variables))
+
+    if platform == "azp":
+        _flush_output()
+        sys.stdout.write(_format_azp_logging_commands(variables))
+        _flush_output()
+
+
+@tracing.traced
+def prepare_env(platform: str, config: json, select_config: str = None, dry_run: bool = False):
     if platform != "gha" and platform != "azp":
         raise ValueError("Only GitHub Actions and Azure Pipelines is supported at this point.")
 
@@ -20,36 +192,43 @@ def prepare_env(platform: str, config: json, select_config: str = None):
     if select_config:
         config = config[select_config]
 
-    def _proc_run(args, check=False):
-        print(">>", args)
-        _flush_output()
-        subprocess.run(args, shell=True, check=check)
+    env_variables = {}
+    steps = _get_steps(platform=platform, config=config, env_variables=env_variables)
+    try:
+        run_steps(steps, dry_run=dry_run)
+    finally:
+        _export_env_variables(platform=platform, variables=env_variables)
 
+
+def _prune_cppstds(cppstds: list, recipe_path: str, conan_compiler: str, compiler_version: str) -> list:
+    """ Only keep the cppstd values the recipe accepts, all of them if none would be left """
+    min_cppstd, max_cppstd = cppstd_pruning.get_recipe_cppstd_range(recipe_path)
+    pruned = cppstd_pruning.prune_cppstds(cppstds, conan_compiler, compiler_version,
+                                          min_cppstd=min_cppstd, max_cppstd=max_cppstd)
+    if not pruned:
+        # Without CONAN_CPPSTDS CPT would build the default cppstd, which the recipe rejects
+        print("Pruning would remove all {} cppstd values (recipe: {} to {}, {} {}), keeping all of them: {}".format(
+            len(cppstds), min_cppstd or "any", max_cppstd or "any", conan_compiler, compiler_version,
+            ", ".join(cppstds)))
+        return cppstds
+    print("Pruned {} of {} cppstd values (recipe: {} to {}, {} {}): {}".format(
+        len(cppstds) - len(pruned), len(cppstds), min_cppstd or "any", max_cppstd or "any",
+        conan_compiler, compiler_version, ", ".join(pruned)))
+    return pruned
+
+
+def _get_steps(platform: str, config: json, env_variables: dict) -> list:
+    """ Declare the preparation as steps, independent steps get executed concurrently """
     def _set_env_variable(var_name: str, value: str):
         print("{} = {}".format(var_name, value))
         os.environ[var_name] = value
-        if platform == "gha":
-            if compiler in ["VISUAL", "MSVC"]:
-                os.system('echo {}={}>> {}'.format(var_name, value, os.getenv("GITHUB_ENV")))
-            else:
-                _proc_run(
-                    'echo "{}={}" >> $GITHUB_ENV'.format(var_name, value))
-
-        if platform == "azp":
-            if compiler in ["VISUAL", "MSVC"]:
-                _proc_run(
-                    'echo ##vso[task.setvariable variable={}]{}'.format(var_name, value))
-            else:
-                _proc_run(
-                    'echo "##vso[task.setvariable variable={}]{}"'.format(var_name, value))
-
-    _proc_run("conan config init")
+        # Exported to the CI platform in one go at the end of prepare_env
+        env_variables[var_name] = value
 
     compiler = config["compiler"]
     compiler_version = config["version"]
     docker_image = config.get("dockerImage", "")
     build_type = config.get("buildType", "")
-    cppstds = config.get("cppstds", None)
     conan_compiler = {
         "GCC": 'gcc',
         "CLANG": 'clang',
@@ -57,16 +236,10 @@ def prepare_env(platform: str, config: json, select_config: str = None):
         "VISUAL": 'Visual Studio'
     }.get(compiler, str(compiler).lower().replace('_', '-'))
 
-    _set_env_variable("BPT_CWD", config["cwd"])
-    _set_env_variable("CONAN_VERSION", config["recipe_version"])
-    _set_env_variable("CONAN_DOCKER_IMAGE_SKIP_PULL", "True")
-
     if compiler == "APPLE_CLANG":
         if "." not in compiler_version:
             compiler_version = "{}.0".format(compiler_version)
 
-    _set_env_variable("CONAN_{}_VERSIONS".format(compiler), compiler_version)
-
     if compiler == "GCC" or compiler == "CLANG":
         if docker_image == "":
             compiler_lower = compiler.lower()
@@ -77,10 +250,6 @@ def prepare_env(platform: str, config: json, select_config: str = None):
                 docker_image = "conanio/{}{}-ubuntu16.04".format(compiler_lower, version_without_dot)
             else:
                 docker_image = "conanio/{}{}".format(compiler_lower, version_without_dot)
-        _set_env_variable("CONAN_DOCKER_IMAGE", docker_image)
-
-    if build_type != "":
-        _set_env_variable("CONAN_BUILD_TYPES", build_type)
 
     def _get_path(o, *path):
         for k in path:
@@ -91,72 +260,146 @@ def prepare_env(platform: str, config: json, select_config: str = None):
                 break
         return o
 
-    if not cppstds:
-        settings = {}
-        with open(os.path.expanduser(os.path.join("~", ".conan", "settings.yml")), "r") as f:
-            settings = yaml.full_load(f)
-        cppstds = _get_path(settings, "compiler", conan_compiler, "cppstd")
+    def set_environment(run):
+        _set_env_variable("BPT_CWD", config["cwd"])
+        _set_env_variable("CONAN_VERSION", config["recipe_version"])
+        _set_env_variable("CONAN_DOCKER_IMAGE_SKIP_PULL", "True")
+        _set_env_variable("CONAN_{}_VERSIONS".format(compiler), compiler_version)
+
+        if compiler == "GCC" or compiler == "CLANG":
+            _set_env_variable("CONAN_DOCKER_IMAGE", docker_image)
+
+        if build_type != "":
+            _set_env_variable("CONAN_BUILD_TYPES", build_type)
+
+        if config.get("lockfile"):
+            if os.path.isfile(config["lockfile"]):
+                _set_env_variable("BPT_LOCKFILE", os.path.abspath(config["lockfile"]))
+            else:
+                print("Lockfile {} is missing, resolving the dependencies without it".format(config["lockfile"]))
+
+        cppstds = config.get("cppstds", None)
+        if not cppstds:
+            settings = {}
+            with open(os.path.expanduser(os.path.join("~", ".conan", "settings.yml")), "r") as f:
+                settings = yaml.full_load(f)
+            cppstds = _get_path(settings, "compiler", conan_compiler, "cppstd")
+            if cppstds:
+                cppstds = [str(cppstd) for cppstd in cppstds[1:]]
+            if cppstds and cppstd_pruning.is_pruning_enabled():
+                cppstds = _prune_cppstds(cppstds, build_shared.get_recipe_path(config["cwd"]), conan_compiler,
+                                         compiler_version)
+
         if cppstds:
-            cppstds = map(str, cppstds[1:])
+            _set_env_variable("CONAN_CPPSTDS", ",".join(cppstds))
+
+        if platform == "gha" and len(docker_image) > 0:
+            _set_env_variable("CONAN_DOCKER_PIP_COMMAND", "pip3")
+            _set_env_variable("CONAN_DOCKER_HOME", "")
+            _set_env_variable("CONAN_DOCKER_SHELL", "/bin/sh -c")
+            _set_env_variable("CONAN_SYSREQUIRES_SUDO", "0")
 
-    if cppstds:
-        _set_env_variable("CONAN_CPPSTDS", ",".join(cppstds))
+    bootstrap_cache = conan_home.get_bootstrap_cache()
+    if bootstrap_cache:
+        def bootstrap_conan_home(run):
+            conan_home.bootstrap_conan_home(run, bootstrap_cache)
 
-    if platform == "gha" or platform == "azp":
-        if compiler == "APPLE_CLANG":
-            xcode_path = "/Applications/Xcode_{0}.app".format(compiler_version)
-            if os.path.exists(xcode_path):
-                print('executing: xcode-select -switch "{}"'.format(xcode_path))
-                _flush_output()
-                _proc_run(
-                    'sudo xcode-select -switch "{}"'.format(xcode_path))
+        # Includes what the conan-user step does otherwise
+        conan_config_init = Step("conan-config-init", action=bootstrap_conan_home, check=True)
+    else:
+        conan_config_init = Step("conan-config-init", commands=["conan config init"])
 
-            _proc_run(
-                'clang++ --version')
+    steps = [
+        conan_config_init,
+        # Reads the settings.yml created by conan config init
+        Step("environment", action=set_environment, requires=["conan-config-init"]),
+    ]
+
+    if compiler == "APPLE_CLANG":
+        xcode_path = "/Applications/Xcode_{0}.app".format(compiler_version)
+        if os.path.exists(xcode_path):
+            steps.append(Step("xcode-select", commands=['sudo xcode-select -switch "{}"'.format(xcode_path)]))
+        steps.append(Step("clang-version", commands=["clang++ --version"],
+                          requires=["xcode-select"] if os.path.exists(xcode_path) else []))
 
-        if compiler in ["VISUAL", "MSVC"]:
+    if compiler in ["VISUAL", "MSVC"]:
+        def write_powershell_script(run):
             with open(os.path.join(os.path.dirname(__file__), "prepare_env_azp_windows.ps1"), "r") as file:
                 content = file.read()
-                file.close()
 
             with open("execute.ps1", "w", encoding="utf-8") as file:
                 file.write(content)
-                file.close()
-
-            _proc_run("pip install --upgrade cmake", check=True)
-            _proc_run("powershell -file {}".format(os.path.join(os.getcwd(), "execute.ps1")), check=True)
-
-    if platform == "gha" and (compiler == "GCC" or compiler == "CLANG"):
-        _proc_run('docker system prune --all --force --volumes')
-        _proc_run('sudo rm -rf "/usr/local/share/boost"')
-        _proc_run('sudo rm -rf "$AGENT_TOOLSDIRECTORY/CodeQL"')
-        _proc_run('sudo rm -rf "$AGENT_TOOLSDIRECTORY/Ruby"')
-        _proc_run('sudo rm -rf "$AGENT_TOOLSDIRECTORY/boost"')
-        _proc_run('sudo rm -rf "$AGENT_TOOLSDIRECTORY/go"')
-        _proc_run('sudo rm -rf "$AGENT_TOOLSDIRECTORY/node"')
-    
-    def _docker_run(command):
-        _proc_run('docker run {} "{}" /bin/sh -c "{}"'.format(
-            "--name conan_runner",
-            docker_image,
-            command))
-        _proc_run('docker commit conan_runner {}'.format(docker_image))
-        _proc_run('docker stop conan_runner')
-        _proc_run('docker rm conan_runner')
-        _proc_run('docker ps')
-        _proc_run('docker images')
+
+        steps.append(Step("windows-setup", action=write_powershell_script, check=True, commands=[
+            "pip install --upgrade cmake",
+            "powershell -file {}".format(os.path.join(os.getcwd(), "execute.ps1")),
+        ]))
+
+    warm_runner = disk_budget.is_warm_runner()
+    if warm_runner:
+        # Persistent runner: keep the caches, only remove the least recently used entries above the budget
+        def enforce_disk_budget(run):
+            if len(docker_image) > 0:
+                disk_budget.record_docker_image_use(docker_image)
+            disk_budget.enforce_disk_budget(run, protected_images=[docker_image],
+                                            image_cache=get_docker_image_cache())
+
+        # Reads the storage path from the conan.conf of conan config init
+        steps.append(Step("disk-budget", action=enforce_disk_budget, requires=["conan-config-init"]))
+    elif platform == "gha" and (compiler == "GCC" or compiler == "CLANG"):
+        steps.append(Step("docker-prune", commands=["docker system prune --all --force --volumes"]))
+        for name, path in [("boost", "/usr/local/share/boost"),
+                           ("toolcache-codeql", "$AGENT_TOOLSDIRECTORY/CodeQL"),
+                           ("toolcache-ruby", "$AGENT_TOOLSDIRECTORY/Ruby"),
+                           ("toolcache-boost", "$AGENT_TOOLSDIRECTORY/boost"),
+                           ("toolcache-go", "$AGENT_TOOLSDIRECTORY/go"),
+                           ("toolcache-node", "$AGENT_TOOLSDIRECTORY/node")]:
+            steps.append(Step("cleanup-{}".format(name), commands=['sudo rm -rf "{}"'.format(path)]))
 
     if platform == "gha" and len(docker_image) > 0:
-        _proc_run('docker pull "{}"'.format(docker_image))
-        _docker_run("apt update && apt install -y build-essential && apt install -y python3-pip pkg-config && pip3 install --upgrade pip")
-        _set_env_variable("CONAN_DOCKER_PIP_COMMAND", "pip3")
-        _set_env_variable("CONAN_DOCKER_HOME", "")
-        _set_env_variable("CONAN_DOCKER_SHELL", "/bin/sh -c")
-        _set_env_variable("CONAN_SYSREQUIRES_SUDO", "0")
+        provisioning = "apt update && apt install -y build-essential && apt install -y python3-pip pkg-config && pip3 install --upgrade pip"
+        if compiler_cache.is_enabled():
+            provisioning += " && apt install -y ccache"
+        provisioning_commands = [
+            'docker run --name conan_runner "{}" /bin/sh -c "{}"'.format(docker_image, provisioning),
+            'docker commit conan_runner {}'.format(docker_image),
+        ]
+        cleanup_commands = [
+            'docker stop conan_runner',
+            'docker rm conan_runner',
+            'docker ps',
+            'docker images',
+        ]
+        # The prune would remove the pulled image again; the disk budget may evict the archive of the image cache
+        # which the provisioning restores
+        if warm_runner:
+            pull_requires = ["disk-budget"]
+        else:
+            pull_requires = ["docker-prune"] if compiler in ["GCC", "CLANG"] else []
+        steps.append(Step("docker-pull", commands=['docker pull "{}"'.format(docker_image)], requires=pull_requires))
+
+        image_cache = get_docker_image_cache()
+        if image_cache:
+            def provision_docker_image(run):
+                _provision_cached_docker_image(run, image_cache, docker_image, provisioning, provisioning_commands,
+                                               cleanup_commands)
+
+            steps.append(Step("docker-provision", requires=["docker-pull"], action=provision_docker_image))
+        else:
+            steps.append(Step("docker-provision", requires=["docker-pull"],
+                              commands=provisioning_commands + cleanup_commands))
 
     if compiler == "APPLE_CLANG":
-        _proc_run("pip3 install --upgrade yq")
-        _proc_run('''yq -Y -i '.compiler."apple-clang".version |= . + ["%s"]' ${HOME}/.conan/settings.yml'''%(compiler_version))
-        _proc_run('''yq '.compiler."apple-clang".version' ${HOME}/.conan/settings.yml''')
+        def add_apple_clang_version(run):
+            settings_path = os.path.expanduser(os.path.join("~", ".conan", "settings.yml"))
+            if add_compiler_version(settings_path, "apple-clang", compiler_version):
+                print("Added apple-clang {} to {}".format(compiler_version, settings_path))
+            else:
+                print("apple-clang {} is already known to {}".format(compiler_version, settings_path))
+
+        steps.append(Step("apple-clang-settings", action=add_apple_clang_version, requires=["conan-config-init"],
+                          check=True))
 
-    _proc_run("conan user")
+    if not bootstrap_cache:
+        steps.append(Step("conan-user", commands=["conan user"], requires=["conan-config-init"]))
+    return steps
@@ -0,0 +1,192 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import fasteners
+import requests
+
+from bincrafters import download_cache
+from bincrafters import tracing
+
+
+# Latencies measured by a previous run (e.g. the parent of the build scheduler) are reused for a while
+_PROBE_TTL = 600
+# Weight of the previous runs in the hit rate, recent runs count more
+_DECAY = 0.8
+# Hit rate of a remote without any history
+_DEFAULT_HIT_RATE = 0.5
+_MIN_HIT_RATE = 0.05
+
+
+def is_enabled() -> bool:
+    return os.getenv("BPT_REMOTE_PROBING", "false").lower() in ("1", "true", "yes", "y")
+
+
+def get_stats_path() -> str:
+    return os.path.expanduser(os.getenv("BPT_REMOTE_STATS", os.path.join("~", ".bpt", "remote_stats.json")))
+
+
+def get_remote_url(remote) -> str:
+    """ URL of a remote as used by CPT: "url", "url@ssl@name" or [url, ssl, name] """
+    if isinstance(remote, str):
+        return remote.split("@")[0].strip()
+    return remote[0].strip()
+
+
+def load_stats(path: str) -> dict:
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _update_stats(path: str, update):
+    """ Read, modify and write the statistics, concurrent builds may update them at the same time """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with fasteners.InterProcessLock(path + ".lock"):
+        stats = load_stats(path)
+        update(stats)
+        download_cache.write_file(path, json.dumps(stats, indent=2, sort_keys=True))
+
+
+def probe_latency(url: str, attempts: int = 3, timeout: float = 5):
+    """ Round trip time of the ping endpoint of a Conan remote in seconds, the fastest of some attempts
+
+    :return: The latency or None if the remote is not reachable
+    """
+    latencies = []
+    with requests.Session() as session:
+        for _ in range(attempts):
+            start = time.perf_counter()
+            try:
+                session.get("{}/v1/ping".format(url.rstrip("/")), timeout=timeout).raise_for_status()
+            except requests.RequestException:
+                continue
+            latencies.append(time.perf_counter() - start)
+    return min(latencies) if latencies else None
+
+
+def get_hit_rate(record: dict) -> float:
+    if not record or record.get("lookups", 0) < 1:
+        return _DEFAULT_HIT_RATE
+    return record["hits"] / record["lookups"]
+
+
+def get_expected_latency(record: dict):
+    """ Latency per dependency lookup, a remote which rarely has the dependencies only adds to the latency
+
+    :return: The expected latency or None if the remote is not reachable
+    """
+    if record.get("latency") is None:
+        return None
+    return record["latency"] / max(get_hit_rate(record), _MIN_HIT_RATE)
+
+
+def rank_remotes(remotes: list, stats: dict) -> list:
+    """ Order remotes by their expected latency, unreachable ones last; the order of equal ones is kept """
+    def _key(remote):
+        expected_latency = get_expected_latency(stats.get(get_remote_url(remote), {}))
+        return (expected_latency is None, expected_latency or 0)
+    return sorted(remotes, key=_key)
+
+
+def _format_remote(remote, stats: dict) -> str:
+    record = stats.get(get_remote_url(remote), {})
+    if record.get("latency") is None:
+        return "{} (unreachable)".format(get_remote_url(remote))
+    return "{} ({:.0f} ms, hit rate {:.0f} %)".format(get_remote_url(remote), record["latency"] * 1000,
+                                                     get_hit_rate(record) * 100)
+
+
+def order_remotes(remotes: list, printer=None) -> list:
+    """ Probe the latency of the remotes and order them by it and by their recent hit rate
+
+    Only the lookup order of the dependencies changes, the upload remote is configured separately.
+
+    :param remotes: Remotes in the format of CPT
+    :param printer: Printer for the chosen order
+    :return: The ordered remotes
+    """
+    path = get_stats_path()
+    stats = load_stats(path)
+    now = time.time()
+    urls = [get_remote_url(remote) for remote in remotes
+            if now - stats.get(get_remote_url(remote), {}).get("probed", 0) > _PROBE_TTL]
+    if urls:
+        with tracing.span("probe remotes"), ThreadPoolExecutor(max_workers=len(urls)) as executor:
+            latencies = dict(zip(urls, executor.map(probe_latency, urls)))
+
+        def _update(stats):
+            for url, latency in latencies.items():
+                stats.setdefault(url, {}).update({"latency": latency, "probed": now})
+        _update_stats(path, _update)
+        stats = load_stats(path)
+
+    ordered = rank_remotes(remotes, stats)
+    if printer:
+        printer.print_message("Remote order: {}".format(", ".join(_format_remote(remote, stats)
+                                                                   for remote in ordered)))
+    return ordered
+
+
+def apply_remote_order(conan_api, remotes: list):
+    """ Move the configured Conan remotes into the order of the ranked remotes
+
+    CPT only appends the remotes which don't exist yet, remotes with the same URL keep their place in the
+    remote list of the Conan cache. Remotes which are not ranked follow after the ranked ones.
+
+    :param conan_api: Conan API of the cache, e.g. the one of the builder
+    :param remotes: Ranked remotes in the format of CPT
+    """
+    configured = {remote.url: remote for remote in conan_api.remote_list()}
+    index = 0
+    for url in [get_remote_url(remote) for remote in remotes]:
+        remote = configured.pop(url, None)
+        if remote:
+            conan_api.remote_update(remote.name, remote.url, verify_ssl=remote.verify_ssl, insert=index)
+            index += 1
+
+
+def get_downloads(packages_summary: list, remote_urls: dict) -> dict:
+    """ Count the recipes and packages downloaded from each remote
+
+    :param packages_summary: Summary of CPT, with the results of all builds
+    :param remote_urls: Mapping of the remote names to their URLs
+    :return: Dict of URL and number of downloads
+    """
+    downloads = {}
+    for build in packages_summary:
+        for installed in build.get("package", {}).get("installed", []):
+            for item in [installed["recipe"]] + installed.get("packages", []):
+                if item.get("downloaded") and item.get("remote") in remote_urls:
+                    url = remote_urls[item["remote"]]
+                    downloads[url] = downloads.get(url, 0) + 1
+    return downloads
+
+
+def record_downloads(remotes: list, downloads: dict, path: str = None):
+    """ Update the hit rates: every configured remote was asked for all downloads, some of them had them
+
+    :param remotes: URLs of the configured remotes
+    :param downloads: Dict of URL and number of downloads from it
+    :param path: Statistics file, BPT_REMOTE_STATS per default
+    """
+    total = sum(downloads.values())
+    if total == 0:
+        return
+
+    def _update(stats):
+        for url in remotes:
+            record = stats.setdefault(url, {})
+            record["hits"] = record.get("hits", 0) * _DECAY + downloads.get(url, 0)
+            record["lookups"] = record.get("lookups", 0) * _DECAY + total
+    _update_stats(path or get_stats_path(), _update)
+
+
+def record_builder_downloads(builder):
+    """ Update the hit rates with the downloads of the builds of a builder """
+    remote_urls = {remote.name: remote.url for remote in builder.conan_api.remote_list()}
+    downloads = get_downloads(builder.packages_summary, remote_urls)
+    record_downloads(list(remote_urls.values()), downloads)
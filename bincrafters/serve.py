@@ -0,0 +1,118 @@
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from contextlib import contextmanager
+
+from bincrafters.autodetect import autodetect, autodetect_directory_structure
+from bincrafters.build_shared import printer
+from bincrafters.generate_ci_jobs import generate_ci_jobs
+from bincrafters.serve_client import get_socket_path
+from bincrafters import file_cache
+
+
+@contextmanager
+def _client_context(cwd: str, env: dict):
+    """ Answer a request in the working directory and with the environment of the client """
+    previous_cwd = os.getcwd()
+    previous_env = dict(os.environ)
+    os.chdir(cwd)
+    os.environ.clear()
+    os.environ.update(env)
+    try:
+        yield
+    finally:
+        os.environ.clear()
+        os.environ.update(previous_env)
+        os.chdir(previous_cwd)
+
+
+class _Server(socketserver.UnixStreamServer):
+    # Requests change the working directory and the environment of the process, they are answered one by one
+    def __init__(self, socket_path: str):
+        super().__init__(socket_path, _RequestHandler)
+        self.started = time.time()
+        self.requests = 0
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        start = time.perf_counter()
+        try:
+            request = json.loads(line.decode("utf-8"))
+            output = handle_request(self.server, request)
+            response = {"output": output, "error": None}
+        except Exception as error:
+            request = {}
+            response = {"output": None, "error": str(error) or type(error).__name__}
+        response["duration"] = time.perf_counter() - start
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+        if request.get("command") == "shutdown":
+            # shutdown() waits for serve_forever(), which runs in this thread
+            threading.Thread(target=self.server.shutdown).start()
+
+
+def handle_request(server, request: dict):
+    """ Execute a request of a client
+
+    :return: The output of the command, a string or a dict
+    """
+    server.requests += 1
+    command = request["command"]
+    arguments = request.get("arguments", {})
+    if command == "stats":
+        return dict(file_cache.get_statistics(), requests=server.requests,
+                    uptime=time.time() - server.started)
+    if command == "shutdown":
+        return "Shutting down"
+
+    with _client_context(request["cwd"], request["env"]):
+        if command == "generate-ci-jobs":
+            return generate_ci_jobs(platform=arguments.get("platform"),
+                                    split_by_build_types=arguments.get("split_by_build_types"),
+                                    lockfile_dir=arguments.get("lockfiles"))
+        if command == "autodetect":
+            return {"recipe_type": autodetect(), "directory_structure": autodetect_directory_structure()}
+    raise Exception("Unknown command {}".format(command))
+
+
+def _remove_stale_socket(socket_path: str):
+    if not os.path.exists(socket_path):
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        try:
+            connection.connect(socket_path)
+        except OSError:
+            os.remove(socket_path)
+            return
+    raise Exception("A daemon is already listening on {}".format(socket_path))
+
+
+def create_server(socket_path: str = None) -> _Server:
+    """ Create the daemon; it keeps the recipe inspections and git queries of all requests in memory
+
+    :param socket_path: Unix socket to listen on, BPT_SERVE_SOCKET per default
+    """
+    socket_path = socket_path or get_socket_path()
+    _remove_stale_socket(socket_path)
+    server = _Server(socket_path)
+    # Requests run with the environment of the client, only its user may connect
+    os.chmod(socket_path, 0o600)
+    file_cache.enable()
+    return server
+
+
+def serve(socket_path: str = None):
+    server = create_server(socket_path)
+    printer.print_message("Listening on {}".format(server.server_address))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(server.server_address)
+        file_cache.disable()
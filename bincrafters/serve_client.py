@@ -0,0 +1,129 @@
+# Thin client of the serve daemon, it only uses the standard library to start without the import cost of Conan
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+# Commands of a cold invocation, which answer the same request as the daemon
+_COLD_COMMANDS = {
+    "generate-ci-jobs": lambda arguments: [sys.executable, "-m", "bincrafters.cli", "generate-ci-jobs"] + [
+        "--{}={}".format(name.replace("_", "-"), value) for name, value in arguments.items() if value is not None],
+    "autodetect": lambda arguments: [sys.executable, "-c", "from bincrafters.autodetect import autodetect, "
+                                     "autodetect_directory_structure; "
+                                     "print(autodetect(), autodetect_directory_structure())"],
+}
+
+
+def get_socket_path() -> str:
+    default_name = "bpt_serve_{}.sock".format(os.getuid() if hasattr(os, "getuid") else "user")
+    return os.getenv("BPT_SERVE_SOCKET", None) or os.path.join(tempfile.gettempdir(), default_name)
+
+
+def request(command: str, arguments: dict = None, socket_path: str = None, timeout: float = None) -> dict:
+    """ Send a request to the daemon, in the working directory and with the environment of this process
+
+    :param command: generate-ci-jobs, autodetect, stats or shutdown
+    :param arguments: Arguments of the command
+    :param socket_path: Socket of the daemon, BPT_SERVE_SOCKET per default
+    :param timeout: Timeout in seconds, None to wait for the answer
+    :return: The response, with the output of the command
+    """
+    payload = {"command": command, "arguments": arguments or {}, "cwd": os.getcwd(), "env": dict(os.environ)}
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.settimeout(timeout)
+        connection.connect(socket_path or get_socket_path())
+        connection.sendall(json.dumps(payload).encode("utf-8") + b"\n")
+        with connection.makefile("rb") as f:
+            line = f.readline()
+    if not line:
+        raise Exception("The daemon closed the connection without an answer")
+    response = json.loads(line.decode("utf-8"))
+    if response.get("error"):
+        raise Exception(response["error"])
+    return response
+
+
+def benchmark(command: str, arguments: dict, repetitions: int = 5, socket_path: str = None) -> dict:
+    """ Measure the latency of cold invocations and of requests to the running daemon
+
+    :return: Dict with the latencies in seconds of the "cold" and the "warm" runs
+    """
+    latencies = {"cold": [], "warm": []}
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        subprocess.run(_COLD_COMMANDS[command](arguments), check=True, stdout=subprocess.DEVNULL)
+        latencies["cold"].append(time.perf_counter() - start)
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        request(command, arguments, socket_path=socket_path)
+        latencies["warm"].append(time.perf_counter() - start)
+    return latencies
+
+
+def format_benchmark(latencies: dict) -> str:
+    lines = ["{:<6} {:>10} {:>10} {:>10}".format("", "min", "median", "max")]
+    for name in ["cold", "warm"]:
+        values = latencies[name]
+        lines.append("{:<6} {:>9.1f}ms {:>9.1f}ms {:>9.1f}ms".format(
+            name, min(values) * 1000, statistics.median(values) * 1000, max(values) * 1000))
+    lines.append("Speedup of the median: {:.1f}x".format(
+        statistics.median(latencies["cold"]) / max(statistics.median(latencies["warm"]), 1e-9)))
+    return "\n".join(lines)
+
+
+def _add_query_parsers(subparsers):
+    genmatrix = subparsers.add_parser("generate-ci-jobs", help="Provides a CI job matrix as a JSON-fied string")
+    genmatrix.add_argument('--platform', type=str, choices=["gha", "azp"], help="Specfies the CI platform")
+    genmatrix.add_argument('--split-by-build-types', type=str, choices=["true", "false"],
+                           help="Split build jobs by build types")
+    genmatrix.add_argument('--lockfiles', type=str,
+                           help="Directory for Conan lockfiles of the jobs, which get referenced in the matrix")
+    subparsers.add_parser("autodetect", help="Prints the recipe type and the directory structure")
+
+
+def _parse_arguments(*args):
+    parser = argparse.ArgumentParser(description="Client of bincrafters-package-tools serve")
+    parser.add_argument('--socket', type=str, help="Socket of the daemon, default: BPT_SERVE_SOCKET")
+    subparsers = parser.add_subparsers(dest="commands")
+    _add_query_parsers(subparsers)
+    subparsers.add_parser("stats", help="Prints the statistics of the daemon")
+    subparsers.add_parser("shutdown", help="Stops the daemon")
+    benchmark_parser = subparsers.add_parser("benchmark", help="Compares the latency of cold invocations and "
+                                                                "requests to the daemon")
+    benchmark_parser.add_argument('-n', '--repetitions', type=int, default=5, help="Runs of each variant")
+    _add_query_parsers(benchmark_parser.add_subparsers(dest="query"))
+    return parser.parse_args(*args)
+
+
+def _get_query_arguments(arguments) -> dict:
+    return {name: value for name, value in vars(arguments).items()
+            if name in ("platform", "split_by_build_types", "lockfiles")}
+
+
+def run(*args):
+    arguments = _parse_arguments(*args)
+    if arguments.commands == "benchmark":
+        latencies = benchmark(arguments.query, _get_query_arguments(arguments), arguments.repetitions,
+                              socket_path=arguments.socket)
+        print(format_benchmark(latencies))
+        return
+    output = request(arguments.commands, _get_query_arguments(arguments), socket_path=arguments.socket)["output"]
+    print(output if isinstance(output, str) else json.dumps(output, indent=2))
+
+
+def cli():
+    run(sys.argv[1:])
+
+
+if __name__ == '__main__':
+    try:
+        sys.exit(cli())
+    except Exception as error:
+        print("ERROR: {}".format(error))
+        sys.exit(1)
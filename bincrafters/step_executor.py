@@ -0,0 +1,165 @@
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from bincrafters import tracing
+
+
+class Step(object):
+    """ A named unit of work which only starts after all its required steps finished
+
+    :param name: Unique name, used as prefix of the output
+    :param commands: Shell commands which get executed one after another
+    :param action: Callable which gets executed in-process before the commands; it gets passed a function
+                   run(command, check=...) -> int to execute further commands as part of this step
+    :param requires: Names of the steps which have to finish first
+    :param check: Whether a failing command fails the whole execution, otherwise it only gets reported
+    """
+    def __init__(self, name: str, commands: list = None, action=None, requires: list = None, check: bool = False):
+        self.name = name
+        self.commands = commands or []
+        self.action = action
+        self.requires = requires or []
+        self.check = check
+
+
+class StepError(Exception):
+    pass
+
+
+def sort_steps(steps: list) -> list:
+    """ Return the steps in an order in which every step comes after its requirements """
+    by_name = {}
+    for step in steps:
+        if step.name in by_name:
+            raise StepError("Step '{}' is declared twice".format(step.name))
+        by_name[step.name] = step
+    for step in steps:
+        for requirement in step.requires:
+            if requirement not in by_name:
+                raise StepError("Step '{}' requires unknown step '{}'".format(step.name, requirement))
+
+    result = []
+    done = set()
+    remaining = list(steps)
+    while remaining:
+        ready = [step for step in remaining if all(requirement in done for requirement in step.requires)]
+        if not ready:
+            raise StepError("Cyclic requirements between the steps {}".format(
+                ", ".join(step.name for step in remaining)))
+        for step in ready:
+            result.append(step)
+            done.add(step.name)
+            remaining.remove(step)
+    return result
+
+
+def format_plan(steps: list) -> str:
+    lines = []
+    for step in sort_steps(steps):
+        requires = " (after {})".format(", ".join(step.requires)) if step.requires else ""
+        lines.append("{}{}".format(step.name, requires))
+        if step.action is not None:
+            lines.append("    <in-process> {}".format(getattr(step.action, "__name__", "action")))
+        for command in step.commands:
+            lines.append("    >> {}".format(command))
+    return "\n".join(lines)
+
+
+class _Execution(object):
+    def __init__(self):
+        self.failed = None
+        self._lock = threading.Lock()
+        self._processes = set()
+
+    def output(self, step: Step, line: str):
+        with self._lock:
+            sys.stdout.write("[{}] {}\n".format(step.name, line.rstrip("\r\n")))
+            sys.stdout.flush()
+
+    def fail(self, step: Step, reason: str):
+        with self._lock:
+            if self.failed is None:
+                self.failed = (step.name, reason)
+            processes = list(self._processes)
+        # Fail fast: stop the commands of all other running steps
+        for process in processes:
+            process.terminate()
+
+    def run_command(self, step: Step, command: str) -> int:
+        self.output(step, ">> {}".format(command))
+        with tracing.command_span(command):
+            process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                       universal_newlines=True, errors="replace")
+            with self._lock:
+                self._processes.add(process)
+            try:
+                for line in process.stdout:
+                    self.output(step, line)
+                return process.wait()
+            finally:
+                with self._lock:
+                    self._processes.discard(process)
+
+    def run_checked(self, step: Step, command: str, check: bool) -> int:
+        if self.failed is not None:
+            raise StepError("Cancelled, step '{}' failed".format(self.failed[0]))
+        returncode = self.run_command(step, command)
+        if returncode != 0:
+            if check:
+                raise StepError("'{}' returned {}".format(command, returncode))
+            self.output(step, "'{}' returned {}, continuing".format(command, returncode))
+        return returncode
+
+    def run_step(self, step: Step):
+        def _run(command: str, check: bool = step.check) -> int:
+            return self.run_checked(step, command, check)
+
+        with tracing.span("step {}".format(step.name)):
+            if step.action is not None:
+                step.action(_run)
+            for command in step.commands:
+                if self.failed is not None:
+                    return
+                _run(command)
+
+
+def run_steps(steps: list, jobs: int = None, dry_run: bool = False):
+    """ Execute the steps concurrently, respecting their requirements
+
+    After the first failure no further steps are started and running commands are terminated.
+    """
+    ordered = sort_steps(steps)
+    if dry_run:
+        print(format_plan(ordered))
+        return
+
+    execution = _Execution()
+    done = set()
+    pending = list(ordered)
+    running = {}
+    with ThreadPoolExecutor(max_workers=jobs or max(1, len(ordered))) as executor:
+        while pending or running:
+            if execution.failed is None:
+                for step in [step for step in pending if all(name in done for name in step.requires)]:
+                    pending.remove(step)
+                    running[executor.submit(execution.run_step, step)] = step
+            if not running:
+                break
+
+            finished, _ = wait(list(running.keys()), return_when=FIRST_COMPLETED)
+            for future in finished:
+                step = running.pop(future)
+                error = future.exception()
+                if error is not None:
+                    execution.fail(step, str(error))
+                else:
+                    done.add(step.name)
+
+    if execution.failed is not None:
+        name, reason = execution.failed
+        skipped = [step.name for step in pending]
+        if skipped:
+            print("Skipped steps: {}".format(", ".join(skipped)))
+        raise StepError("Step '{}' failed: {}".format(name, reason))
@@ -0,0 +1,115 @@
+import json
+import sys
+import time
+
+
+class _NoMeasurement(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NO_MEASUREMENT = _NoMeasurement()
+
+
+class _Measurement(object):
+    def __init__(self, collector, phase: str):
+        self._collector = collector
+        self._phase = phase
+        self._start = 0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self._collector.add(self._phase, time.perf_counter() - self._start)
+        return False
+
+
+class _Recipe(object):
+    def __init__(self, collector, recipe: str):
+        self._collector = collector
+        self._recipe = recipe
+        self._previous = None
+
+    def __enter__(self):
+        self._previous = self._collector.recipe
+        self._collector.recipe = self._recipe
+        return self
+
+    def __exit__(self, *args):
+        self._collector.recipe = self._previous
+        return False
+
+
+class _Collector(object):
+    def __init__(self):
+        self.recipe = None
+        self._start = time.perf_counter()
+        self._phases = {}
+        self._recipes = {}
+
+    @staticmethod
+    def _add_to(phases: dict, phase: str, duration: float):
+        entry = phases.setdefault(phase, {"count": 0, "time": 0.0})
+        entry["count"] += 1
+        entry["time"] += duration
+
+    def add(self, phase: str, duration: float):
+        self._add_to(self._phases, phase, duration)
+        if self.recipe is not None:
+            self._add_to(self._recipes.setdefault(self.recipe, {}), phase, duration)
+
+    def report(self) -> dict:
+        return {"total": time.perf_counter() - self._start,
+                "phases": self._phases,
+                "recipes": self._recipes}
+
+
+_collector = None
+
+
+def enable():
+    global _collector
+    _collector = _Collector()
+
+
+def disable():
+    global _collector
+    _collector = None
+
+
+def is_enabled() -> bool:
+    return _collector is not None
+
+
+def measure(phase: str):
+    """ Context manager which adds the duration of the enclosed block to a phase, e.g. "git" or "yaml" """
+    if _collector is None:
+        return _NO_MEASUREMENT
+    return _Measurement(_collector, phase)
+
+
+def recipe(name: str):
+    """ Context manager which attributes all measurements of the enclosed block to a recipe """
+    if _collector is None:
+        return _NO_MEASUREMENT
+    return _Recipe(_collector, name)
+
+
+def get_report() -> dict:
+    return _collector.report() if _collector is not None else {}
+
+
+def write_report(path: str = "-"):
+    """ Write the collected timings as JSON to a file, or to stderr for "-" """
+    data = json.dumps(get_report(), indent=2)
+    if path == "-":
+        sys.stderr.write(data + "\n")
+        sys.stderr.flush()
+    else:
+        with open(path, "w") as f:
+            f.write(data + "\n")
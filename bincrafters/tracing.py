@@ -0,0 +1,148 @@
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+
+# Trace file in the Chrome trace event format, e.g. for chrome://tracing or https://ui.perfetto.dev
+# Child processes and later CI steps append their events to the same file
+BPT_TRACE_FILE = "BPT_TRACE_FILE"
+# Start a new trace instead of appending to an existing file, only honored by the top-level process
+BPT_TRACE_RESET = "BPT_TRACE_RESET"
+# Set by the top-level process, its child processes never reset the trace
+_BPT_TRACE_OWNER = "_BPT_TRACE_OWNER"
+
+
+class _NoSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class _Span(object):
+    def __init__(self, tracer, name: str, args: dict):
+        self._tracer = tracer
+        self._name = name
+        self._args = args
+        self._start = 0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.perf_counter()
+        if exc_type is not None:
+            self._args["error"] = str(exc_value) or exc_type.__name__
+        self._tracer.add_event(self._name, self._start, end, self._args)
+        return False
+
+
+def _is_reset_requested() -> bool:
+    return os.getenv(BPT_TRACE_RESET, "false").lower() in ("1", "true", "yes", "y")
+
+
+def _start_trace_file(path: str):
+    """ Write the opening bracket if the trace file doesn't exist yet or is empty
+
+    The closing bracket is optional in the JSON array format, which allows appending.
+    """
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+    except FileExistsError:
+        if os.path.getsize(path) > 0:
+            return
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+    try:
+        os.write(fd, b"[\n")
+    finally:
+        os.close(fd)
+
+
+class _Tracer(object):
+    def __init__(self, path: str):
+        self._path = path
+        self._events = []
+        self._lock = threading.Lock()
+        # perf_counter has no defined epoch, anchor it to the wall clock to align processes
+        self._offset = time.time() - time.perf_counter()
+
+        if not os.getenv(_BPT_TRACE_OWNER):
+            os.environ[_BPT_TRACE_OWNER] = str(os.getpid())
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+            # Separate CI steps append to the same trace, it only gets truncated on request
+            if _is_reset_requested() and os.path.exists(path):
+                os.remove(path)
+        _start_trace_file(path)
+
+        self._events.append({"name": "process_name", "ph": "M", "pid": os.getpid(), "tid": 0,
+                             "args": {"name": " ".join(["bincrafters-package-tools"] + sys.argv[1:2])}})
+        atexit.register(self.flush)
+
+    def add_event(self, name: str, start: float, end: float, args: dict):
+        event = {"name": name, "cat": "bpt", "ph": "X",
+                 "ts": int((start + self._offset) * 1000000), "dur": int((end - start) * 1000000),
+                 "pid": os.getpid(), "tid": threading.get_ident(), "args": args}
+        with self._lock:
+            self._events.append(event)
+
+    def flush(self):
+        with self._lock:
+            events, self._events = self._events, []
+        if not events:
+            return
+        data = "".join(json.dumps(event, default=str) + ",\n" for event in events)
+        # A single write in append mode keeps the events of concurrent processes apart
+        fd = os.open(self._path, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+        try:
+            os.write(fd, data.encode("utf-8"))
+        finally:
+            os.close(fd)
+
+
+_tracer = None
+if os.getenv(BPT_TRACE_FILE):
+    _tracer = _Tracer(os.getenv(BPT_TRACE_FILE))
+
+
+def is_enabled() -> bool:
+    return _tracer is not None
+
+
+def span(name: str, **args):
+    """ Context manager which records the enclosed block as a span
+
+    Nested spans are shown nested in the trace viewer. Without BPT_TRACE_FILE this returns a shared no-op object.
+    """
+    if _tracer is None:
+        return _NO_SPAN
+    return _Span(_tracer, name, args)
+
+
+def command_span(command):
+    """ Span for an external command, the command line is recorded as argument """
+    if _tracer is None:
+        return _NO_SPAN
+    if not isinstance(command, str):
+        command = " ".join(str(arg) for arg in command)
+    return _Span(_tracer, "$ {}".format(" ".join(command.split()[:2])), {"command": command})
+
+
+def traced(function):
+    """ Decorator which records every call of the function as a span """
+    @functools.wraps(function)
+    def _wrapper(*args, **kwargs):
+        if _tracer is None:
+            return function(*args, **kwargs)
+        with _Span(_tracer, function.__qualname__, {}):
+            return function(*args, **kwargs)
+    return _wrapper
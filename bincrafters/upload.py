@@ -0,0 +1,202 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+
+import requests
+from requests.adapters import HTTPAdapter
+from conans.client.cache.cache import ClientCache
+from conans.client.cmd.uploader import UPLOAD_POLICY_FORCE
+from conans.client.conan_api import ConanAPIV1
+from conans.client.output import ConanOutput
+from conans.model.ref import ConanFileReference, PackageReference
+
+from bincrafters.build_shared import printer
+from bincrafters import tracing
+
+
+# Printed by Conan when the remote already has the artifact
+_RECIPE_UP_TO_DATE = "Recipe is up to date, upload skipped"
+_PACKAGE_UP_TO_DATE = "Package is up to date, upload skipped"
+
+
+def get_upload_workers() -> int:
+    return max(1, int(os.getenv("BPT_UPLOAD_WORKERS", 4)))
+
+
+def get_upload_backoff() -> float:
+    return float(os.getenv("BPT_UPLOAD_BACKOFF", 2))
+
+
+class DeferredUploader(object):
+    """ Stand-in for the uploader of CPT, which only collects what CPT would upload right after each build """
+
+    def __init__(self):
+        self.artifacts = []
+
+    def upload_recipe(self, reference, upload):
+        if upload:
+            self._add(str(reference), None)
+
+    def upload_packages(self, reference, upload, package_id):
+        if upload:
+            self._add(str(reference), None)
+            self._add(str(reference), package_id)
+
+    def _add(self, reference: str, package_id):
+        if (reference, package_id) not in self.artifacts:
+            self.artifacts.append((reference, package_id))
+
+
+def get_local_artifacts(cache_folder: str, reference: str, only_recipe: bool = False) -> list:
+    """ The recipe and all packages of a reference in a Conan cache
+
+    :param cache_folder: The .conan folder of a Conan home
+    :param reference: Reference of the recipe
+    :param only_recipe: Skip the packages
+    :return: List of (reference, package ID) tuples, the package ID of the recipe is None
+    """
+    layout = ClientCache(cache_folder, ConanOutput(StringIO())).package_layout(ConanFileReference.loads(reference))
+    artifacts = [(reference, None)]
+    if not only_recipe:
+        artifacts.extend((reference, package_id) for package_id in sorted(layout.package_ids()))
+    return artifacts
+
+
+def _get_size(path: str) -> int:
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            size += os.path.getsize(os.path.join(root, name))
+    return size
+
+
+def _get_artifact_size(cache: ClientCache, reference: str, package_id) -> int:
+    """ Size of the compressed files of an uploaded artifact, Conan keeps them in the cache """
+    ref = ConanFileReference.loads(reference)
+    layout = cache.package_layout(ref)
+    if package_id is None:
+        return _get_size(layout.download_export())
+    return _get_size(layout.download_package(PackageReference(ref, package_id)))
+
+
+def _upload_artifact(get_api, reference: str, package_id, remote: str, force: bool, retries: int,
+                     backoff: float) -> str:
+    """ Upload the recipe or a single package, with an exponential backoff between the attempts
+
+    :return: "uploaded" or "skipped" if the remote already has it
+    """
+    attempt = 0
+    while True:
+        api, stream = get_api()
+        stream.seek(0)
+        stream.truncate()
+        try:
+            api.upload(reference, package=package_id, remote_name=remote, confirm=True, retry=0, retry_wait=0,
+                       policy=UPLOAD_POLICY_FORCE if force else None)
+            up_to_date = _RECIPE_UP_TO_DATE if package_id is None else _PACKAGE_UP_TO_DATE
+            return "skipped" if up_to_date in stream.getvalue() else "uploaded"
+        except Exception as exception:
+            if attempt >= retries:
+                printer.print_message("Upload of {} failed".format(_get_name(reference, package_id)),
+                                      stream.getvalue())
+                raise
+            delay = backoff * 2 ** attempt
+            attempt += 1
+            printer.print_message("Upload of {} failed ({}), retrying in {:.1f}s".format(
+                _get_name(reference, package_id), str(exception).strip(), delay))
+            time.sleep(delay)
+
+
+def _get_name(reference: str, package_id) -> str:
+    return reference if package_id is None else "{}:{}".format(reference, package_id)
+
+
+def upload_artifacts(cache_folder: str, artifacts: list, remote: str, force: bool = False, retries: int = 3,
+                     workers: int = None, backoff: float = None, credentials: tuple = None) -> dict:
+    """ Upload recipes and packages to a remote with a pool of workers sharing their connections
+
+    Recipes are uploaded first, Conan refuses packages without their recipe. The packages of different
+    references are uploaded concurrently, the ones of a reference one after another: Conan only locks the
+    writers of its metadata.json, not the readers.
+
+    :param cache_folder: The .conan folder of the Conan home which holds the artifacts
+    :param artifacts: List of (reference, package ID) tuples, the package ID of a recipe is None
+    :param remote: Name of the remote
+    :param force: Upload even if the remote has a newer revision
+    :param retries: Number of retries of each artifact
+    :param workers: Number of concurrent uploads, BPT_UPLOAD_WORKERS per default
+    :param backoff: Delay in seconds before the first retry, doubled for every further one,
+                    BPT_UPLOAD_BACKOFF per default
+    :param credentials: User and password for the remote, otherwise the token of the Conan home is used
+    :return: Statistics of the upload
+    """
+    workers = get_upload_workers() if workers is None else workers
+    backoff = get_upload_backoff() if backoff is None else backoff
+    recipes = [artifact for artifact in artifacts if artifact[1] is None]
+    packages = [artifact for artifact in artifacts if artifact[1] is not None]
+    package_groups = {}
+    for artifact in packages:
+        package_groups.setdefault(artifact[0], []).append(artifact)
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    # Every Conan API call creates a new app, so each thread needs its own API; the session is shared
+    apis = threading.local()
+
+    def _get_api():
+        if not hasattr(apis, "api"):
+            apis.stream = StringIO()
+            apis.api = ConanAPIV1(cache_folder=cache_folder, output=ConanOutput(apis.stream), http_requester=session)
+        return apis.api, apis.stream
+
+    def _upload(artifact):
+        with tracing.span("upload {}".format(_get_name(*artifact))):
+            return _upload_artifact(_get_api, artifact[0], artifact[1], remote, force, retries, backoff)
+
+    def _upload_group(group):
+        return [_upload(artifact) for artifact in group]
+
+    start = time.perf_counter()
+    try:
+        if credentials and all(credentials):
+            # The token is stored in the Conan home, the API of every worker thread uses it
+            _get_api()[0].authenticate(credentials[0], credentials[1], remote)
+        states = dict(zip(recipes, [_upload(artifact) for artifact in recipes]))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for group, group_states in zip(package_groups.values(),
+                                           executor.map(_upload_group, package_groups.values())):
+                states.update(zip(group, group_states))
+    finally:
+        session.close()
+    duration = time.perf_counter() - start
+
+    cache = ClientCache(cache_folder, ConanOutput(StringIO()))
+    size = sum(_get_artifact_size(cache, reference, package_id)
+               for (reference, package_id), state in states.items() if state == "uploaded")
+    states = list(states.values())
+    return {"artifacts": len(states), "uploaded": states.count("uploaded"), "skipped": states.count("skipped"),
+            "size": size, "duration": duration}
+
+
+def format_statistics(statistics: dict) -> str:
+    size = statistics["size"] / (1024 * 1024)
+    return "Uploaded {} of {} artifacts ({} already on the remote), {:.1f} MiB in {:.1f}s ({:.1f} MiB/s)".format(
+        statistics["uploaded"], statistics["artifacts"], statistics["skipped"], size, statistics["duration"],
+        size / max(statistics["duration"], 0.001))
+
+
+def upload_builder_artifacts(builder, cache_folder: str, artifacts: list) -> dict:
+    """ Upload artifacts to the upload remote of a builder, with its credentials and upload settings """
+    if not artifacts:
+        return None
+    remote = builder.remotes_manager.upload_remote_name
+    printer.print_message("Uploading {} artifacts to '{}'".format(len(artifacts), remote))
+    statistics = upload_artifacts(cache_folder, artifacts, remote, force=builder.upload_force,
+                                  retries=int(builder.upload_retry or 0),
+                                  credentials=builder.auth_manager.get_user_password(remote))
+    printer.print_message(format_statistics(statistics))
+    return statistics
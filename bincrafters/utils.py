@@ -1,17 +1,23 @@
 import subprocess
 import os
 
+from bincrafters import file_cache
+from bincrafters import timings
+from bincrafters import tracing
+
 
 def _utils_execute_script(script: str, remove_newlines: bool = True) -> str:
-    output = subprocess.run(script,
-                            capture_output=True,
-                            shell=True)
+    with tracing.command_span(script), timings.measure("git"):
+        output = subprocess.run(script,
+                                capture_output=True,
+                                shell=True)
     result = output.stdout.decode("utf-8")
     if remove_newlines:
         result = output.stdout.decode("utf-8").replace("\n", "")
     return result
 
 
+@file_cache.cached(file_cache.get_git_state_paths)
 def utils_git_get_default_branch(remote: str = "origin") -> str:
     return _utils_execute_script("git remote show {} | grep 'HEAD branch' | sed 's/.*: //'".format(remote))
 
@@ -30,10 +36,12 @@ def utils_git_get_current_branch() -> str:
     return repobranch_azp or repobranch_gha or repobranch_git
 
 
+@file_cache.cached(file_cache.get_git_state_paths)
 def utils_git_get_current_commit() -> str:
     return _utils_execute_script("git rev-parse HEAD")
 
 
+@file_cache.cached(file_cache.get_git_state_paths)
 def utils_git_get_changed_dirs(base: str, head: str = None) -> list:
     if not head:
         # Per default lets get the diff between the provided base and the commit before that
@@ -56,10 +64,11 @@ def utils_file_contains(file, word):
     :param word: word to be found
     :return: True if found. Otherwise, False
     """
-    if os.path.isfile(file):
-        with open(file) as ifd:
-            content = ifd.read()
-            if word in content:
-                return True
+    with timings.measure("file_probe"):
+        if os.path.isfile(file):
+            with open(file) as ifd:
+                content = ifd.read()
+                if word in content:
+                    return True
     return False
 
@@ -0,0 +1,161 @@
+import ast
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import yaml
+
+from bincrafters.autodetect import DIR_STRUCTURE_CCI, autodetect_directory_structure
+from bincrafters.build_shared import printer
+from bincrafters import tracing
+
+
+_BUILD_VALUES = ["full", "minimal", "none"]
+
+
+def _get_class_attributes(tree: ast.Module) -> dict:
+    """ Attributes with a constant value of all classes of a recipe, e.g. name and version of the ConanFile """
+    attributes = {}
+    for node in tree.body:
+        if not isinstance(node, ast.ClassDef):
+            continue
+        for statement in node.body:
+            if isinstance(statement, ast.Assign) and isinstance(statement.value, ast.Constant):
+                for target in statement.targets:
+                    if isinstance(target, ast.Name):
+                        attributes[target.id] = statement.value.value
+    return attributes
+
+
+def _load_yaml(path: str, problems: list):
+    try:
+        with open(path, "r") as f:
+            return yaml.safe_load(f) or {}
+    except (OSError, yaml.YAMLError) as error:
+        problems.append("{}: {}".format(path, str(error).replace("\n", " ")))
+        return None
+
+
+def _parse_recipe(recipe_path: str) -> (dict, list):
+    try:
+        with open(recipe_path, "r") as f:
+            tree = ast.parse(f.read(), filename=recipe_path)
+    except OSError as error:
+        return {}, ["{}: {}".format(recipe_path, error)]
+    except SyntaxError as error:
+        return {}, ["{}:{}: syntax error: {}".format(recipe_path, error.lineno, error.msg)]
+
+    attributes = _get_class_attributes(tree)
+    if not attributes.get("name"):
+        return attributes, ["{}: the recipe has no name".format(recipe_path)]
+    return attributes, []
+
+
+def validate_recipe(recipe_path: str) -> list:
+    """ Check that a recipe parses and has a name, without executing it
+
+    :return: List of problems
+    """
+    _, problems = _parse_recipe(recipe_path)
+    return problems
+
+
+def validate_conandata(conandata_path: str, versions: list = None) -> list:
+    """ Check that the conandata.yml has sources for all versions
+
+    :param conandata_path: Path of the conandata.yml
+    :param versions: Versions which need sources, None if the sources must only not be empty
+    :return: List of problems
+    """
+    problems = []
+    conandata = _load_yaml(conandata_path, problems)
+    if conandata is None:
+        return problems
+    sources = conandata.get("sources") if isinstance(conandata, dict) else None
+    if not isinstance(sources, dict) or not sources:
+        return ["{}: no sources".format(conandata_path)]
+    for version in versions or []:
+        if str(version) not in (str(key) for key in sources):
+            problems.append("{}: no sources for version {}".format(conandata_path, version))
+    return problems
+
+
+def validate_config_yml(config_path: str) -> list:
+    """ Check that a config.yml references existing recipe folders, with valid recipes and conandata.yml files
+
+    :return: List of problems
+    """
+    problems = []
+    config = _load_yaml(config_path, problems)
+    if config is None:
+        return problems
+    versions = config.get("versions") if isinstance(config, dict) else None
+    if not isinstance(versions, dict) or not versions:
+        return ["{}: no versions".format(config_path)]
+
+    folders = {}
+    for version, attributes in versions.items():
+        if not isinstance(attributes, dict) or "folder" not in attributes:
+            problems.append("{}: version {} has no folder".format(config_path, version))
+            continue
+        if attributes.get("build", "full") not in _BUILD_VALUES:
+            problems.append("{}: version {} has an unknown build value {}".format(
+                config_path, version, attributes["build"]))
+        folder = os.path.join(os.path.dirname(config_path), str(attributes["folder"]))
+        if not os.path.isfile(os.path.join(folder, "conanfile.py")):
+            problems.append("{}: version {} references the folder {} without a conanfile.py".format(
+                config_path, version, attributes["folder"]))
+            continue
+        folders.setdefault(folder, []).append(version)
+
+    for folder, folder_versions in folders.items():
+        problems.extend(validate_recipe(os.path.join(folder, "conanfile.py")))
+        conandata_path = os.path.join(folder, "conandata.yml")
+        if os.path.isfile(conandata_path):
+            problems.extend(validate_conandata(conandata_path, folder_versions))
+    return problems
+
+
+def validate_recipe_directory(path: str) -> list:
+    """ Validate a recipe directory of any of the supported directory structures
+
+    :return: List of problems
+    """
+    config_path = os.path.join(path, "config.yml")
+    recipe_path = os.path.join(path, "conanfile.py")
+    if os.path.isfile(recipe_path):
+        attributes, problems = _parse_recipe(recipe_path)
+        conandata_path = os.path.join(path, "conandata.yml")
+        if os.path.isfile(conandata_path) and attributes.get("version"):
+            problems.extend(validate_conandata(conandata_path, [attributes["version"]]))
+        elif os.path.isfile(conandata_path):
+            # Recipes without a version get built for all versions of the conandata.yml
+            problems.extend(validate_conandata(conandata_path))
+        return problems
+    if os.path.isfile(config_path):
+        return validate_config_yml(config_path)
+    return ["{}: neither a conanfile.py nor a config.yml".format(path)]
+
+
+def get_recipe_directories() -> list:
+    if autodetect_directory_structure() == DIR_STRUCTURE_CCI:
+        return sorted(os.path.join("recipes", entry.name) for entry in os.scandir("recipes") if entry.is_dir())
+    return ["."]
+
+
+@tracing.traced
+def validate(workers: int = None) -> list:
+    """ Validate all recipes of the working directory in parallel
+
+    :param workers: Number of recipes validated concurrently, the number of cores per default
+    :return: List of problems
+    """
+    start = time.perf_counter()
+    directories = get_recipe_directories()
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        problems = [problem for result in executor.map(validate_recipe_directory, directories) for problem in result]
+    for problem in problems:
+        print(problem)
+    printer.print_message("Validated {} recipe directories in {:.0f}ms: {} problem(s)".format(
+        len(directories), (time.perf_counter() - start) * 1000, len(problems)))
+    return problems
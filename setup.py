@@ -122,6 +122,7 @@ setup(
     entry_points={
         'console_scripts': [
             'bincrafters-package-tools=bincrafters.cli:cli',
+            'bincrafters-package-tools-client=bincrafters.serve_client:cli',
         ],
     },
 )
@@ -0,0 +1,104 @@
+import os
+import shutil
+import socket
+import subprocess
+import time
+
+import pytest
+
+
+_SERVER_CONF = """[server]
+jwt_secret: secret
+jwt_expire_minutes: 120
+ssl_enabled: False
+port: {port}
+public_port:
+host_name: localhost
+authorize_timeout: 1800
+disk_storage_path: ./data
+disk_authorize_timeout: 1800
+updown_secret: updown
+
+[write_permissions]
+*/*@*/*: *
+
+[read_permissions]
+*/*@*/*: *
+
+[users]
+demo: demo
+"""
+
+
+def _get_free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture()
+def free_port():
+    """ A local port which nothing listens on """
+    return _get_free_port()
+
+
+@pytest.fixture()
+def recipe_folder(tmp_path, monkeypatch):
+    """ A copy of the fixture recipe as working directory, for the CI matrix """
+    folder = os.path.join(str(tmp_path), "recipe")
+    os.makedirs(folder)
+    shutil.copy(os.path.join(os.path.dirname(__file__), "conanfile.py"), folder)
+    monkeypatch.chdir(folder)
+    monkeypatch.setenv("BPT_CONFIG_FILE_VERSION", "11")
+    return folder
+
+
+@pytest.fixture(scope="session")
+def conan_server(tmp_path_factory):
+    """ A local Conan server as stand-in for a remote, user demo with password demo can write everything """
+    server_home = str(tmp_path_factory.mktemp("server"))
+    port = _get_free_port()
+    with open(os.path.join(server_home, "server.conf"), "w") as f:
+        f.write(_SERVER_CONF.format(port=port))
+    process = subprocess.Popen(["conan_server"], env=dict(os.environ, CONAN_SERVER_HOME=server_home),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            socket.create_connection(("localhost", port), timeout=1).close()
+            break
+        except OSError:
+            time.sleep(0.1)
+    yield "http://localhost:{}".format(port)
+    process.terminate()
+    process.wait()
+
+
+def _run_conan(command: str, user_home: str, cwd: str = None):
+    env = dict(os.environ, CONAN_USER_HOME=user_home)
+    for name in ["CONAN_LOGIN_USERNAME", "CONAN_PASSWORD", "CONAN_REMOTES"]:
+        env.pop(name, None)
+    subprocess.run(command, shell=True, check=True, cwd=cwd, env=env, stdout=subprocess.DEVNULL)
+
+
+@pytest.fixture(scope="session")
+def run_conan():
+    """ Runs a Conan command in a Conan home, without the credentials and remotes of the environment """
+    return _run_conan
+
+
+@pytest.fixture(scope="session")
+def new_conan_home():
+    """ Initializes a Conan home without remotes, optionally with the local server as remote "local"
+
+    Called as new_conan_home(user_home, remote=None, login=False, revisions=False), returns the user home.
+    """
+    def _new_conan_home(user_home: str, remote: str = None, login: bool = False, revisions: bool = False) -> str:
+        _run_conan("conan remote clean", user_home)
+        if remote:
+            _run_conan("conan remote add local {}".format(remote), user_home)
+        if login:
+            _run_conan("conan user demo -p demo -r local", user_home)
+        if revisions:
+            _run_conan("conan config set general.revisions_enabled=1", user_home)
+        return user_home
+    return _new_conan_home
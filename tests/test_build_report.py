@@ -0,0 +1,142 @@
+import json
+import os
+import subprocess
+import sys
+from types import SimpleNamespace
+
+import cpt.packager
+import pytest
+
+from bincrafters import build_report
+
+
+build_output = """
+Requirements
+    foobar/0.1.0@bincrafters/stable from local cache - Cache
+    zlib/1.2.11 from 'conancenter' - Downloaded
+Packages
+    bzip2/1.0.8:5be2b7a2110ec8acdbf9a1cea9de5d60747edb34 - Cache
+    foobar/0.1.0@bincrafters/stable:6af9cc7cb931c5ad942174fd7838eb655717c709 - Build
+    openssl/1.1.1q:d5e6ac0c08b1a4fdf24d5f3ee2fc1dbf32ea4cfe - Build
+    zlib/1.2.11:6af9cc7cb931c5ad942174fd7838eb655717c709 - Download
+
+Packages
+    zlib/1.2.11:6af9cc7cb931c5ad942174fd7838eb655717c709 - Cache
+"""
+
+
+def test_dependency_statistics():
+    statistics = build_report.get_dependency_statistics(build_output, "foobar/0.1.0@bincrafters/stable")
+    assert {"cache": 1, "download": 1, "build": 1} == statistics
+
+
+def test_dependency_statistics_empty():
+    assert {"cache": 0, "download": 0, "build": 0} == build_report.get_dependency_statistics("")
+
+
+def test_build_description():
+    settings = {"compiler": "gcc", "compiler.version": "9", "arch": "x86_64", "build_type": "Release"}
+    options = {"foobar:shared": True}
+    assert "gcc 9 x86_64 Release shared=True" == build_report.get_build_description(settings, options)
+
+
+def test_summary_table():
+    builds = [
+        {"number": 1, "returncode": 0, "wall_time": 12.34, "cpu_time": 40.0, "max_rss": 512.4,
+         "dependencies": {"cache": 1, "download": 2, "build": 0}, "description": "gcc 9 Release"},
+        {"number": 2, "returncode": 1, "wall_time": 3.0, "cpu_time": None, "max_rss": None,
+         "dependencies": {}, "description": "gcc 9 Debug"},
+    ]
+    lines = build_report.format_summary_table(builds).splitlines()
+    assert 3 == len(lines)
+    assert lines[0].startswith("#  Result")
+    assert "12.3s" in lines[1] and "512MiB" in lines[1] and "1/2/0" in lines[1]
+    assert "FAILED" in lines[2] and " - " in lines[2]
+
+
+def test_summary_table_storage():
+    builds = [
+        {"number": 1, "returncode": 0, "storage": "memory", "description": "gcc 9 Release"},
+        {"number": 2, "returncode": 0, "storage": "spilled to disk", "description": "gcc 9 Debug"},
+    ]
+    lines = build_report.format_summary_table(builds).splitlines()
+    assert "Storage" in lines[0]
+    assert "memory" in lines[1]
+    assert "spilled to disk" in lines[2]
+    assert "Storage" not in build_report.format_summary_table([{"number": 1, "returncode": 0}])
+
+
+def test_summary_table_fail_fast():
+    builds = [
+        {"number": 1, "returncode": 1, "description": "gcc 9 Release"},
+        {"number": 2, "returncode": -15, "cancelled": True, "description": "gcc 9 Debug"},
+        {"number": 3, "returncode": None, "skipped": True, "description": "gcc 9 MinSizeRel"},
+    ]
+    lines = build_report.format_summary_table(builds).splitlines()
+    assert "FAILED" in lines[1]
+    assert "CANCELLED" in lines[2]
+    assert "SKIPPED" in lines[3]
+
+
+_RESULTS = {"error": False, "installed": [
+    {"recipe": {"id": "foobar/0.1.0@bincrafters/stable", "dependency": False},
+     "packages": [{"id": "6af9cc7cb931c5ad942174fd7838eb655717c709", "built": True, "downloaded": False}]},
+    {"recipe": {"id": "zlib/1.2.11", "dependency": True},
+     "packages": [{"id": "6af9cc7cb931c5ad942174fd7838eb655717c709", "built": False, "downloaded": True}]},
+    {"recipe": {"id": "bzip2/1.0.8", "dependency": True},
+     "packages": [{"id": "5be2b7a2110ec8acdbf9a1cea9de5d60747edb34", "built": False, "downloaded": False}]},
+    {"recipe": {"id": "openssl/1.1.1q", "dependency": True},
+     "packages": [{"id": "d5e6ac0c08b1a4fdf24d5f3ee2fc1dbf32ea4cfe", "built": True, "downloaded": False}]},
+]}
+
+
+def test_installed_statistics():
+    assert {"cache": 1, "download": 1, "build": 1} == build_report.get_installed_statistics(_RESULTS)
+    assert {"cache": 0, "download": 0, "build": 0} == build_report.get_installed_statistics({"installed": []})
+
+
+class _FakeRunner(object):
+    def __init__(self, succeed: bool):
+        self.succeed = succeed
+        self.results = None
+
+    def run(self):
+        if not self.succeed:
+            raise Exception("Error building")
+        # A compiler which needs more memory than anything before
+        subprocess.run([sys.executable, "-c", "b = bytearray(256 * 1024 * 1024)"], check=True)
+        self.results = _RESULTS
+
+
+def test_collect_builder_report(monkeypatch, tmp_path):
+    report_path = os.path.join(str(tmp_path), "report.json")
+    monkeypatch.setenv("BPT_BUILD_REPORT", report_path)
+    monkeypatch.setattr(cpt.packager, "CreateRunner", _FakeRunner)
+    builder = SimpleNamespace(builds_in_current_page=[
+        SimpleNamespace(settings={"compiler": "gcc", "build_type": build_type}, options={})
+        for build_type in ["Release", "Debug", "MinSizeRel"]])
+
+    with pytest.raises(Exception):
+        with build_report.collect_builder_report(builder) as report:
+            cpt.packager.CreateRunner(True).run()
+            cpt.packager.CreateRunner(False).run()
+    assert _FakeRunner is cpt.packager.CreateRunner
+
+    with open(report_path, "r") as f:
+        assert report == json.load(f)
+    assert ["OK", "FAILED", "SKIPPED"] == [build_report.get_result(build) for build in report["builds"]]
+    assert 1 == report["failures"]
+    assert report["builds"][0]["wall_time"] is not None
+    assert {"cache": 1, "download": 1, "build": 1} == report["builds"][0]["dependencies"]
+    if build_report.resource is not None:
+        assert report["builds"][0]["max_rss"] >= 256
+    assert report["builds"][1]["max_rss"] is None
+    assert "gcc Debug" == report["builds"][1]["description"]
+
+
+def test_collect_builder_report_disabled(monkeypatch):
+    monkeypatch.delenv("BPT_BUILD_REPORT", raising=False)
+    runner_class = cpt.packager.CreateRunner
+    with build_report.collect_builder_report(SimpleNamespace()) as report:
+        assert report is None
+        assert runner_class is cpt.packager.CreateRunner
@@ -0,0 +1,121 @@
+import os
+import subprocess
+import sys
+import tempfile
+from types import SimpleNamespace
+
+import pytest
+from cpt.builds_generator import BuildConf
+
+from bincrafters import build_scheduler
+
+
+@pytest.fixture()
+def set_parallel_builds_auto(monkeypatch):
+    monkeypatch.setenv("BPT_PARALLEL_BUILDS", "auto")
+
+
+def test_parallel_builds_default():
+    assert 1 == build_scheduler.get_parallel_builds()
+    assert not build_scheduler.is_scheduler_enabled()
+
+
+def test_parallel_builds_auto(set_parallel_builds_auto):
+    assert (os.cpu_count() or 1) == build_scheduler.get_parallel_builds()
+
+
+def test_job_layout_divides_cores():
+    assert (4, 16) == build_scheduler.get_job_layout(build_count=8, requested_jobs=4, cpu_count=64)
+
+
+def test_job_layout_limited_by_builds():
+    assert (2, 32) == build_scheduler.get_job_layout(build_count=2, requested_jobs=8, cpu_count=64)
+
+
+def test_job_layout_limited_by_memory():
+    assert (3, 21) == build_scheduler.get_job_layout(build_count=12, requested_jobs=12, cpu_count=64,
+                                                     memory=6500, memory_per_build=2048)
+
+
+def test_job_layout_limited_by_cores():
+    assert (2, 2) == build_scheduler.get_job_layout(build_count=12, requested_jobs=12, cpu_count=4,
+                                                    min_cpus_per_build=2)
+
+
+def test_job_layout_never_below_one():
+    assert (1, 1) == build_scheduler.get_job_layout(build_count=4, requested_jobs=4, cpu_count=1,
+                                                    memory=100, min_cpus_per_build=4)
+
+
+def test_report_keeps_execution_model(monkeypatch):
+    monkeypatch.setenv("BPT_BUILD_REPORT", "report.json")
+    assert not build_scheduler.is_scheduler_enabled()
+
+
+@pytest.fixture()
+def set_fail_fast(monkeypatch):
+    monkeypatch.setenv("BPT_FAIL_FAST", "first")
+
+
+def test_max_failures(monkeypatch):
+    assert build_scheduler.get_max_failures() is None
+    for value, max_failures in [("off", None), ("first", 1), ("true", 1), ("3", 3)]:
+        monkeypatch.setenv("BPT_FAIL_FAST", value)
+        assert max_failures == build_scheduler.get_max_failures()
+
+
+def test_fail_fast_policy_enables_scheduler(monkeypatch):
+    # CPT stops at the first failed build on its own, only a later stop needs the scheduler
+    for value, enabled in [("", False), ("off", False), ("0", False), ("first", False), ("true", False),
+                           ("1", False), ("3", True)]:
+        monkeypatch.setenv("BPT_FAIL_FAST", value)
+        assert enabled == build_scheduler.is_scheduler_enabled()
+
+
+@pytest.mark.skipif(not hasattr(os, "killpg"), reason="Process groups are POSIX only")
+def test_cancellation_terminates_running_builds():
+    cancellation = build_scheduler._Cancellation(max_failures=2)
+    process = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"], start_new_session=True)
+    cancellation.register(process)
+    assert not cancellation.add_failure()
+    assert process.poll() is None
+    assert cancellation.add_failure()
+    assert cancellation.is_cancelled()
+    assert process.wait(timeout=10) != 0
+    cancellation.unregister(process)
+    # Builds which start afterwards are terminated right away
+    process = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"], start_new_session=True)
+    cancellation.register(process)
+    assert process.wait(timeout=10) != 0
+
+
+def test_fail_fast_skips_remaining_builds(set_fail_fast, monkeypatch, tmp_path):
+    started = []
+    homes = []
+
+    def _run_build(env, log_path, stream, cancellation):
+        started.append(env["CONAN_CURRENT_PAGE"])
+        homes.append(env["CONAN_USER_HOME"])
+        with open(log_path, "w") as log:
+            log.write("Build {}\n".format(env["CONAN_CURRENT_PAGE"]))
+        return {"returncode": 1 if env["CONAN_CURRENT_PAGE"] == "1" else 0, "wall_time": 1.0,
+                "cpu_time": None, "max_rss": None}
+
+    monkeypatch.setattr(build_scheduler, "_run_build", _run_build)
+    monkeypatch.setenv("CONAN_USER_HOME", str(tmp_path))
+    temp_dir = os.path.join(str(tmp_path), "tmp")
+    os.makedirs(temp_dir)
+    monkeypatch.setattr(tempfile, "tempdir", temp_dir)
+    builds = [BuildConf({"build_type": build_type}, {}, {}, {}, "foobar/1.0@bincrafters/testing")
+              for build_type in ["Release", "Debug", "RelWithDebInfo"]]
+    builder = SimpleNamespace(items=builds, curpage=1, total_pages=1, use_docker=False,
+                              reference="foobar/1.0@bincrafters/testing", _upload_enabled=lambda: False)
+    with pytest.raises(Exception, match="1 of 3 builds failed: 1, 2 cancelled or skipped: 2, 3"):
+        build_scheduler.run_builds(builder)
+    assert ["1"] == started
+    # The Conan homes of the slots are removed, the logs are kept
+    assert not os.path.exists(homes[0])
+    logs_dirs = os.listdir(temp_dir)
+    assert 1 == len(logs_dirs) and logs_dirs[0].startswith("bpt_build_logs_")
+    with open(os.path.join(temp_dir, logs_dirs[0], "0_build_0.log"), "r") as log:
+        assert "Build 1\n" == log.read()
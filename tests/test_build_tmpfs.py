@@ -0,0 +1,66 @@
+import os
+from collections import namedtuple
+
+import pytest
+
+from bincrafters import build_tmpfs
+
+
+_Reference = namedtuple("_Reference", ["name", "version", "user", "channel"])
+_REFERENCE = _Reference("foobar", "1.0.0", None, None)
+
+
+@pytest.fixture()
+def host_tmpfs(tmp_path, monkeypatch):
+    host_tmpfs = str(tmp_path / "shm")
+    os.makedirs(host_tmpfs)
+    monkeypatch.setattr(build_tmpfs, "_HOST_TMPFS", host_tmpfs)
+    return host_tmpfs
+
+
+def test_tmpfs_size_from_memory():
+    assert 3072 == build_tmpfs.get_tmpfs_size(jobs=2, memory=10240, memory_per_build=2048)
+    assert build_tmpfs.get_tmpfs_size(jobs=4, memory=8192, memory_per_build=2048) is None
+    assert build_tmpfs.get_tmpfs_size(jobs=1, memory=None) is None
+
+
+def test_tmpfs_size_from_env(monkeypatch):
+    monkeypatch.setenv("BPT_TMPFS_SIZE", "2G")
+    assert 2048 == build_tmpfs.get_tmpfs_size(jobs=8, memory=1024)
+
+
+def test_build_folder():
+    assert os.path.join("data", "foobar", "1.0.0", "_", "_", "build") \
+        == build_tmpfs.get_build_folder("data", _REFERENCE)
+    assert os.path.join("data", "foobar", "1.0.0", "bincrafters", "stable", "build") \
+        == build_tmpfs.get_build_folder("data", _Reference("foobar", "1.0.0", "bincrafters", "stable"))
+
+
+def test_docker_build_env(tmp_path):
+    storage = str(tmp_path)
+    env = build_tmpfs.get_build_env({"CONAN_DOCKER_ENTRY_SCRIPT": "umask 0000",
+                                     "CONAN_DOCKER_RUN_OPTIONS": "-v a:b"},
+                                    storage, _REFERENCE, 1024, use_docker=True, name="0")
+    build_folder = build_tmpfs.get_build_folder(storage, _REFERENCE)
+    assert env["CONAN_DOCKER_ENTRY_SCRIPT"].startswith("umask 0000 && mkdir -p ")
+    assert env["CONAN_DOCKER_ENTRY_SCRIPT"].endswith("ln -s '/tmp/bpt_build' '{}'".format(build_folder))
+    assert "-v a:b --tmpfs /tmp/bpt_build:rw,exec,size=1024m,mode=1777" == env["CONAN_DOCKER_RUN_OPTIONS"]
+
+
+def test_native_build_env(tmp_path, host_tmpfs):
+    storage = str(tmp_path / "data")
+    env = build_tmpfs.get_build_env({"FOO": "bar"}, storage, _REFERENCE, 1, use_docker=False, name="3")
+    assert {"FOO": "bar"} == env
+
+    build_folder = build_tmpfs.get_build_folder(storage, _REFERENCE)
+    target = os.readlink(build_folder)
+    assert host_tmpfs == os.path.dirname(target)
+    assert os.path.isdir(target)
+
+    build_tmpfs.release_build_folder(build_folder)
+    assert not os.path.lexists(build_folder)
+    assert not os.path.exists(target)
+
+
+def test_native_build_env_without_space(tmp_path, host_tmpfs):
+    assert build_tmpfs.get_build_env({}, str(tmp_path), _REFERENCE, 1024 ** 3, use_docker=False, name="0") is None
@@ -0,0 +1,45 @@
+import json
+
+import pytest
+
+from bincrafters.ci_job import Job
+from bincrafters.generate_ci_jobs import generate_ci_jobs, iter_ci_jobs
+
+
+def test_job_dict_round_trip():
+    config = {"name": "GCC 9 Debug", "compiler": "GCC", "version": "9", "os": "ubuntu-latest",
+              "dockerImage": "teeks99/gcc-ubuntu:9", "buildType": "Debug", "cwd": "./", "recipe_version": "1.0",
+              "cppstds": ["17"]}
+    job = Job.from_dict(config)
+    assert "teeks99/gcc-ubuntu:9" == job.docker_image
+    assert "Debug" == job.build_type
+    assert {"cppstds": ["17"]} == job.extra
+    assert config == job.to_dict()
+    assert list(config) == list(job.to_dict())
+    assert job == job.copy()
+    assert not hasattr(job, "__dict__")
+
+
+def test_job_mapping_access():
+    job = Job("Windows VS 2019", "VISUAL", "16", "windows-2019")
+    assert "VISUAL" == job["compiler"]
+    assert "" == job.get("dockerImage", "")
+    assert "buildType" not in job
+    with pytest.raises(KeyError):
+        job["lockfile"]
+    job["lockfile"] = "job.lock"
+    assert "job.lock" == job.lockfile
+    assert {"name": "Windows VS 2019", "compiler": "VISUAL", "version": "16", "os": "windows-2019",
+            "lockfile": "job.lock"} == job.to_dict()
+
+
+def test_iter_ci_jobs(recipe_folder):
+    jobs = iter_ci_jobs(platform="gha", split_by_build_types=True)
+    first = next(jobs)
+    assert isinstance(first, Job)
+    assert "Release" == first.build_type
+    assert "./" == first.cwd
+    all_jobs = [first] + list(jobs)
+    assert {"config": [job.to_dict() for job in all_jobs]} == json.loads(
+        generate_ci_jobs(platform="gha", split_by_build_types=True))
+    assert [] == list(iter_ci_jobs(platform="travis"))
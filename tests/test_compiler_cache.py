@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+from bincrafters import compiler_cache
+
+
+@pytest.fixture(autouse=True)
+def set_ccache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("BPT_CCACHE_DIR", str(tmp_path))
+
+
+def test_ccache_dir_per_docker_image(tmp_path):
+    assert os.path.join(str(tmp_path), "conanio_gcc9") == compiler_cache.get_ccache_dir("conanio/gcc9")
+    assert os.path.join(str(tmp_path), "native") == compiler_cache.get_ccache_dir()
+
+
+def test_setup_ccache_docker(monkeypatch):
+    monkeypatch.setenv("CONAN_DOCKER_RUN_OPTIONS", "--cpus 2")
+    ccache_dir = compiler_cache.setup_ccache("conanio/gcc9")
+    options = os.environ["CONAN_DOCKER_RUN_OPTIONS"]
+    assert os.path.isdir(ccache_dir)
+    assert options.startswith("--cpus 2 -v '{}':'/tmp/ccache'".format(ccache_dir))
+    assert "-e CCACHE_DIR=/tmp/ccache" in options
+    assert "-e CMAKE_CXX_COMPILER_LAUNCHER=ccache" in options
+
+
+def test_parse_statistics_ccache4():
+    output = "stats_updated_timestamp\t1700000000\ndirect_cache_hit\t12\npreprocessed_cache_hit\t3\ncache_miss\t5\n"
+    assert {"direct_cache_hit": 12, "preprocessed_cache_hit": 3, "cache_miss": 5} \
+        == compiler_cache.parse_statistics(output)
+
+
+def test_parse_statistics_ccache3():
+    output = """cache directory                     /tmp/ccache
+primary config                      /tmp/ccache/ccache.conf
+cache hit (direct)                     7
+cache hit (preprocessed)               1
+cache miss                             2
+files in cache                        20
+"""
+    assert {"direct_cache_hit": 7, "preprocessed_cache_hit": 1, "cache_miss": 2} \
+        == compiler_cache.parse_statistics(output)
+
+
+def test_format_statistics():
+    before = {"direct_cache_hit": 10, "preprocessed_cache_hit": 0, "cache_miss": 10}
+    after = {"direct_cache_hit": 16, "preprocessed_cache_hit": 2, "cache_miss": 12}
+    assert "ccache: 8 hits (6 direct, 2 preprocessed), 2 misses, hit rate 80.0 %" \
+        == compiler_cache.format_statistics(before, after)
+    assert "ccache: no compilations" == compiler_cache.format_statistics(after, after)
@@ -0,0 +1,65 @@
+import os
+import subprocess
+
+import pytest
+
+from bincrafters import conan_home
+
+
+@pytest.fixture(autouse=True)
+def set_conan_user_home(tmp_path, monkeypatch):
+    monkeypatch.setenv("CONAN_USER_HOME", str(tmp_path / "home"))
+
+
+def _run(command: str, check: bool = True) -> int:
+    return subprocess.run(command, shell=True, check=check).returncode
+
+
+def _get_config(key: str) -> str:
+    return subprocess.run(["conan", "config", "get", key], check=True, stdout=subprocess.PIPE,
+                          universal_newlines=True).stdout.strip()
+
+
+def test_bootstrap_archive_key():
+    archive = conan_home.get_bootstrap_archive("cache", {"general.revisions_enabled": "1"})
+    assert archive == conan_home.get_bootstrap_archive("cache", {"general.revisions_enabled": "1"})
+    assert "cache" == os.path.dirname(archive)
+    assert archive != conan_home.get_bootstrap_archive("cache", {"general.revisions_enabled": "0"})
+
+
+def test_bootstrap_archive_key_depends_on_profile():
+    gcc_9 = [["compiler", "gcc"], ["compiler.version", "9"]]
+    gcc_11 = [["compiler", "gcc"], ["compiler.version", "11"]]
+    config_values = {"general.revisions_enabled": "1"}
+    assert conan_home.get_bootstrap_archive("cache", config_values, gcc_9) \
+        == conan_home.get_bootstrap_archive("cache", config_values, gcc_9)
+    assert conan_home.get_bootstrap_archive("cache", config_values, gcc_9) \
+        != conan_home.get_bootstrap_archive("cache", config_values, gcc_11)
+    assert conan_home.get_bootstrap_archive("cache", config_values) \
+        == conan_home.get_bootstrap_archive("cache", config_values, conan_home.get_default_profile_settings())
+
+
+def test_set_config_values():
+    conan_home.set_config_values({"general.revisions_enabled": "1", "storage.download_cache": "/tmp/foo"})
+    assert "1" == _get_config("general.revisions_enabled")
+    assert "/tmp/foo" == _get_config("storage.download_cache")
+    # Everything else is still there
+    assert _get_config("storage.path").endswith("data")
+
+
+def test_bootstrap_conan_home(tmp_path, monkeypatch):
+    bootstrap_cache = str(tmp_path / "bootstrap")
+    os.makedirs(bootstrap_cache)
+    config_values = {"general.revisions_enabled": "1"}
+    conan_home.bootstrap_conan_home(_run, bootstrap_cache, config_values)
+    assert [os.path.basename(conan_home.get_bootstrap_archive(bootstrap_cache, config_values))] \
+        == os.listdir(bootstrap_cache)
+
+    commands = []
+    monkeypatch.setenv("CONAN_USER_HOME", str(tmp_path / "bootstrapped"))
+    conan_home.bootstrap_conan_home(lambda command, check=True: commands.append(command),
+                                    bootstrap_cache, config_values)
+    assert [] == commands
+    for name in ["conan.conf", "settings.yml", "remotes.json", os.path.join("profiles", "default")]:
+        assert os.path.isfile(os.path.join(conan_home.get_conan_home(), name))
+    assert "1" == _get_config("general.revisions_enabled")
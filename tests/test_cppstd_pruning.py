@@ -0,0 +1,76 @@
+import os
+import tempfile
+
+from bincrafters import cppstd_pruning
+
+
+_CPPSTDS = ["98", "gnu98", "11", "gnu11", "14", "gnu14", "17", "gnu17", "20", "gnu20", "23", "gnu23"]
+
+
+def _write_recipe(content: str) -> str:
+    recipe_path = os.path.join(tempfile.mkdtemp(), "conanfile.py")
+    with open(recipe_path, "w") as f:
+        f.write(content)
+    return recipe_path
+
+
+def test_recipe_cppstd_range_literal():
+    recipe = _write_recipe("""
+class FoobarConan(ConanFile):
+    def validate(self):
+        if self.settings.compiler.get_safe("cppstd"):
+            tools.check_min_cppstd(self, "17")
+            check_max_cppstd(self, 20)
+""")
+    assert ("17", "20") == cppstd_pruning.get_recipe_cppstd_range(recipe)
+
+
+def test_recipe_cppstd_range_property():
+    recipe = _write_recipe("""
+class FoobarConan(ConanFile):
+    @property
+    def _min_cppstd(self):
+        return "14"
+
+    def validate(self):
+        check_min_cppstd(self, self._min_cppstd)
+""")
+    assert ("14", None) == cppstd_pruning.get_recipe_cppstd_range(recipe)
+
+
+def test_recipe_cppstd_range_loosest_bound():
+    recipe = _write_recipe("""
+class FoobarConan(ConanFile):
+    def validate(self):
+        check_min_cppstd(self, "11")
+        if self.options.with_ranges:
+            check_min_cppstd(self, "20")
+""")
+    assert ("11", None) == cppstd_pruning.get_recipe_cppstd_range(recipe)
+
+
+def test_recipe_cppstd_range_unknown():
+    recipe = _write_recipe("""
+class FoobarConan(ConanFile):
+    def validate(self):
+        check_min_cppstd(self, self._min_cppstd[str(self.settings.compiler)])
+""")
+    assert (None, None) == cppstd_pruning.get_recipe_cppstd_range(recipe)
+    assert (None, None) == cppstd_pruning.get_recipe_cppstd_range(os.path.join(tempfile.mkdtemp(), "conanfile.py"))
+
+
+def test_prune_cppstds_recipe_range():
+    assert ["17", "gnu17", "20", "gnu20"] == cppstd_pruning.prune_cppstds(_CPPSTDS, "gcc", "11", min_cppstd="17")
+    assert ["14", "gnu14"] == cppstd_pruning.prune_cppstds(_CPPSTDS, "gcc", "11", min_cppstd="14",
+                                                           max_cppstd="14")
+
+
+def test_prune_cppstds_compiler_support():
+    assert ["98", "gnu98", "11", "gnu11", "14", "gnu14"] == cppstd_pruning.prune_cppstds(_CPPSTDS, "gcc", "6")
+    assert ["98", "gnu98", "11", "gnu11", "14", "gnu14", "17", "gnu17", "20", "gnu20"] \
+        == cppstd_pruning.prune_cppstds(_CPPSTDS, "apple-clang", "13.0")
+    assert ["14", "17", "latest"] == cppstd_pruning.prune_cppstds(["14", "17", "20", "latest"], "msvc", "192")
+
+
+def test_prune_cppstds_unknown_compiler():
+    assert _CPPSTDS == cppstd_pruning.prune_cppstds(_CPPSTDS, "intel-cc", "2021.1")
@@ -0,0 +1,42 @@
+import os
+
+from bincrafters import disk_budget
+
+
+def test_parse_size():
+    assert 1024 == disk_budget.parse_size("1024")
+    assert 512 * 1024 ** 2 == disk_budget.parse_size("512M")
+    assert 50 * 1024 ** 3 == disk_budget.parse_size("50G")
+    assert int(1.5 * 1024 ** 3) == disk_budget.parse_size("1.5GiB")
+
+
+def test_select_evictions_least_recently_used_first():
+    entries = [{"name": "a", "size": 40, "last_used": 3},
+               {"name": "b", "size": 30, "last_used": 1},
+               {"name": "c", "size": 30, "last_used": 2}]
+    assert ["b", "c"] == [entry["name"] for entry in disk_budget.select_evictions(entries, 50)]
+
+
+def test_select_evictions_within_budget():
+    entries = [{"name": "a", "size": 40, "last_used": 3}]
+    assert [] == disk_budget.select_evictions(entries, 50)
+
+
+def test_select_evictions_skips_protected():
+    entries = [{"name": "a", "size": 40, "last_used": 1, "protected": True},
+               {"name": "b", "size": 40, "last_used": 2}]
+    assert ["b"] == [entry["name"] for entry in disk_budget.select_evictions(entries, 50)]
+
+
+def test_conan_data_entries(tmp_path):
+    data = str(tmp_path)
+    for reference in [("zlib", "1.2.11", "_", "_"), ("boost", "1.80.0", "bincrafters", "stable")]:
+        package = os.path.join(data, *reference, "package", "1234")
+        os.makedirs(package)
+        with open(os.path.join(package, "lib.a"), "w") as f:
+            f.write("x" * 100)
+
+    entries = disk_budget.get_conan_data_entries(data)
+    assert sorted([os.path.join(data, "boost", "1.80.0", "bincrafters", "stable"),
+                   os.path.join(data, "zlib", "1.2.11", "_", "_")]) == sorted(entry["path"] for entry in entries)
+    assert [100, 100] == [entry["size"] for entry in entries]
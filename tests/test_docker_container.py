@@ -0,0 +1,110 @@
+import os
+from types import SimpleNamespace
+
+import cpt.packager
+import pytest
+from conans.model.ref import ConanFileReference
+
+from bincrafters import build_report
+from bincrafters import docker_container
+
+
+@pytest.fixture()
+def set_reuse_container(monkeypatch):
+    monkeypatch.setenv("BPT_DOCKER_REUSE_CONTAINER", "true")
+
+
+class _FakeRunner(object):
+    def __init__(self):
+        self.commands = []
+
+    def __call__(self, command):
+        self.commands.append(" ".join(command.split()))
+        return 0
+
+
+def _build(runner, pull_image: bool, docker_image: str = "conanio/gcc9", docker_shell: str = "/bin/sh -c",
+           **kwargs):
+    runner_class = cpt.packager.DockerCreateRunner
+    runner_class("[settings]", "", "default", ConanFileReference.loads("foobar/1.0@bincrafters/testing"),
+                 docker_image=docker_image, runner=runner, docker_shell=docker_shell,
+                 docker_conan_home="/home/conan", cwd="/src", conan_pip_package="conan==1.66.0",
+                 docker_image_skip_pull=True, **kwargs) \
+        .run(pull_image=pull_image, docker_entry_script="/tmp/conan/setup.sh")
+
+
+def test_reuse_container(set_reuse_container):
+    runner = _FakeRunner()
+    with docker_container.reuse_containers(SimpleNamespace(use_docker=True)):
+        _build(runner, pull_image=True)
+        _build(runner, pull_image=False)
+
+    assert 5 == len(runner.commands)
+    start, setup, first_build, second_build, remove = runner.commands
+    assert start.startswith("docker run -d --name bpt_builds_")
+    assert '-v "/src:/home/conan/project"' in start
+    assert start.endswith('conanio/gcc9 /bin/sh -c "tail -f /dev/null"')
+    name = start.split()[4]
+    assert setup.startswith("docker exec ")
+    assert "install conan==1.66.0" in setup and setup.endswith("&& /tmp/conan/setup.sh\"")
+    for build in [first_build, second_build]:
+        assert build.startswith("docker exec ")
+        assert build.endswith('{} /bin/sh -c "cd project && run_create_in_docker"'.format(name))
+        assert "setup.sh" not in build
+    assert "docker rm -f {}".format(name) == remove
+
+
+def test_reuse_container_build_variables(set_reuse_container, monkeypatch):
+    monkeypatch.setenv("CONAN_DOCKER_ENTRY_SCRIPT", "/tmp/conan/setup.sh")
+    runner = _FakeRunner()
+    with docker_container.reuse_containers(SimpleNamespace(use_docker=True)):
+        _build(runner, pull_image=True, lockfile="build_0.lock", skip_recipe_export=False)
+        _build(runner, pull_image=False, skip_recipe_export=True)
+
+    start, setup, first_build, second_build, _ = runner.commands
+    # The container only gets the variables which are the same for all builds
+    for command in [start, setup]:
+        assert '-e CONAN_DOCKER_ENTRY_SCRIPT="/tmp/conan/setup.sh"' in command
+        assert "CPT_" not in command and "CONAN_REFERENCE" not in command
+    assert '-e CPT_LOCKFILE="build_0.lock"' in first_build and '-e CPT_SKIP_RECIPE_EXPORT=""' in first_build
+    assert '-e CPT_LOCKFILE=""' in second_build and '-e CPT_SKIP_RECIPE_EXPORT="True"' in second_build
+
+
+def test_reuse_container_per_image(set_reuse_container):
+    runner = _FakeRunner()
+    with docker_container.reuse_containers(SimpleNamespace(use_docker=True)):
+        _build(runner, pull_image=True, docker_image="conanio/gcc9")
+        _build(runner, pull_image=True, docker_image="conanio/gcc10")
+    assert 2 == len([command for command in runner.commands if command.startswith("docker run -d")])
+    assert 2 == len([command for command in runner.commands if command.startswith("docker rm -f")])
+
+
+def test_reuse_container_disabled():
+    runner_class = cpt.packager.DockerCreateRunner
+    with docker_container.reuse_containers(SimpleNamespace(use_docker=True)):
+        assert runner_class is cpt.packager.DockerCreateRunner
+    with docker_container.reuse_containers(SimpleNamespace(use_docker=False)):
+        assert runner_class is cpt.packager.DockerCreateRunner
+
+
+def test_reuse_container_windows(set_reuse_container):
+    runner = _FakeRunner()
+    with docker_container.reuse_containers(SimpleNamespace(use_docker=True)):
+        _build(runner, pull_image=False, docker_shell="cmd /C")
+    assert 1 == len(runner.commands)
+    assert runner.commands[0].startswith("docker run --rm ")
+
+
+def test_reuse_container_with_build_report(set_reuse_container, monkeypatch, tmp_path):
+    monkeypatch.setenv("BPT_BUILD_REPORT", str(tmp_path / "report.json"))
+    runner = _FakeRunner()
+    builder = SimpleNamespace(use_docker=True, builds_in_current_page=[
+        SimpleNamespace(settings={"build_type": build_type}, options={}) for build_type in ["Release", "Debug"]])
+    # Entered in the order of build_autodetect
+    with docker_container.reuse_containers(builder), build_report.collect_builder_report(builder) as report:
+        _build(runner, pull_image=True)
+        _build(runner, pull_image=False)
+
+    assert 1 == len([command for command in runner.commands if command.startswith("docker run -d")])
+    assert ["OK", "OK"] == [build_report.get_result(build) for build in report["builds"]]
+    assert all(build["wall_time"] is not None for build in report["builds"])
@@ -0,0 +1,107 @@
+import hashlib
+import multiprocessing
+import os
+import time
+
+import pytest
+from conans.client.downloaders.cached_file_downloader import CachedFileDownloader
+
+from bincrafters import download_cache
+
+
+_URLS = ["https://example.com/files/{}/conan_package.tgz".format(number) for number in range(12)]
+
+
+class _SlowDownloader(object):
+    """ Writes a file with content derived from the URL in chunks, like a slow network download """
+    def download(self, url, file_path, **kwargs):
+        with open(file_path, "wb") as f:
+            for _ in range(4):
+                f.write(_get_content(url)[:1024])
+                f.flush()
+                time.sleep(0.001)
+
+
+def _get_content(url: str) -> bytes:
+    return hashlib.sha256(url.encode()).hexdigest().encode() * 128
+
+
+def _write_entry(cache: str, name: str, content: bytes):
+    with open(os.path.join(cache, name), "wb") as f:
+        f.write(content)
+
+
+def _download(cache: str, seed: int, errors):
+    downloader = CachedFileDownloader(cache, _SlowDownloader())
+    for iteration in range(40):
+        url = _URLS[(seed * 7 + iteration) % len(_URLS)]
+        content = downloader.download(url)
+        if content != _get_content(url)[:1024] * 4:
+            errors.put("Wrong content for {}".format(url))
+
+
+def _clean(cache: str, stop):
+    while not stop.is_set():
+        download_cache.clean_download_cache(cache, max_size=4 * 4096, verify=True)
+
+
+@pytest.fixture()
+def cache(tmp_path):
+    cache = str(tmp_path / "conan")
+    download_cache.create_download_cache(cache)
+    return cache
+
+
+def test_create_download_cache_twice(cache):
+    download_cache.create_download_cache(cache)
+    assert os.path.isdir(os.path.join(cache, "locks"))
+
+
+def test_clean_download_cache_least_recently_used(cache):
+    for number, name in enumerate(["a" * 64, "b" * 64, "c" * 64]):
+        _write_entry(cache, name, b"x" * 100)
+        os.utime(os.path.join(cache, name), (1000 + number, 1000 + number))
+    download_cache.write_file(os.path.join(cache, "setup.sh"), "#!/bin/sh\n")
+
+    download_cache.clean_download_cache(cache, max_size=250)
+    assert ["b" * 64, "bpt_index.json", "c" * 64, "locks", "setup.sh"] == sorted(os.listdir(cache))
+
+
+def test_clean_download_cache_broken_entries(cache):
+    _write_entry(cache, "a" * 64, b"")
+    _write_entry(cache, "b" * 64, b"partial")
+    _write_entry(cache, "b" * 64 + ".dirty", b"")
+    _write_entry(cache, "c" * 64, b"content")
+    download_cache.clean_download_cache(cache, max_size=1000)
+    assert ["c" * 64] == [entry["name"] for entry in download_cache.get_entries(cache)]
+
+    # Same size and modification time, but different content
+    stat = os.stat(os.path.join(cache, "c" * 64))
+    _write_entry(cache, "c" * 64, b"CONTENT")
+    os.utime(os.path.join(cache, "c" * 64), ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    download_cache.clean_download_cache(cache, max_size=1000, verify=False)
+    assert 1 == len(download_cache.get_entries(cache))
+    download_cache.clean_download_cache(cache, max_size=1000, verify=True)
+    assert [] == download_cache.get_entries(cache)
+
+
+def test_concurrent_writers_and_cleaners(cache):
+    errors = multiprocessing.Queue()
+    stop = multiprocessing.Event()
+    cleaners = [multiprocessing.Process(target=_clean, args=(cache, stop)) for _ in range(2)]
+    writers = [multiprocessing.Process(target=_download, args=(cache, seed, errors)) for seed in range(4)]
+    for process in cleaners + writers:
+        process.start()
+    for process in writers:
+        process.join(60)
+    stop.set()
+    for process in cleaners:
+        process.join(60)
+
+    assert [0] * 6 == [process.exitcode for process in writers + cleaners]
+    assert errors.empty(), errors.get()
+
+    download_cache.clean_download_cache(cache, max_size=4 * 4096, verify=True)
+    entries = download_cache.get_entries(cache)
+    assert sum(entry["size"] for entry in entries) <= 4 * 4096
+    assert not any(entry["dirty"] for entry in entries)
@@ -0,0 +1,45 @@
+import json
+
+import pytest
+
+from bincrafters import generate_ci_jobs as generate_ci_jobs_module
+from bincrafters.generate_ci_jobs import generate_ci_jobs, iter_ci_jobs
+
+
+def test_split_by_build_types_keeps_templates(recipe_folder):
+    # The full and the minimal matrix share the config templates, splitting must not rename them in place
+    first = json.loads(generate_ci_jobs(platform="gha", split_by_build_types=True))["config"]
+    names = [config["name"] for config in first]
+    assert names and all(name.endswith(" " + config["buildType"]) for name, config in zip(names, first))
+    assert not [name for name in names if name.endswith("Release Release") or name.endswith("Release Debug")]
+    # A long-lived process, e.g. the serve daemon, generates the same matrix again
+    assert first == json.loads(generate_ci_jobs(platform="gha", split_by_build_types=True))["config"]
+
+
+def test_probe_workspace(recipe_folder, tmp_path):
+    probe = generate_ci_jobs_module.probe_workspace()
+    assert (False, True, True) == probe
+
+    folder = tmp_path / "recipe"
+    (folder / ".github" / "workflows").mkdir(parents=True)
+    (folder / ".github" / "workflows" / "conan.yml").write_text(
+        "uses: bincrafters/bincrafters-package-tools\nrun: pip install bincrafters_package_tools\n")
+    (folder / "appveyor.yml").write_text("install:\n  - pip install bincrafters_package_tools\n")
+    probe = generate_ci_jobs_module.probe_workspace()
+    assert probe.gha_existing
+    assert probe.run_macos_jobs_on_gha
+    assert not probe.run_windows_jobs_on_gha
+    with pytest.raises(AttributeError):
+        probe.gha_existing = False
+
+    (folder / "azure-pipelines.yml").write_text("resources:\n  repositories:\n    - name: bincrafters/templates\n"
+                                                "jobs:\n  - template: .ci/azure.yml@templates\n")
+    assert (True, False, False) == generate_ci_jobs_module.probe_workspace()
+
+
+def test_ci_files_read_once(recipe_folder, monkeypatch):
+    reads = []
+    read_ci_file = generate_ci_jobs_module._read_ci_file
+    monkeypatch.setattr(generate_ci_jobs_module, "_read_ci_file", lambda path: reads.append(path) or read_ci_file(path))
+    assert list(iter_ci_jobs(platform="gha", split_by_build_types=True))
+    assert 3 == len(reads)
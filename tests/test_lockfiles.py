@@ -0,0 +1,111 @@
+import json
+import os
+
+import pytest
+from conans.client.conan_api import ConanAPIV1
+
+from bincrafters import lockfiles
+
+
+_DEPENDENCY_CONANFILE = """from conans import ConanFile
+
+
+class LockedDepConan(ConanFile):
+    name = "lockeddep"
+    settings = "os", "compiler", "build_type"
+"""
+_CONANFILE = """from conans import ConanFile
+
+
+class ConsumerConan(ConanFile):
+    name = "consumer"
+    settings = "os", "compiler", "build_type"
+    requires = "lockeddep/[>=1.0]@bincrafters/testing"
+"""
+_PROFILE = """include(default)
+[settings]
+os=Linux
+compiler=gcc
+compiler.version=9
+compiler.libcxx=libstdc++11
+build_type={}
+"""
+
+
+def _publish(run_conan, version: str, user_home: str, recipe_folder: str):
+    reference = "lockeddep/{}@bincrafters/testing".format(version)
+    run_conan("conan export . {}".format(reference), user_home, cwd=recipe_folder)
+    run_conan("conan upload {} -r local --confirm".format(reference), user_home)
+
+
+def _get_locked_references(lockfile: str) -> list:
+    with open(lockfile, "r") as f:
+        nodes = json.load(f)["graph_lock"]["nodes"]
+    return sorted(node["ref"].split("#")[0] for node in nodes.values() if "ref" in node)
+
+
+@pytest.fixture()
+def publisher(conan_server, run_conan, new_conan_home, tmp_path):
+    user_home = new_conan_home(os.path.join(str(tmp_path), "publisher"), remote=conan_server, login=True,
+                               revisions=True)
+    recipe_folder = os.path.join(str(tmp_path), "lockeddep")
+    os.makedirs(recipe_folder)
+    with open(os.path.join(recipe_folder, "conanfile.py"), "w") as f:
+        f.write(_DEPENDENCY_CONANFILE)
+    _publish(run_conan, "1.0", user_home, recipe_folder)
+    return lambda version: _publish(run_conan, version, user_home, recipe_folder)
+
+
+@pytest.fixture()
+def consumer(conan_server, run_conan, new_conan_home, tmp_path, monkeypatch):
+    user_home = new_conan_home(os.path.join(str(tmp_path), "consumer"), remote=conan_server, revisions=True)
+    recipe_folder = os.path.join(str(tmp_path), "recipe")
+    os.makedirs(recipe_folder)
+    with open(os.path.join(recipe_folder, "conanfile.py"), "w") as f:
+        f.write(_CONANFILE)
+    run_conan("conan profile new default --detect", user_home)
+    monkeypatch.setenv("CONAN_USER_HOME", user_home)
+    return os.path.join(user_home, ".conan"), recipe_folder
+
+
+def test_get_config_settings():
+    assert ["os=Linux", "compiler=gcc", "compiler.version=9", "build_type=Debug"] == lockfiles.get_config_settings(
+        {"compiler": "GCC", "version": "9", "os": "ubuntu-latest", "buildType": "Debug"})
+    assert ["os=Macos", "compiler=apple-clang", "compiler.version=12.5"] == lockfiles.get_config_settings(
+        {"compiler": "APPLE_CLANG", "version": "12.5.1", "os": "macOS-latest"})
+    assert ["os=Windows", "compiler=Visual Studio", "compiler.version=16"] == lockfiles.get_config_settings(
+        {"compiler": "VISUAL", "version": "16", "os": "windows-2019"})
+
+
+def test_lockfiles(publisher, consumer, tmp_path):
+    cache_folder, recipe_folder = consumer
+    configs = [{"cwd": recipe_folder, "recipe_version": "1.0", "compiler": "GCC", "version": "9",
+                "os": "ubuntu-latest", "buildType": build_type} for build_type in ["Release", "Debug", "Release"]]
+    lockfile_dir = os.path.join(str(tmp_path), "lockfiles")
+    configs = list(lockfiles.iter_matrix_lockfiles(configs, lockfile_dir,
+                                                   lambda cwd: os.path.join(cwd, "conanfile.py")))
+
+    assert 2 == len(os.listdir(lockfile_dir))
+    assert configs[0]["lockfile"] == configs[2]["lockfile"]
+    assert configs[0]["lockfile"] != configs[1]["lockfile"]
+    for config in configs:
+        assert ["consumer/1.0", "lockeddep/1.0@bincrafters/testing"] == _get_locked_references(config["lockfile"])
+
+    # A newer version matches the range now, but the builds keep the locked one
+    publisher("1.1")
+    build_lockfile = os.path.join(str(tmp_path), "build", "build_0.lock")
+    lockfiles.create_build_lockfile(cache_folder, configs[1]["lockfile"], os.path.join(recipe_folder, "conanfile.py"),
+                                    "consumer/1.0@bincrafters/testing", _PROFILE.format("Debug"), build_lockfile)
+    assert "lockeddep/1.0@bincrafters/testing" in _get_locked_references(build_lockfile)
+
+    graph, _ = ConanAPIV1(cache_folder=cache_folder).info(os.path.join(recipe_folder, "conanfile.py"),
+                                                          lockfile=build_lockfile)
+    assert ["lockeddep/1.0@bincrafters/testing"] == [str(node.ref.copy_clear_rev()) for node in graph.nodes
+                                                     if node.ref and node.ref.name == "lockeddep"]
+
+    # The next matrix resolves the dependencies again instead of reusing the lockfiles of the last one
+    configs = list(lockfiles.iter_matrix_lockfiles(configs, lockfile_dir,
+                                                   lambda cwd: os.path.join(cwd, "conanfile.py")))
+    assert 2 == len(os.listdir(lockfile_dir))
+    for config in configs:
+        assert ["consumer/1.0", "lockeddep/1.1@bincrafters/testing"] == _get_locked_references(config["lockfile"])
@@ -0,0 +1,162 @@
+import glob
+import json
+import os
+import tarfile
+
+import pytest
+from conans.client.cache.cache import ClientCache
+from conans.client.output import ConanOutput
+from conans.model.ref import ConanFileReference
+
+from bincrafters import package_artifacts
+
+
+_DEPENDENCY = "dep/1.0@bincrafters/testing"
+# Reference of the recipe which the job builds
+_REFERENCE = "dep/1.0@bincrafters/stable"
+_DEPENDENCY_CONANFILE = """from conans import ConanFile
+
+
+class DepConan(ConanFile):
+    name = "dep"
+    version = "1.0"
+    options = {"variant": ["a", "b", "c"]}
+    default_options = {"variant": "a"}
+    exports_sources = "*.txt"
+
+    def package(self):
+        self.copy("*.txt")
+"""
+
+
+def _set_remote(cache_folder: str, package_id: str):
+    layout = ClientCache(cache_folder, ConanOutput(None)).package_layout(ConanFileReference.loads(_DEPENDENCY))
+    with layout.update_metadata() as metadata:
+        metadata.packages[package_id].remote = "local"
+
+
+@pytest.fixture()
+def builder_home(run_conan, new_conan_home, tmp_path):
+    """ A Conan home which built the variants a and b of the dependency and a package of the reference """
+    user_home = new_conan_home(os.path.join(str(tmp_path), "builder"), revisions=True)
+    recipe_folder = os.path.join(str(tmp_path), "dep")
+    os.makedirs(recipe_folder)
+    with open(os.path.join(recipe_folder, "conanfile.py"), "w") as f:
+        f.write(_DEPENDENCY_CONANFILE)
+    with open(os.path.join(recipe_folder, "license.txt"), "w") as f:
+        f.write("MIT")
+    for variant in "ab":
+        run_conan("conan create . {} -o variant={}".format(_DEPENDENCY, variant), user_home, cwd=recipe_folder)
+    run_conan("conan create . {}".format(_REFERENCE), user_home, cwd=recipe_folder)
+    return os.path.join(user_home, ".conan")
+
+
+@pytest.fixture()
+def consumer_home(new_conan_home, tmp_path):
+    return new_conan_home(os.path.join(str(tmp_path), "consumer"), revisions=True)
+
+
+def test_get_built_packages(builder_home):
+    packages = package_artifacts.get_built_packages(builder_home, exclude=_REFERENCE)
+    assert 2 == len(packages)
+    assert {_DEPENDENCY} == set(reference for reference, _ in packages)
+
+    # Downloaded packages are on a remote already
+    _set_remote(builder_home, packages[0][1])
+    assert packages[1:] == package_artifacts.get_built_packages(builder_home, exclude=_REFERENCE)
+
+
+def test_export_and_import(builder_home, consumer_home, run_conan, tmp_path):
+    artifact_dir = os.path.join(str(tmp_path), "artifacts")
+    assert 2 == package_artifacts.export_built_packages(artifact_dir, builder_home, exclude=_REFERENCE)
+    assert 0 == package_artifacts.export_built_packages(artifact_dir, builder_home, exclude=_REFERENCE)
+
+    cache_folder = os.path.join(consumer_home, ".conan")
+    assert {"recipes": 1, "packages": 2} == package_artifacts.import_packages(artifact_dir, cache_folder)
+    assert {"recipes": 0, "packages": 0} == package_artifacts.import_packages(artifact_dir, cache_folder)
+
+    # Both variants are usable without a remote and without building them
+    for variant in "ab":
+        run_conan("conan install {} -o dep:variant={} --build never".format(_DEPENDENCY, variant), consumer_home,
+                  cwd=str(tmp_path))
+    # The artifact directory has the imported packages already
+    assert 0 == package_artifacts.export_built_packages(artifact_dir, cache_folder)
+
+
+def test_import_skips_other_recipe_revision(builder_home, consumer_home, run_conan, tmp_path):
+    artifact_dir = os.path.join(str(tmp_path), "artifacts")
+    package_artifacts.export_built_packages(artifact_dir, builder_home, exclude=_REFERENCE)
+
+    recipe_folder = os.path.join(str(tmp_path), "other")
+    os.makedirs(recipe_folder)
+    with open(os.path.join(recipe_folder, "conanfile.py"), "w") as f:
+        f.write(_DEPENDENCY_CONANFILE + "    description = 'Another revision'\n")
+    run_conan("conan export . {}".format(_DEPENDENCY), consumer_home, cwd=recipe_folder)
+
+    cache_folder = os.path.join(consumer_home, ".conan")
+    assert {"recipes": 0, "packages": 0} == package_artifacts.import_packages(artifact_dir, cache_folder)
+
+
+def test_import_missing_artifact_dir(tmp_path):
+    statistics = package_artifacts.import_packages(os.path.join(str(tmp_path), "missing"),
+                                                   os.path.join(str(tmp_path), ".conan"))
+    assert {"recipes": 0, "packages": 0} == statistics
+
+
+def _get_recipe_revision(cache_folder: str) -> str:
+    layout = ClientCache(cache_folder, ConanOutput(None)).package_layout(ConanFileReference.loads(_DEPENDENCY))
+    return layout.recipe_revision()
+
+
+def test_import_skips_outdated_recipe_revision(builder_home, consumer_home, conan_server, run_conan, new_conan_home,
+                                               tmp_path):
+    artifact_dir = os.path.join(str(tmp_path), "artifacts")
+    package_artifacts.export_built_packages(artifact_dir, builder_home, exclude=_REFERENCE)
+    revision = _get_recipe_revision(builder_home)
+
+    # The remote has a newer revision of the recipe, the old one must not shadow it
+    publisher_home = new_conan_home(os.path.join(str(tmp_path), "publisher"), remote=conan_server, login=True,
+                                    revisions=True)
+    recipe_folder = os.path.join(str(tmp_path), "newer")
+    os.makedirs(recipe_folder)
+    with open(os.path.join(recipe_folder, "conanfile.py"), "w") as f:
+        f.write(_DEPENDENCY_CONANFILE + "    description = 'Newer revision {}'\n".format(tmp_path))
+    run_conan("conan export {} {}".format(recipe_folder, _DEPENDENCY), publisher_home)
+    run_conan("conan upload {} -r local --confirm".format(_DEPENDENCY), publisher_home)
+    run_conan("conan remote add local {}".format(conan_server), consumer_home)
+
+    cache_folder = os.path.join(consumer_home, ".conan")
+    try:
+        assert set() == package_artifacts.get_selected_revisions(artifact_dir, cache_folder)
+        assert {"recipes": 0, "packages": 0} == package_artifacts.import_packages(artifact_dir, cache_folder)
+    finally:
+        # The server is shared with other tests, which upload their own revisions of the dependency
+        run_conan("conan remove {} -r local -f".format(_DEPENDENCY), publisher_home)
+
+    # A lockfile decides on its own
+    lockfile = os.path.join(str(tmp_path), "base.lock")
+    with open(lockfile, "w") as f:
+        json.dump({"graph_lock": {"nodes": {"1": {"ref": "{}#{}".format(_DEPENDENCY, revision)}}}}, f)
+    assert {(_DEPENDENCY, revision)} == package_artifacts.get_selected_revisions(artifact_dir, cache_folder,
+                                                                                 lockfile=lockfile)
+
+
+def test_import_rejects_path_traversal(builder_home, consumer_home, tmp_path):
+    artifact_dir = os.path.join(str(tmp_path), "artifacts")
+    package_artifacts.export_built_packages(artifact_dir, builder_home, exclude=_REFERENCE)
+    folder = os.path.dirname(glob.glob(os.path.join(artifact_dir, "**", "recipe.tgz"), recursive=True)[0])
+    package_artifact = [name for name in os.listdir(folder) if name != "recipe.tgz"][0]
+
+    evil = os.path.join(str(tmp_path), "evil.txt")
+    with open(evil, "w") as f:
+        f.write("evil")
+    with tarfile.open(os.path.join(folder, package_artifact), "r:gz") as tar:
+        metadata = tar.extractfile("metadata.json").read()
+    with open(os.path.join(str(tmp_path), "metadata.json"), "wb") as f:
+        f.write(metadata)
+    with tarfile.open(os.path.join(folder, package_artifact), "w:gz") as tar:
+        tar.add(os.path.join(str(tmp_path), "metadata.json"), arcname="metadata.json")
+        tar.add(evil, arcname="package/../../../../evil.txt")
+
+    with pytest.raises(ValueError):
+        package_artifacts.import_packages(artifact_dir, os.path.join(consumer_home, ".conan"))
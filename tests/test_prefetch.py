@@ -0,0 +1,90 @@
+import os
+
+import pytest
+from cpt.builds_generator import BuildConf
+
+from bincrafters import prefetch
+
+
+_DEPENDENCY = "dep/1.0@bincrafters/testing"
+_DEPENDENCY_CONANFILE = """from conans import ConanFile
+
+
+class DepConan(ConanFile):
+    name = "dep"
+    version = "1.0"
+    options = {"variant": ["a", "b", "c"]}
+    default_options = {"variant": "a"}
+"""
+_CONANFILE = """from conans import ConanFile
+
+
+class ConsumerConan(ConanFile):
+    name = "consumer"
+    version = "1.0"
+    requires = "dep/1.0@bincrafters/testing"
+"""
+
+
+@pytest.fixture(scope="module")
+def published_dependency(conan_server, run_conan, new_conan_home, tmp_path_factory):
+    """ Packages of dep for the variants a and b on the server, but not for c """
+    user_home = new_conan_home(str(tmp_path_factory.mktemp("publisher")), remote=conan_server, login=True)
+    recipe_folder = str(tmp_path_factory.mktemp("dep"))
+    with open(os.path.join(recipe_folder, "conanfile.py"), "w") as f:
+        f.write(_DEPENDENCY_CONANFILE)
+    for variant in "ab":
+        run_conan("conan create . {} -o variant={}".format(_DEPENDENCY, variant), user_home, cwd=recipe_folder)
+    run_conan("conan upload {} --all -r local --confirm".format(_DEPENDENCY), user_home)
+    return conan_server
+
+
+@pytest.fixture()
+def consumer(published_dependency, run_conan, new_conan_home, tmp_path):
+    user_home = new_conan_home(os.path.join(str(tmp_path), "home"), remote=published_dependency)
+    recipe_folder = os.path.join(str(tmp_path), "recipe")
+    os.makedirs(recipe_folder)
+    with open(os.path.join(recipe_folder, "conanfile.py"), "w") as f:
+        f.write(_CONANFILE)
+    run_conan("conan config set storage.download_cache={}".format(os.path.join(str(tmp_path), "download_cache")),
+              user_home)
+    return os.path.join(user_home, ".conan"), os.path.join(recipe_folder, "conanfile.py")
+
+
+def _get_build(variant: str) -> BuildConf:
+    return BuildConf({"build_type": "Release"}, {"dep:variant": variant}, {}, {}, "consumer/1.0@")
+
+
+def test_prefetch(consumer):
+    cache_folder, recipe_path = consumer
+    statistics = prefetch.prefetch(cache_folder, recipe_path, [_get_build("a"), _get_build("b"), _get_build("a")],
+                                   workers=2)
+    assert 3 == statistics["builds"]
+    assert 1 == statistics["recipes"]
+    assert 2 == statistics["packages"]
+
+    package_folder = os.path.join(cache_folder, "data", "dep", "1.0", "bincrafters", "testing", "package")
+    assert 2 == len(os.listdir(package_folder))
+    download_cache = os.path.join(os.path.dirname(cache_folder), "..", "download_cache")
+    assert os.listdir(download_cache)
+
+    # Everything is in the cache now
+    statistics = prefetch.prefetch(cache_folder, recipe_path, [_get_build("a"), _get_build("b")])
+    assert 0 == statistics["recipes"]
+
+
+def test_prefetch_recipe_of_missing_binary(consumer):
+    cache_folder, recipe_path = consumer
+    statistics = prefetch.prefetch(cache_folder, recipe_path, [_get_build("c")])
+    assert 1 == statistics["recipes"]
+    assert 0 == statistics["packages"]
+    assert os.path.isfile(os.path.join(cache_folder, "data", "dep", "1.0", "bincrafters", "testing", "export",
+                                       "conanfile.py"))
+
+
+def test_get_graph_arguments():
+    arguments = prefetch.get_graph_arguments(BuildConf({"os": "Linux", "compiler.version": "9"},
+                                                       {"foobar:shared": True}, {"CC": "gcc"}, {}, None))
+    assert ["os=Linux", "compiler.version=9"] == arguments["settings"]
+    assert ["foobar:shared=True"] == arguments["options"]
+    assert ["CC=gcc"] == arguments["env"]
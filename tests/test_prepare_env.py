@@ -0,0 +1,134 @@
+import os
+import shutil
+import tempfile
+
+import pytest
+import yaml
+
+from bincrafters import cppstd_pruning
+from bincrafters import prepare_env
+from bincrafters.step_executor import StepError
+
+
+def test_format_github_env():
+    variables = {"CONAN_VERSION": "1.2.3", "CONAN_DOCKER_SHELL": "/bin/sh -c"}
+    assert "CONAN_VERSION=1.2.3\nCONAN_DOCKER_SHELL=/bin/sh -c\n" == prepare_env._format_github_env(variables)
+
+
+def test_format_github_env_multiline():
+    lines = prepare_env._format_github_env({"FOO": "bar\nbaz"}).splitlines()
+    assert 4 == len(lines)
+    name, delimiter = lines[0].split("<<")
+    assert "FOO" == name
+    assert ["bar", "baz", delimiter] == lines[1:]
+
+
+def test_format_azp_logging_commands():
+    commands = prepare_env._format_azp_logging_commands({"FOO": "100%", "BAR": "a\nb"})
+    assert "##vso[task.setvariable variable=FOO]100%AZP25\n" \
+           "##vso[task.setvariable variable=BAR]a%0Ab\n" == commands
+
+
+def test_export_env_variables_github():
+    github_env = os.path.join(tempfile.mkdtemp(), "github_env")
+    with open(github_env, "w") as f:
+        f.write("EXISTING=1\n")
+    os.environ["GITHUB_ENV"] = github_env
+    try:
+        prepare_env._export_env_variables("gha", {"FOO": "bar", "BAZ": "qux"})
+    finally:
+        del os.environ["GITHUB_ENV"]
+
+    with open(github_env, "r") as f:
+        assert "EXISTING=1\nFOO=bar\nBAZ=qux\n" == f.read()
+
+
+def test_provisioned_image_archive_key():
+    archive = prepare_env.get_provisioned_image_archive("cache", "gcc@sha256:1234", "apt update")
+    assert archive == prepare_env.get_provisioned_image_archive("cache", "gcc@sha256:1234", "apt update")
+    assert "cache" == os.path.dirname(archive)
+    assert archive.endswith(".tar")
+    assert archive != prepare_env.get_provisioned_image_archive("cache", "gcc@sha256:5678", "apt update")
+    assert archive != prepare_env.get_provisioned_image_archive("cache", "gcc@sha256:1234", "apt upgrade")
+
+
+@pytest.mark.parametrize("failing", ["docker run", "docker commit"])
+def test_failed_provisioning_not_cached(failing, tmp_path, monkeypatch):
+    monkeypatch.setattr(prepare_env, "get_docker_image_digest", lambda image: "gcc@sha256:1234")
+    commands = []
+
+    def _run(command):
+        commands.append(command)
+        return 1 if command.startswith(failing) else 0
+
+    image_cache = os.path.join(str(tmp_path), "images")
+    with pytest.raises(StepError):
+        prepare_env._provision_cached_docker_image(_run, image_cache, "gcc", "apt update",
+                                                   ["docker run gcc", "docker commit gcc"], ["docker rm gcc"])
+    assert "docker rm gcc" == commands[-1]
+    assert not [command for command in commands if command.startswith("docker save")]
+    assert not os.path.exists(image_cache)
+
+
+def test_warm_runner_step_order(monkeypatch):
+    monkeypatch.setenv("BPT_WARM_RUNNER", "true")
+    steps = {step.name: step for step in prepare_env._get_steps(
+        "gha", {"compiler": "GCC", "version": "9", "cwd": "./", "recipe_version": "1.0"}, {})}
+    # The budget reads the conan.conf and must not evict what the provisioning restores
+    assert ["conan-config-init"] == steps["disk-budget"].requires
+    assert ["disk-budget"] == steps["docker-pull"].requires
+    assert ["docker-pull"] == steps["docker-provision"].requires
+
+
+def _copy_settings_yml() -> str:
+    settings_path = os.path.join(tempfile.mkdtemp(), "settings.yml")
+    shutil.copy(os.path.join(os.path.dirname(__file__), "settings.yml"), settings_path)
+    return settings_path
+
+
+def test_add_compiler_version():
+    settings_path = _copy_settings_yml()
+    with open(settings_path, "r") as f:
+        original = f.read()
+
+    assert prepare_env.add_compiler_version(settings_path, "apple-clang", "14.0")
+    with open(settings_path, "r") as f:
+        content = f.read()
+    # Only the version list changed, comments and anchors are untouched
+    assert original.replace('"13.0"]  # Keep this comment', '"13.0", "14.0"]  # Keep this comment') == content
+
+    settings = yaml.safe_load(content)
+    assert "14.0" == settings["compiler"]["apple-clang"]["version"][-1]
+    assert "14.0" in settings["compiler"]["intel"]["base"]["apple-clang"]["version"]
+    assert "14.0" not in settings["compiler"]["gcc"]["version"]
+
+
+def test_add_compiler_version_idempotent():
+    settings_path = _copy_settings_yml()
+    assert not prepare_env.add_compiler_version(settings_path, "apple-clang", "13.0")
+    assert prepare_env.add_compiler_version(settings_path, "apple-clang", "14.0")
+    with open(settings_path, "r") as f:
+        content = f.read()
+    assert not prepare_env.add_compiler_version(settings_path, "apple-clang", "14.0")
+    with open(settings_path, "r") as f:
+        assert content == f.read()
+
+
+def test_add_compiler_version_unknown_compiler():
+    with pytest.raises(ValueError):
+        prepare_env.add_compiler_version(_copy_settings_yml(), "msvc", "193")
+
+
+def test_prune_cppstds_keeps_all_if_none_left(tmp_path):
+    recipe_path = os.path.join(str(tmp_path), "conanfile.py")
+    with open(recipe_path, "w") as f:
+        f.write("class Recipe(ConanFile):\n    def validate(self):\n        tools.check_min_cppstd(self, 20)\n")
+    assert ["11", "14"] == prepare_env._prune_cppstds(["11", "14"], recipe_path, "gcc", "5")
+    assert ["20"] == prepare_env._prune_cppstds(["14", "17", "20"], recipe_path, "gcc", "11")
+
+
+def test_cppstd_pruning_disabled_by_default(monkeypatch):
+    monkeypatch.delenv("BPT_CPPSTD_PRUNING", raising=False)
+    assert not cppstd_pruning.is_pruning_enabled()
+    monkeypatch.setenv("BPT_CPPSTD_PRUNING", "true")
+    assert cppstd_pruning.is_pruning_enabled()
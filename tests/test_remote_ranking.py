@@ -0,0 +1,142 @@
+import os
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from io import StringIO
+
+import pytest
+from conans.client.conan_api import ConanAPIV1
+from conans.client.output import ConanOutput
+
+from bincrafters import build_shared
+from bincrafters import remote_ranking
+
+
+_FAST = "https://fast.example.com/conan"
+_SLOW = "https://slow.example.com/conan"
+_DOWN = "https://down.example.com/conan"
+
+
+class _PingHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200 if self.path == "/v1/ping" else 404)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def set_stats_path(tmp_path):
+    os.environ["BPT_REMOTE_STATS"] = os.path.join(str(tmp_path), "remote_stats.json")
+    yield
+    del os.environ["BPT_REMOTE_STATS"]
+
+
+@pytest.fixture()
+def set_remote_probing():
+    os.environ["BPT_REMOTE_PROBING"] = "true"
+    os.environ["CONAN_REMOTES"] = "{}@True@slow,{}@True@down,{}@True@fast".format(_SLOW, _DOWN, _FAST)
+    yield
+    del os.environ["BPT_REMOTE_PROBING"]
+    del os.environ["CONAN_REMOTES"]
+
+
+@pytest.fixture()
+def fake_latencies(monkeypatch):
+    latencies = {_FAST: 0.01, _SLOW: 0.2, _DOWN: None}
+    probed = []
+
+    def _probe_latency(url):
+        probed.append(url)
+        return latencies[url]
+    monkeypatch.setattr(remote_ranking, "probe_latency", _probe_latency)
+    return probed
+
+
+@pytest.fixture()
+def ping_server():
+    server = HTTPServer(("localhost", 0), _PingHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield "http://localhost:{}".format(server.server_address[1])
+    server.shutdown()
+    thread.join()
+    server.server_close()
+
+
+def test_probe_latency(ping_server):
+    latency = remote_ranking.probe_latency(ping_server)
+    assert latency is not None and latency < 5
+
+
+def test_probe_latency_unreachable():
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        port = s.getsockname()[1]
+    assert remote_ranking.probe_latency("http://localhost:{}".format(port), attempts=1, timeout=1) is None
+
+
+def test_rank_remotes_by_latency_and_hit_rate():
+    stats = {_FAST: {"latency": 0.01, "hits": 0, "lookups": 10},
+             _SLOW: {"latency": 0.1, "hits": 10, "lookups": 10},
+             _DOWN: {"latency": None}}
+    # The fast remote never had any of the dependencies
+    assert [_SLOW, _FAST, _DOWN] == remote_ranking.rank_remotes([_DOWN, _FAST, _SLOW], stats)
+    # Without a history only the latency counts
+    stats = {_FAST: {"latency": 0.01}, _SLOW: {"latency": 0.1}, _DOWN: {"latency": None}}
+    assert [_FAST, _SLOW, _DOWN] == remote_ranking.rank_remotes([_DOWN, _SLOW, _FAST], stats)
+
+
+def test_record_downloads_decays():
+    remote_ranking.record_downloads([_FAST, _SLOW], {_SLOW: 4})
+    remote_ranking.record_downloads([_FAST, _SLOW], {_FAST: 1, _SLOW: 1})
+    stats = remote_ranking.load_stats(remote_ranking.get_stats_path())
+    assert pytest.approx(1 / 5.2) == remote_ranking.get_hit_rate(stats[_FAST])
+    assert pytest.approx(4.2 / 5.2) == remote_ranking.get_hit_rate(stats[_SLOW])
+
+
+def test_get_downloads():
+    summary = [{"configuration": {}, "package": {"installed": [
+        {"recipe": {"id": "zlib/1.2.11", "downloaded": True, "remote": "slow"},
+         "packages": [{"id": "1234", "downloaded": True, "remote": "slow"}]},
+        {"recipe": {"id": "bzip2/1.0.8", "downloaded": False, "remote": "fast"},
+         "packages": [{"id": "5678", "downloaded": True, "remote": "fast"}]},
+        {"recipe": {"id": "foobar/1.0", "downloaded": False, "remote": None}, "packages": []}]}}]
+    assert {_SLOW: 2, _FAST: 1} == remote_ranking.get_downloads(summary, {"slow": _SLOW, "fast": _FAST})
+
+
+def test_get_conan_remotes_ordered(set_remote_probing, fake_latencies):
+    remotes = build_shared.get_conan_remotes("bincrafters", {})["remotes"]
+    assert ["{}@True@fast".format(_FAST), "{}@True@slow".format(_SLOW), "{}@True@down".format(_DOWN)] == remotes
+    assert 3 == len(fake_latencies)
+
+    # The latencies of the previous run are still recent
+    build_shared.get_conan_remotes("bincrafters", {})
+    assert 3 == len(fake_latencies)
+
+
+def test_get_conan_remotes_keeps_upload_remote(set_remote_probing, fake_latencies):
+    os.environ["CONAN_UPLOAD"] = "{}@True@slow".format(_SLOW)
+    try:
+        kwargs = build_shared.get_conan_upload_param("bincrafters", {})
+        kwargs = build_shared.get_conan_remotes("bincrafters", kwargs)
+    finally:
+        del os.environ["CONAN_UPLOAD"]
+    assert "{}@True@fast".format(_FAST) == kwargs["remotes"][0]
+    assert [_SLOW, "True", "slow"] == kwargs["upload"]
+
+
+def test_apply_remote_order_moves_existing_remotes(tmp_path):
+    conan_api = ConanAPIV1(cache_folder=os.path.join(str(tmp_path), ".conan"), output=ConanOutput(StringIO()))
+    for remote in list(conan_api.remote_list()):
+        conan_api.remote_remove(remote.name)
+    # The slow remote existed before, CPT would keep it in front of the fast one
+    conan_api.remote_add("other", "https://other.example.com/conan")
+    conan_api.remote_add("slow", _SLOW, verify_ssl=False)
+    conan_api.remote_add("fast", _FAST)
+    remote_ranking.apply_remote_order(conan_api, ["{}@True@fast".format(_FAST), "{}@False@slow".format(_SLOW),
+                                                  _DOWN])
+    remotes = conan_api.remote_list()
+    assert ["fast", "slow", "other"] == [remote.name for remote in remotes]
+    assert not remotes[1].verify_ssl
@@ -0,0 +1,148 @@
+import json
+import os
+import subprocess
+import threading
+
+import pytest
+
+from bincrafters import file_cache
+from bincrafters import serve
+from bincrafters import serve_client
+from bincrafters import utils
+from bincrafters.generate_ci_jobs import generate_ci_jobs
+
+
+@pytest.fixture()
+def server(tmp_path):
+    socket_path = os.path.join(str(tmp_path), "bpt.sock")
+    daemon = serve.create_server(socket_path)
+    thread = threading.Thread(target=daemon.serve_forever)
+    thread.start()
+    yield socket_path
+    serve_client.request("shutdown", socket_path=socket_path, timeout=10)
+    thread.join()
+    daemon.server_close()
+    file_cache.disable()
+
+
+def test_cached_invalidated_by_mtime(tmp_path):
+    path = os.path.join(str(tmp_path), "input.txt")
+    calls = []
+
+    @file_cache.cached(lambda name: [path])
+    def _read(name):
+        calls.append(name)
+        with open(path, "r") as f:
+            return f.read()
+
+    with open(path, "w") as f:
+        f.write("a")
+    assert "a" == _read("x") and "a" == _read("x")
+    assert 2 == len(calls)
+
+    file_cache.enable()
+    try:
+        assert "a" == _read("x") and "a" == _read("x")
+        assert 3 == len(calls)
+        with open(path, "w") as f:
+            f.write("bb")
+        assert "bb" == _read("x")
+        assert 4 == len(calls)
+        assert {"hits": 1, "misses": 2, "entries": 1} == file_cache.get_statistics()
+    finally:
+        file_cache.disable()
+
+
+def test_git_state_paths(tmp_path, monkeypatch):
+    git_dir = os.path.join(str(tmp_path), ".git")
+    os.makedirs(os.path.join(str(tmp_path), "sub"))
+    os.makedirs(git_dir)
+    with open(os.path.join(git_dir, "HEAD"), "w") as f:
+        f.write("ref: refs/heads/main\n")
+    monkeypatch.chdir(os.path.join(str(tmp_path), "sub"))
+    paths = file_cache.get_git_state_paths()
+    assert os.path.join(git_dir, "HEAD") in paths
+    assert os.path.join(git_dir, "refs/heads/main") in paths
+
+
+def test_git_state_paths_of_arguments(tmp_path, monkeypatch):
+    git_dir = os.path.join(str(tmp_path), ".git")
+    os.makedirs(git_dir)
+    with open(os.path.join(git_dir, "HEAD"), "w") as f:
+        f.write("ref: refs/heads/feature\n")
+    monkeypatch.chdir(str(tmp_path))
+    paths = file_cache.get_git_state_paths(base="origin/main^1")
+    assert os.path.join(git_dir, "refs", "remotes", "origin", "main") in paths
+    assert os.path.join(git_dir, "refs", "remotes", "origin", "HEAD") in file_cache.get_git_state_paths("origin")
+
+
+def test_changed_dirs_follow_remote_ref(tmp_path, monkeypatch):
+    def _git(*args):
+        subprocess.run(["git"] + list(args), check=True, cwd=str(tmp_path), stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL)
+    monkeypatch.setenv("GIT_AUTHOR_NAME", "test")
+    monkeypatch.setenv("GIT_AUTHOR_EMAIL", "test@example.com")
+    monkeypatch.setenv("GIT_COMMITTER_NAME", "test")
+    monkeypatch.setenv("GIT_COMMITTER_EMAIL", "test@example.com")
+    _git("init", "-q")
+    for folder in ["a", "b", "c"]:
+        (tmp_path / folder).mkdir()
+        (tmp_path / folder / "file.txt").write_text(folder)
+        _git("add", folder)
+        _git("commit", "-q", "-m", folder)
+    _git("update-ref", "refs/remotes/origin/main", "HEAD~1")
+    monkeypatch.chdir(str(tmp_path))
+    file_cache.enable()
+    try:
+        assert ["b/"] == utils.utils_git_get_changed_dirs(base="origin/main")
+        # Only the loose ref of the remote branch changes, e.g. after a push
+        _git("update-ref", "refs/remotes/origin/main", "HEAD")
+        assert ["c/"] == utils.utils_git_get_changed_dirs(base="origin/main")
+    finally:
+        file_cache.disable()
+
+
+def test_serve_generate_ci_jobs(recipe_folder, server):
+    expected = generate_ci_jobs(platform="gha")
+    assert expected == serve_client.request("generate-ci-jobs", {"platform": "gha"}, socket_path=server)["output"]
+    misses = serve_client.request("stats", socket_path=server)["output"]["misses"]
+    assert expected == serve_client.request("generate-ci-jobs", {"platform": "gha"}, socket_path=server)["output"]
+    stats = serve_client.request("stats", socket_path=server)["output"]
+    assert misses == stats["misses"]
+    assert stats["hits"] > 0
+
+    # A changed recipe gets inspected again
+    with open(os.path.join(recipe_folder, "conanfile.py"), "a") as f:
+        f.write("\n# changed\n")
+    serve_client.request("generate-ci-jobs", {"platform": "gha"}, socket_path=server)
+    assert serve_client.request("stats", socket_path=server)["output"]["misses"] > misses
+
+
+def test_serve_autodetect_and_errors(recipe_folder, server):
+    output = serve_client.request("autodetect", socket_path=server)["output"]
+    assert "one_recipe_one_file" == output["directory_structure"]
+    with pytest.raises(Exception, match="Unknown command"):
+        serve_client.request("foobar", socket_path=server)
+    # The daemon keeps its own working directory and environment
+    assert os.getcwd() == recipe_folder
+
+
+def test_client_cli(recipe_folder, server, capsys, monkeypatch):
+    # The cold invocations of the benchmark import bincrafters in a new process
+    monkeypatch.setenv("PYTHONPATH", os.path.dirname(os.path.dirname(os.path.abspath(serve.__file__))))
+    serve_client.run(["--socket", server, "autodetect"])
+    assert "one_recipe_one_file" == json.loads(capsys.readouterr().out)["directory_structure"]
+    serve_client.run(["--socket", server, "benchmark", "-n", "1", "autodetect"])
+    output = capsys.readouterr().out
+    assert "cold" in output and "warm" in output and "Speedup" in output
+
+
+def test_stale_socket(tmp_path):
+    socket_path = os.path.join(str(tmp_path), "stale.sock")
+    daemon = serve.create_server(socket_path)
+    daemon.server_close()
+    try:
+        # The socket file is left behind without a listening daemon
+        serve.create_server(socket_path).server_close()
+    finally:
+        file_cache.disable()
@@ -0,0 +1,82 @@
+import sys
+import threading
+import pytest
+
+from bincrafters.step_executor import Step, StepError, run_steps, sort_steps, format_plan
+
+
+def _python(code):
+    return '"{}" -c "{}"'.format(sys.executable, code)
+
+
+def test_sort_steps():
+    steps = [Step("c", requires=["b"]), Step("b", requires=["a"]), Step("a"), Step("d")]
+    assert ["a", "d", "b", "c"] == [step.name for step in sort_steps(steps)]
+
+
+def test_sort_steps_unknown_requirement():
+    with pytest.raises(StepError):
+        sort_steps([Step("a", requires=["b"])])
+
+
+def test_sort_steps_cycle():
+    with pytest.raises(StepError):
+        sort_steps([Step("a", requires=["b"]), Step("b", requires=["a"])])
+
+
+def test_format_plan():
+    plan = format_plan([Step("b", commands=["echo b"], requires=["a"]), Step("a", commands=["echo a"])])
+    assert "a\n    >> echo a\nb (after a)\n    >> echo b" == plan
+
+
+def test_dry_run_executes_nothing():
+    executed = []
+    run_steps([Step("a", action=lambda run: executed.append("a"))], dry_run=True)
+    assert [] == executed
+
+
+def test_run_steps_respects_requirements():
+    order = []
+    lock = threading.Lock()
+
+    def _record(name):
+        def _action(run):
+            with lock:
+                order.append(name)
+        return _action
+
+    run_steps([Step("c", action=_record("c"), requires=["a", "b"]),
+               Step("a", action=_record("a")),
+               Step("b", action=_record("b"), requires=["a"])])
+    assert ["a", "b", "c"] == order
+
+
+def test_run_steps_independent_steps_overlap():
+    barrier = threading.Barrier(2, timeout=10)
+    # Both actions only return if they are running at the same time
+    run_steps([Step("a", action=lambda run: barrier.wait()), Step("b", action=lambda run: barrier.wait())])
+
+
+def test_run_steps_unchecked_failure_continues(capsys):
+    run_steps([Step("a", commands=[_python("import sys; sys.exit(3)")]),
+               Step("b", commands=[_python("print('done')")], requires=["a"])])
+    output = capsys.readouterr().out
+    assert "returned 3, continuing" in output
+    assert "[b] done" in output
+
+
+def test_run_steps_fail_fast(capsys):
+    executed = []
+    with pytest.raises(StepError) as error:
+        run_steps([Step("a", commands=[_python("import sys; sys.exit(1)")], check=True),
+                   Step("b", action=lambda run: executed.append("b"), requires=["a"])])
+    assert "Step 'a' failed" in str(error.value)
+    assert [] == executed
+    assert "Skipped steps: b" in capsys.readouterr().out
+
+
+def test_action_runs_commands(capsys):
+    returncodes = []
+    run_steps([Step("a", action=lambda run: returncodes.append(run(_python("print('from action')"))))])
+    assert [0] == returncodes
+    assert "[a] from action" in capsys.readouterr().out
@@ -0,0 +1,30 @@
+from bincrafters import timings
+
+
+def test_timings_disabled_by_default():
+    assert not timings.is_enabled()
+    with timings.measure("git"):
+        pass
+    assert {} == timings.get_report()
+
+
+def test_timings_per_phase_and_recipe():
+    timings.enable()
+    try:
+        with timings.measure("yaml"):
+            pass
+        with timings.recipe("foobar"):
+            with timings.measure("git"):
+                pass
+            with timings.measure("git"):
+                pass
+        report = timings.get_report()
+    finally:
+        timings.disable()
+
+    assert 1 == report["phases"]["yaml"]["count"]
+    assert 2 == report["phases"]["git"]["count"]
+    assert ["foobar"] == list(report["recipes"].keys())
+    assert 2 == report["recipes"]["foobar"]["git"]["count"]
+    assert "yaml" not in report["recipes"]["foobar"]
+    assert report["total"] >= report["phases"]["git"]["time"]
@@ -0,0 +1,58 @@
+import json
+import os
+import tempfile
+
+from bincrafters import tracing
+
+
+def _load_trace(path):
+    with open(path, "r") as f:
+        content = f.read().rstrip().rstrip(",")
+    return json.loads(content + "]")
+
+
+def test_tracing_disabled_by_default():
+    assert not tracing.is_enabled()
+    assert tracing.span("foo") is tracing.command_span("conan config init")
+    with tracing.span("foo"):
+        pass
+
+
+def test_tracing_writes_chrome_trace_events(monkeypatch):
+    monkeypatch.delenv(tracing._BPT_TRACE_OWNER, raising=False)
+    path = os.path.join(tempfile.mkdtemp(), "trace.json")
+    tracer = tracing._Tracer(path)
+    with tracing._Span(tracer, "outer", {}):
+        with tracing._Span(tracer, "$ conan config", {"command": "conan config init"}):
+            pass
+    tracer.flush()
+    # A second process appends to the same file
+    monkeypatch.setenv(tracing._BPT_TRACE_OWNER, "1")
+    tracing._Tracer(path).flush()
+
+    events = _load_trace(path)
+    spans = [event for event in events if event["ph"] == "X"]
+    assert 2 == len([event for event in events if event["ph"] == "M"])
+    assert ["$ conan config", "outer"] == [event["name"] for event in spans]
+    inner, outer = spans
+    assert "conan config init" == inner["args"]["command"]
+    assert outer["ts"] <= inner["ts"]
+    assert inner["ts"] + inner["dur"] <= outer["ts"] + outer["dur"]
+
+
+def test_tracing_appends_across_invocations(monkeypatch, tmp_path):
+    path = os.path.join(str(tmp_path), "trace.json")
+    # Separate CI steps, e.g. prepare-env and the build, are separate top-level processes
+    for _ in range(2):
+        monkeypatch.delenv(tracing._BPT_TRACE_OWNER, raising=False)
+        tracing._Tracer(path).flush()
+    assert 2 == len(_load_trace(path))
+
+    monkeypatch.delenv(tracing._BPT_TRACE_OWNER, raising=False)
+    monkeypatch.setenv(tracing.BPT_TRACE_RESET, "true")
+    tracing._Tracer(path).flush()
+    assert 1 == len(_load_trace(path))
+
+    # Child processes never reset the trace of their parent
+    tracing._Tracer(path).flush()
+    assert 2 == len(_load_trace(path))
@@ -0,0 +1,156 @@
+import os
+import threading
+import time
+from io import StringIO
+
+import pytest
+from conans.client.conan_api import ConanAPIV1
+
+from bincrafters import upload
+
+
+_REFERENCE = "foobar/1.0@bincrafters/testing"
+_CONANFILE = """from conans import ConanFile
+
+
+class FoobarConan(ConanFile):
+    name = "foobar"
+    version = "1.0"
+    exports_sources = "*.bin"
+    options = {"variant": ["a", "b", "c"]}
+    default_options = {"variant": "a"}
+
+    def package(self):
+        self.copy("*.bin")
+"""
+
+
+class _FakeApi(object):
+    """ Fails a number of times before the upload succeeds """
+    def __init__(self, failures, output=""):
+        self.failures = failures
+        self.output = output
+        self.stream = None
+        self.calls = 0
+
+    def upload(self, reference, **kwargs):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise Exception("Connection reset by peer")
+        self.stream.write(self.output)
+
+
+def _get_fake_api(api):
+    api.stream = StringIO()
+    return lambda: (api, api.stream)
+
+
+@pytest.fixture(scope="module")
+def client(conan_server, run_conan, new_conan_home, tmp_path_factory):
+    """ A Conan home with the recipe and three packages of foobar """
+    user_home = new_conan_home(str(tmp_path_factory.mktemp("client")), remote=conan_server, login=True)
+    recipe_folder = str(tmp_path_factory.mktemp("recipe"))
+    with open(os.path.join(recipe_folder, "conanfile.py"), "w") as f:
+        f.write(_CONANFILE)
+    with open(os.path.join(recipe_folder, "foobar.bin"), "wb") as f:
+        f.write(os.urandom(256 * 1024))
+    for variant in "abc":
+        run_conan("conan create . {} -o variant={}".format(_REFERENCE, variant), user_home, cwd=recipe_folder)
+    return os.path.join(user_home, ".conan")
+
+
+def test_upload_retries_with_backoff(monkeypatch):
+    delays = []
+    monkeypatch.setattr(upload.time, "sleep", delays.append)
+    api = _FakeApi(failures=2)
+    assert "uploaded" == upload._upload_artifact(_get_fake_api(api), _REFERENCE, None, "local", force=False,
+                                                 retries=3, backoff=0.5)
+    assert 3 == api.calls
+    assert [0.5, 1.0] == delays
+
+
+def test_upload_gives_up_after_retries(monkeypatch):
+    monkeypatch.setattr(upload.time, "sleep", lambda _: None)
+    api = _FakeApi(failures=5)
+    with pytest.raises(Exception, match="Connection reset"):
+        upload._upload_artifact(_get_fake_api(api), _REFERENCE, "1234", "local", force=False, retries=2, backoff=0)
+    assert 3 == api.calls
+
+
+def test_upload_detects_skipped_artifacts():
+    api = _FakeApi(failures=0, output="Package is up to date, upload skipped\n")
+    assert "skipped" == upload._upload_artifact(_get_fake_api(api), _REFERENCE, "1234", "local", force=False,
+                                                retries=0, backoff=0)
+
+
+def test_deferred_uploader():
+    uploader = upload.DeferredUploader()
+    uploader.upload_packages(_REFERENCE, True, "1234")
+    uploader.upload_packages(_REFERENCE, True, "5678")
+    uploader.upload_packages(_REFERENCE, False, "9999")
+    assert [(_REFERENCE, None), (_REFERENCE, "1234"), (_REFERENCE, "5678")] == uploader.artifacts
+
+
+class _RecordingApi(object):
+    """ Records the concurrent uploads of each reference, the remote has everything already """
+    lock = threading.Lock()
+    active = {}
+    overlaps = []
+    authentications = []
+
+    def __init__(self, output, **kwargs):
+        self.output = output
+
+    def authenticate(self, user, password, remote_name):
+        self.authentications.append((user, password, remote_name, os.getenv("CONAN_PASSWORD")))
+
+    def upload(self, reference, package=None, **kwargs):
+        with self.lock:
+            self.active[reference] = self.active.get(reference, 0) + 1
+            self.overlaps.append(dict(self.active))
+        time.sleep(0.05)
+        with self.lock:
+            self.active[reference] -= 1
+        self.output.write(upload._PACKAGE_UP_TO_DATE if package else upload._RECIPE_UP_TO_DATE)
+
+
+def test_upload_serializes_packages_per_reference(monkeypatch, tmp_path):
+    monkeypatch.setattr(upload, "ConanAPIV1", _RecordingApi)
+    monkeypatch.delenv("CONAN_PASSWORD", raising=False)
+    artifacts = [(reference, package_id) for reference in ["foo/1.0", "bar/1.0"] for package_id in [None, "1", "2"]]
+    statistics = upload.upload_artifacts(str(tmp_path), artifacts, "local", workers=4, backoff=0,
+                                         credentials=("demo", "secret"))
+    assert 6 == statistics["skipped"]
+    # The credentials are never put into the environment of the process
+    assert [("demo", "secret", "local", None)] == _RecordingApi.authentications
+    assert all(count <= 1 for active in _RecordingApi.overlaps for count in active.values())
+    assert [active for active in _RecordingApi.overlaps if sum(active.values()) > 1]
+
+
+def test_upload_artifacts(client):
+    artifacts = upload.get_local_artifacts(client, _REFERENCE)
+    assert 4 == len(artifacts)
+    assert (_REFERENCE, None) == artifacts[0]
+
+    statistics = upload.upload_artifacts(client, artifacts, "local", workers=3, backoff=0)
+    assert 4 == statistics["artifacts"]
+    assert 4 == statistics["uploaded"]
+    assert statistics["size"] > 3 * 256 * 1024
+    api = ConanAPIV1(cache_folder=client)
+    packages = api.search_packages(_REFERENCE, remote_name="local")["results"][0]["items"][0]["packages"]
+    assert sorted(package_id for _, package_id in artifacts[1:]) == sorted(package["id"] for package in packages)
+
+    # Everything is on the remote already
+    statistics = upload.upload_artifacts(client, artifacts, "local", workers=3, backoff=0)
+    assert 0 == statistics["uploaded"]
+    assert 4 == statistics["skipped"]
+    assert 0 == statistics["size"]
+    assert "Uploaded 0 of 4 artifacts (4 already on the remote)" in upload.format_statistics(statistics)
+
+
+def test_upload_artifacts_fails_without_server(client, free_port, run_conan, monkeypatch):
+    monkeypatch.setattr(upload.time, "sleep", lambda _: None)
+    run_conan("conan remote add unreachable http://localhost:{}".format(free_port), os.path.dirname(client))
+    with pytest.raises(Exception):
+        upload.upload_artifacts(client, upload.get_local_artifacts(client, _REFERENCE, only_recipe=True),
+                                "unreachable", retries=1, backoff=0)
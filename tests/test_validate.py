@@ -0,0 +1,103 @@
+import os
+
+import pytest
+
+from bincrafters import cli
+from bincrafters import validate
+
+
+_CONANFILE = """from conans import ConanFile
+
+
+class FoobarConan(ConanFile):
+    name = "foobar"
+"""
+_CONANDATA = """sources:
+  "1.0":
+    url: "https://example.com/foobar-1.0.tar.gz"
+"""
+
+
+def _write(path: str, content: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+@pytest.fixture()
+def cci_recipes(tmp_path, monkeypatch):
+    """ A valid recipe foobar and a broken recipe broken in the layout of conan-center-index """
+    root = str(tmp_path)
+    _write(os.path.join(root, "recipes", "foobar", "config.yml"), 'versions:\n  "1.0":\n    folder: all\n')
+    _write(os.path.join(root, "recipes", "foobar", "all", "conanfile.py"), _CONANFILE)
+    _write(os.path.join(root, "recipes", "foobar", "all", "conandata.yml"), _CONANDATA)
+    _write(os.path.join(root, "recipes", "broken", "config.yml"),
+           'versions:\n  "1.0":\n    folder: all\n  "2.0":\n    folder: missing\n  "3.0":\n    folder: all\n'
+           '    build: sometimes\n')
+    _write(os.path.join(root, "recipes", "broken", "all", "conanfile.py"), _CONANFILE.replace("name", "nam e"))
+    _write(os.path.join(root, "recipes", "broken", "all", "conandata.yml"), _CONANDATA)
+    monkeypatch.chdir(root)
+    return root
+
+
+def test_validate_recipe(tmp_path):
+    recipe_path = os.path.join(str(tmp_path), "conanfile.py")
+    _write(recipe_path, _CONANFILE)
+    assert [] == validate.validate_recipe(recipe_path)
+
+    _write(recipe_path, _CONANFILE.replace('name = "foobar"', 'description = "No name"'))
+    assert ["{}: the recipe has no name".format(recipe_path)] == validate.validate_recipe(recipe_path)
+
+    _write(recipe_path, _CONANFILE + "    def build(self)\n        pass\n")
+    problems = validate.validate_recipe(recipe_path)
+    assert 1 == len(problems) and problems[0].startswith("{}:6: syntax error".format(recipe_path))
+
+
+def test_validate_conandata(tmp_path):
+    conandata_path = os.path.join(str(tmp_path), "conandata.yml")
+    _write(conandata_path, _CONANDATA)
+    assert [] == validate.validate_conandata(conandata_path, ["1.0"])
+    assert ["{}: no sources for version 2.0".format(conandata_path)] == \
+        validate.validate_conandata(conandata_path, ["1.0", "2.0"])
+
+    _write(conandata_path, "sources: [\n")
+    problems = validate.validate_conandata(conandata_path)
+    assert 1 == len(problems) and problems[0].startswith(conandata_path)
+
+
+def test_validate_repository_fixtures():
+    # The fixture recipe has the version 0.1.0, its conandata.yml only knows 1.0.0
+    conandata_path = os.path.join(os.path.dirname(__file__), "conandata.yml")
+    assert ["{}: no sources for version 0.1.0".format(conandata_path)] == \
+        validate.validate_recipe_directory(os.path.dirname(__file__))
+
+
+def test_validate_single_version_recipe(tmp_path):
+    path = str(tmp_path)
+    _write(os.path.join(path, "conanfile.py"), _CONANFILE + '    version = "1.0"\n')
+    _write(os.path.join(path, "conandata.yml"), _CONANDATA)
+    assert [] == validate.validate_recipe_directory(path)
+
+    _write(os.path.join(path, "conanfile.py"), _CONANFILE + '    version = "2.0"\n')
+    assert ["{}: no sources for version 2.0".format(os.path.join(path, "conandata.yml"))] == \
+        validate.validate_recipe_directory(path)
+
+
+def test_validate_cci(cci_recipes):
+    problems = validate.validate(workers=2)
+    assert [
+        "recipes/broken/config.yml: version 2.0 references the folder missing without a conanfile.py",
+        "recipes/broken/config.yml: version 3.0 has an unknown build value sometimes",
+        "recipes/broken/all/conandata.yml: no sources for version 3.0",
+    ] == [problem for problem in problems if "syntax error" not in problem]
+    assert 4 == len(problems)
+    # The message of syntax errors differs between Python versions
+    assert [problem for problem in problems if problem.startswith("recipes/broken/all/conanfile.py:5: syntax error")]
+
+
+def test_validate_cli(cci_recipes):
+    with pytest.raises(Exception, match="4 problem"):
+        cli.run(["validate"])
+    _write(os.path.join(cci_recipes, "recipes", "broken", "config.yml"), 'versions:\n  "1.0":\n    folder: all\n')
+    _write(os.path.join(cci_recipes, "recipes", "broken", "all", "conanfile.py"), _CONANFILE)
+    cli.run(["validate"])